@@ -52,4 +52,23 @@ sns.despine()
 # joint plot shows both correlation between two variables and variable data distribtuion
 sns.jointplot(boston_df.CRIM, boston_df.NOX, kind="hex")
 # Remove excess chart lines and ticks for a nicer looking plot
-sns.despine()
\ No newline at end of file
+sns.despine()
+
+# Distribution plots of large extracts
+# the raw-column plots above don't scale to fact_sales; plot_summary streams the data once into
+# fixed-size summaries (histograms, quantiles, KDE, 2-D counts, a reservoir sample) and draws from them
+from plot_summary import summarize, plot_hist, plot_box, plot_violin, plot_joint, plot_pairs
+
+summary = summarize('/tmp/fact_sales.parquet', ['sales_units', 'price_per_unit', 'acv_weighted_distribution'],
+                    pairs=[('price_per_unit', 'sales_units')])
+plot_hist(summary, 'sales_units', bins=128, kde=True)
+sns.despine()
+plot_box(summary, ['price_per_unit', 'acv_weighted_distribution'])
+sns.despine()
+plot_violin(summary, ['price_per_unit', 'acv_weighted_distribution'])
+sns.despine()
+plot_joint(summary, 'price_per_unit', 'sales_units')
+sns.despine()
+# PairGrid of the reservoir sample
+plot_pairs(summary)
+sns.despine()
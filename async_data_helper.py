@@ -0,0 +1,199 @@
+"""
+Asyncio flavour of :class:`DataHelper` for high fan-out services such as dashboards.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import asyncio
+import io
+import time
+
+import asyncpg
+import pandas as pd
+
+from data_helper import copy_null, read_connection_params, to_copy_buffer
+from query_builder import GSK_VENDORS, MARKET_CATEGORY_ALL_COLUMNS, SalesQuery, quote_ident
+
+
+def frame_from_records(records, columns) -> pd.DataFrame:
+    """Build a DataFrame from asyncpg records the way `pd.read_sql` does."""
+    return pd.DataFrame.from_records([tuple(r) for r in records], columns=columns, coerce_float=True)
+
+
+class AsyncDataHelper:
+    """
+    Asyncio data manager with the same surface as :class:`DataHelper`.
+
+    Queries run on an `asyncpg` pool, which prepares and caches statements on
+    each connection, so many dimension and fact lookups can be in flight at
+    once without tying up a thread each.
+
+    Parameters
+    ----------
+    json_path : str
+        Absolute path to a JSON file containing the connection parameters.
+    connection_params : dict
+        Same keys as for :class:`DataHelper`.
+    pool_min, pool_max : int
+        Bounds of the asyncpg connection pool.
+    idle_timeout : float
+        Seconds after which idle pooled connections are closed.
+
+    Examples
+    --------
+    >>> async def main():
+    ...     async with AsyncDataHelper(json_path=json_path) as adh:
+    ...         au, nz = await adh.gather(
+    ...             adh.load_market_category('AU', 'ORAL CARE', 'DENTURE CLEANSERS'),
+    ...             adh.load_market_category('NZ', 'ORAL CARE', 'DENTURE CLEANSERS'),
+    ...             timeout=30)
+    >>> asyncio.run(main())
+    """
+
+    def __init__(self,
+                 json_path: str = None,
+                 connection_params: dict = None,
+                 pool_min: int = 1,
+                 pool_max: int = 10,
+                 idle_timeout: float = 300.0):
+
+        self.schema, self.connection_params = read_connection_params(json_path, connection_params)
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.idle_timeout = idle_timeout
+        self.pool = None
+        self._opening = None
+
+    async def open(self):
+        """Create the connection pool. Called implicitly by ``async with``."""
+        if self.pool is None:
+            if self._opening is None:
+                self._opening = asyncio.Lock()
+            async with self._opening:
+                # concurrent first calls must not create two pools
+                if self.pool is None:
+                    params = dict(self.connection_params)
+                    params['database'] = params.pop('dbname')
+                    self.pool = await asyncpg.create_pool(
+                            min_size=self.pool_min,
+                            max_size=self.pool_max,
+                            max_inactive_connection_lifetime=self.idle_timeout,
+                            **params)
+        return self
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def query(self, query, params=(), timeout: float = None) -> pd.DataFrame:
+        """
+        Run `query` and return the result as a DataFrame.
+
+        `query` is SQL text with ``$1``-style `params`, or a
+        :class:`query_builder.SalesQuery`. The query is cancelled on the
+        server if it runs longer than `timeout` seconds.
+        """
+        if isinstance(query, SalesQuery):
+            query, params = query.render('numeric')
+        await self.open()
+        async with self.pool.acquire() as conn:
+            # fetch() goes through asyncpg's per-connection statement cache
+            records = await conn.fetch(query, *params, timeout=timeout)
+            if records:
+                return frame_from_records(records, records[0].keys())
+            stmt = await conn.prepare(query, timeout=timeout)
+            return frame_from_records(records, [a.name for a in stmt.get_attributes()])
+
+    async def gather(self, *aws, timeout: float = None) -> list:
+        """
+        Await many queries concurrently, in order.
+
+        If `timeout` expires, every query still running is cancelled and
+        `asyncio.TimeoutError` is raised.
+        """
+        return await asyncio.wait_for(asyncio.gather(*aws), timeout)
+
+    def load_pg(self, table_name, timeout: float = None):
+        return self.query(f"select * from {table_name}", timeout=timeout)
+
+    async def sql_execute(self, query, *args, timeout: float = None):
+        await self.open()
+        async with self.pool.acquire() as conn:
+            await conn.execute(query, *args, timeout=timeout)
+
+    async def truncate_table(self, table_name: str, schema: str):
+        await self.sql_execute(f"TRUNCATE TABLE {quote_ident(schema)}.{quote_ident(table_name)}")
+
+    async def write_pg(self,
+                       table_name: str,
+                       df: pd.DataFrame,
+                       on_conflict='DO NOTHING',
+                       schema=None,
+                       batch_size: int = 100_000) -> dict:
+        """Insert values into Postgres subject to named constraint, see :meth:`DataHelper.write_pg`."""
+
+        if schema is None:
+            raise ValueError("Schema must be provided.")
+
+        # quoted like asyncpg's copy_to_table does, so names match exactly
+        columns = ', '.join(quote_ident(c) for c in df.columns)
+        target = f"{quote_ident(schema)}.{quote_ident(table_name)}"
+        staging = quote_ident(f"stage_{table_name}")
+
+        start = time.perf_counter()
+        await self.open()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(f"""
+                    CREATE TEMP TABLE {staging}
+                    (LIKE {target} INCLUDING DEFAULTS)
+                    ON COMMIT DROP
+                """)
+                for lo in range(0, len(df), batch_size):
+                    batch = df.iloc[lo:lo + batch_size]
+                    null = copy_null(batch)
+                    buf = io.BytesIO(to_copy_buffer(batch, null).getvalue().encode('utf-8'))
+                    await conn.copy_to_table(f"stage_{table_name}", source=buf, columns=list(df.columns),
+                                             format='csv', null=null)
+                status = await conn.execute(f"""
+                    INSERT INTO {target} ({columns})
+                    SELECT {columns} FROM {staging} ON CONFLICT {on_conflict}
+                """)
+                await conn.execute(f"DROP TABLE {staging}")
+        seconds = time.perf_counter() - start
+
+        return {'rows': len(df),
+                'inserted': int(status.split()[-1]),
+                'seconds': seconds,
+                'rows_per_sec': len(df) / seconds if seconds else float('inf')}
+
+    def load_market_category(self, market=None, category=None, sub_category=None,
+                             only_active=False, timeout: float = None, **filters):
+        """
+        Load the sales data for a market/category combination.
+
+        Takes the same filters as :meth:`DataHelper.load_market_category`.
+        """
+        return self.query(SalesQuery(self.schema,
+                                     markets=market,
+                                     categories=category,
+                                     sub_categories=sub_category,
+                                     only_active=only_active,
+                                     **filters),
+                          timeout=timeout)
+
+    def load_market_category_all(self, timeout: float = None, **filters):
+        return self.query(SalesQuery(self.schema,
+                                     vendors=GSK_VENDORS,
+                                     hier_geography=True,
+                                     select=MARKET_CATEGORY_ALL_COLUMNS,
+                                     **filters),
+                          timeout=timeout)
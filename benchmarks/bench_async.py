@@ -0,0 +1,82 @@
+"""
+Throughput of `AsyncDataHelper` against `DataHelper` under concurrent requests.
+
+The sync helper serves each batch from a thread pool as wide as the batch,
+the way a threaded dashboard backend would; the async helper issues the
+whole batch with `asyncio.gather`. Both share the same connection pool size::
+
+    python -m benchmarks.bench_async --json-path $GSK_HOME/connection.json \
+        --concurrency 50 100 250 500 --pool-max 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LOOKUP = "select distinct retailer_name from {schema}.dim_geography where market_name = '{market}'"
+
+
+def run_sync(dh, queries):
+    latencies = []
+
+    def one(q):
+        start = time.perf_counter()
+        dh.query(q)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        list(executor.map(one, queries))
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(adh, queries):
+    latencies = []
+
+    async def one(q):
+        start = time.perf_counter()
+        await adh.query(q)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await adh.gather(*[one(q) for q in queries])
+    return time.perf_counter() - start, latencies
+
+
+def report(label, n, elapsed, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{label:<6}{n:>8}{n / elapsed:>12,.0f}{statistics.median(latencies) * 1000:>10.1f}{p95 * 1000:>10.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json-path', required=True)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 100, 250, 500])
+    parser.add_argument('--pool-max', type=int, default=20)
+    parser.add_argument('--markets', nargs='+', default=['AU', 'UK', 'US'])
+    args = parser.parse_args()
+
+    from async_data_helper import AsyncDataHelper
+    from data_helper import DataHelper
+
+    dh = DataHelper(json_path=args.json_path, pool_max=args.pool_max)
+    adh = await AsyncDataHelper(json_path=args.json_path, pool_max=args.pool_max).open()
+
+    print(f"{'':<6}{'requests':>8}{'req/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for n in args.concurrency:
+        queries = [LOOKUP.format(schema=dh.schema, market=args.markets[i % len(args.markets)]) for i in range(n)]
+        # warm both pools so connection set-up isn't timed
+        run_sync(dh, queries[:args.pool_max])
+        await run_async(adh, queries[:args.pool_max])
+
+        report('sync', n, *run_sync(dh, queries))
+        report('async', n, *await run_async(adh, queries))
+
+    await adh.close()
+    dh.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
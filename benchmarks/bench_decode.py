@@ -0,0 +1,77 @@
+"""
+Compare `pd.read_sql` with the COPY-based columnar decoder.
+
+Each decoder runs in its own interpreter so that peak RSS reflects only that
+decoder's transient memory::
+
+    python -m benchmarks.bench_decode --json-path $GSK_HOME/connection.json \
+        --market AU --category 'ORAL CARE' --sub-category 'DENTURE CLEANSERS'
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+DECODERS = ('read_sql', 'copy')
+
+
+def run_one(args):
+    from data_helper import DataHelper
+
+    dh = DataHelper(json_path=args.json_path)
+    query = (dh.query_string_all() if args.market is None
+             else dh.query_string(args.market, args.category, args.sub_category))
+    dh.query('select 1')  # open the pooled connection outside the timed region
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        df = dh.query(query, decoder=args.decoder)
+        timings.append(time.perf_counter() - start)
+        rows = len(df)
+        del df
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        'decoder': args.decoder,
+        'rows': rows,
+        'best_seconds': min(timings),
+        'mean_seconds': sum(timings) / len(timings),
+        'rows_per_sec': rows / min(timings),
+        'peak_rss_growth_mb': (rss_after - rss_before) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json-path', required=True)
+    parser.add_argument('--market')
+    parser.add_argument('--category')
+    parser.add_argument('--sub-category')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--decoder', choices=DECODERS, help='run a single decoder in this process')
+    args = parser.parse_args()
+
+    if args.decoder is not None:
+        run_one(args)
+        return
+
+    results = []
+    for decoder in DECODERS:
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_decode', *sys.argv[1:], '--decoder', decoder],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.splitlines()[-1]))
+
+    print(f"{'decoder':<10}{'rows':>10}{'best s':>10}{'rows/s':>14}{'peak RSS +MB':>14}")
+    for r in results:
+        print(f"{r['decoder']:<10}{r['rows']:>10}{r['best_seconds']:>10.3f}"
+              f"{r['rows_per_sec']:>14,.0f}{r['peak_rss_growth_mb']:>14.1f}")
+    base, fast = results
+    print(f"speedup: {base['best_seconds'] / fast['best_seconds']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
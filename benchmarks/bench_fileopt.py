@@ -0,0 +1,78 @@
+"""
+`FileOpt` lookups on a synthetic directory of many files.
+
+Compares the previous listdir + fnmatch + getctime implementation with the
+scandir implementation, cold and with the directory catalog warm::
+
+    python -m benchmarks.bench_fileopt --files 100000
+"""
+import argparse
+import fnmatch
+import os
+import tempfile
+import time
+
+
+def legacy_find_latest_file(path, prefix='', suffix=''):
+    """The listdir/fnmatch/getctime lookup FileOpt used before."""
+    matched = [i for i in os.listdir(path) if fnmatch.fnmatch(i, prefix + '*' + suffix)]
+    return os.path.basename(max([path + '/' + i for i in matched], key=lambda x: os.path.getctime(x)))
+
+
+def make_tree(root, n):
+    for i in range(n):
+        suffix = '.csv' if i % 4 else '.json'
+        open(os.path.join(root, f"sales_{i:07d}{suffix}"), 'w').close()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dir', help='existing directory to use instead of a synthetic one')
+    args = parser.parse_args()
+
+    from file_operation import FileOpt
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.dir or tmp
+        if args.dir is None:
+            make_tree(root, args.files)
+
+        scan = FileOpt(root)
+        catalog = FileOpt(root, use_catalog=True)
+        cold_start = time.perf_counter()
+        catalog.find_latest_file(prefix='sales_', suffix='.csv', filename_only=True)
+        cold = time.perf_counter() - cold_start
+
+        cases = [
+            ('legacy find_latest_file', lambda: legacy_find_latest_file(root, 'sales_', '.csv')),
+            ('scandir find_latest_file', lambda: scan.find_latest_file(prefix='sales_', suffix='.csv',
+                                                                       filename_only=True)),
+            ('catalog find_latest_file', lambda: catalog.find_latest_file(prefix='sales_', suffix='.csv',
+                                                                          filename_only=True)),
+            ('scandir find_files_by_wildcard', lambda: len(scan.find_files_by_wildcard(suffix='.json'))),
+            ('catalog find_files_by_wildcard', lambda: len(catalog.find_files_by_wildcard(suffix='.json'))),
+        ]
+        print(f"{len(os.listdir(root)):,} entries in {root}")
+        print(f"{'catalog build (cold)':<34}{cold * 1000:>10.1f} ms")
+        results = set()
+        for label, fn in cases:
+            seconds, result = best_of(fn, args.repeat)
+            if 'find_latest_file' in label:
+                results.add(result)
+            print(f"{label:<34}{seconds * 1000:>10.1f} ms")
+        assert len(results) == 1, results
+
+
+if __name__ == '__main__':
+    main()
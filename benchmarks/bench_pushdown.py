@@ -0,0 +1,74 @@
+"""
+Measure what projection and predicate pushdown save on a market/category load.
+
+Bytes are those of the result exported with ``COPY ... TO STDOUT`` (CSV),
+which tracks what the server ships; latency is the best of `--repeat` runs of
+`DataHelper.load_market_category`::
+
+    python -m benchmarks.bench_pushdown --json-path $GSK_HOME/connection.json \
+        --market AU --category 'ORAL CARE' --sub-category 'DENTURE CLEANSERS' \
+        --columns brand_name retailer_name nrf_calendar_date sales_units \
+        --start-date 2020-01-01 --end-date 2020-06-30
+"""
+import argparse
+import datetime
+import time
+
+
+class ByteCounter:
+    """Writable sink that only counts what `copy_expert` sends it."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+
+def measure(dh, repeat, **kwargs):
+    query = dh.query_string(kwargs['market'], kwargs['category'], kwargs['sub_category'], False,
+                            **{k: v for k, v in kwargs.items()
+                               if k not in ('market', 'category', 'sub_category')})
+    with dh.connection() as conn:
+        with conn.cursor() as cur:
+            sink = ByteCounter()
+            cur.copy_expert(f"COPY ({query.literal(cur)}) TO STDOUT WITH (FORMAT csv)", sink)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = dh.load_market_category(**kwargs)
+        timings.append(time.perf_counter() - start)
+    return {'rows': len(df), 'columns': df.shape[1], 'bytes': sink.bytes, 'best_seconds': min(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json-path', required=True)
+    parser.add_argument('--market', required=True)
+    parser.add_argument('--category', required=True)
+    parser.add_argument('--sub-category', required=True)
+    parser.add_argument('--columns', nargs='+', required=True)
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat)
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat)
+    parser.add_argument('--retailers', nargs='+')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from data_helper import DataHelper
+
+    dh = DataHelper(json_path=args.json_path)
+    segment = dict(market=args.market, category=args.category, sub_category=args.sub_category)
+    before = measure(dh, args.repeat, **segment)
+    after = measure(dh, args.repeat, columns=args.columns, start_date=args.start_date,
+                    end_date=args.end_date, retailers=args.retailers, **segment)
+
+    print(f"{'':<8}{'rows':>10}{'cols':>6}{'bytes':>14}{'best s':>10}")
+    for label, r in (('before', before), ('after', after)):
+        print(f"{label:<8}{r['rows']:>10}{r['columns']:>6}{r['bytes']:>14,}{r['best_seconds']:>10.4f}")
+    print(f"bytes: {before['bytes'] / after['bytes']:.1f}x less, "
+          f"latency: {before['best_seconds'] / after['best_seconds']:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+`spark_arrow` conversions against the row-wise paths they replace, on a
+local-mode Spark session (needs pyspark and a JVM)::
+
+    python -m benchmarks.bench_spark_arrow --rows 2000000
+
+Cases:
+
+* pandas -> Spark: ``createDataFrame`` with an all-``StringType`` schema
+  and Arrow off, then a cast (pyspark.py's ``walmart_sdf``), against
+  :func:`spark_arrow.to_spark` with the type declared.
+* list -> Spark: ``convert_list_dic`` + ``createDataFrame`` (the
+  create_spark_dataframe script), against ``to_spark`` on the list.
+* Spark -> pandas: ``toPandas`` with Arrow off, against
+  :func:`spark_arrow.to_pandas`.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import local_spark
+
+
+def make_items(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    # as read from the Walmart Excel export: every column is text
+    return pd.DataFrame({
+        'Dim_WmItemNbr': rng.integers(1, 10 ** 9, rows).astype(str),
+        'ProductName': rng.choice(['DENTURE CLEANSER', 'TOOTHPASTE', 'MOUTHWASH'], rows),
+        'Brand': rng.choice(['POLIDENT', 'SENSODYNE', 'PARODONTAX'], rows),
+        'Store': rng.integers(1, 5000, rows).astype(str),
+        'Units': rng.integers(0, 100, rows).astype(str),
+    })
+
+
+def convert_list_dic(lst: list, key: str):
+    return [{key: v} for v in lst]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    spark = local_spark('bench_spark_arrow', {'spark.driver.memory': '4g'})
+    import pyspark.sql.types as st
+
+    from spark_arrow import ARROW_CONF, to_pandas, to_spark
+
+    items = make_items(args.rows)
+    print(f"{args.rows:,} rows")
+
+    def legacy_pandas():
+        spark.conf.set(ARROW_CONF, 'false')
+        schema = st.StructType([st.StructField(c, st.StringType(), True) for c in items.columns])
+        sdf = spark.createDataFrame(items, schema=schema)
+        return sdf.withColumn('upc', sdf['Dim_WmItemNbr'].cast(st.IntegerType())).count()
+
+    def arrow_pandas():
+        sdf = to_spark(spark, items, schema={'Dim_WmItemNbr': 'int64', 'Store': 'int32', 'Units': 'int32'},
+                       chunk_rows=args.chunk_rows)
+        return sdf.count()
+
+    values = items['Dim_WmItemNbr'].tolist()
+    cases = [
+        ('pandas: strings + cast (rows)', legacy_pandas),
+        ('pandas: to_spark (arrow)', arrow_pandas),
+        ('list: convert_list_dic (rows)',
+         lambda: spark.createDataFrame(convert_list_dic(values, 'class_id')).count()),
+        ('list: to_spark (arrow)',
+         lambda: to_spark(spark, values, columns=['class_id'], chunk_rows=args.chunk_rows).count()),
+    ]
+    for label, fn in cases:
+        seconds, rows = timed(fn)
+        print(f"{label:<34}{seconds:>9.2f} s {rows:>12,} rows")
+
+    sdf = to_spark(spark, items).cache()
+    sdf.count()
+    spark.conf.set(ARROW_CONF, 'false')
+    seconds, df = timed(sdf.toPandas)
+    print(f"{'spark -> pandas: toPandas (rows)':<34}{seconds:>9.2f} s {len(df):>12,} rows")
+    seconds, df = timed(lambda: to_pandas(sdf))
+    print(f"{'spark -> pandas: to_pandas (arrow)':<34}{seconds:>9.2f} s {len(df):>12,} rows")
+    spark.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+`top_k.top_k_per_group` against the sort + window rank it replaces.
+
+The baseline is the pyspark.py notebook step: a global sort of the counts
+followed by ``rank()`` over ``Window.partitionBy('Product_Name')`` and a
+filter on ``rank == 1``::
+
+    python -m benchmarks.bench_topk --rows 10000000
+    python -m benchmarks.bench_topk --rows 10000000 --spark   # needs pyspark and a JVM
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import local_spark
+from top_k import top_k_per_group
+
+
+def make_counts(rows, groups, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Product_Name': rng.integers(0, groups, rows).astype('int64'),
+        'TCIN': rng.integers(0, 10 * groups, rows).astype('int64'),
+        'count': rng.integers(1, 50, rows).astype('int64'),
+    })
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def pandas_window(df):
+    ordered = df.sort_values(['Product_Name', 'count', 'TCIN'], ascending=[True, False, True])
+    rank = ordered.groupby('Product_Name')['count'].rank(method='min', ascending=False)
+    return ordered[rank == 1]
+
+
+def spark_window(sdf):
+    from pyspark.sql import functions as F
+    from pyspark.sql.window import Window
+
+    window = Window.partitionBy('Product_Name').orderBy(F.desc('count'))
+    return (sdf.sort('Product_Name', F.desc('count'), 'TCIN')
+            .withColumn('rank', F.rank().over(window))
+            .filter(F.col('rank') == 1).drop('rank'))
+
+
+def run_spark(df):
+    spark = local_spark('bench_topk')
+    sdf = spark.createDataFrame(df).cache()
+    sdf.count()
+    cases = [
+        ('spark sort + window rank', lambda: spark_window(sdf).count()),
+        ('spark top_k ties=all', lambda: top_k_per_group(sdf, 'Product_Name', 'count', ties='all').count()),
+        ('spark top_k k=1 (max struct)', lambda: top_k_per_group(sdf, 'Product_Name', 'count').count()),
+    ]
+    for label, fn in cases:
+        seconds, rows = timed(fn)
+        print(f"{label:<32}{seconds:>9.2f} s {rows:>10,} rows")
+    spark.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--groups', type=int, default=100_000)
+    parser.add_argument('--spark', action='store_true')
+    args = parser.parse_args()
+
+    df = make_counts(args.rows, args.groups)
+    print(f"{args.rows:,} rows, {args.groups:,} groups")
+
+    seconds, expected = timed(lambda: pandas_window(df))
+    print(f"{'pandas sort + window rank':<32}{seconds:>9.2f} s {len(expected):>10,} rows")
+    seconds, got = timed(lambda: top_k_per_group(df, 'Product_Name', 'count', ties='all'))
+    print(f"{'pandas top_k ties=all':<32}{seconds:>9.2f} s {len(got):>10,} rows")
+    assert got.sort_index().equals(expected.sort_index())
+    seconds, got = timed(lambda: top_k_per_group(df, 'Product_Name', 'count'))
+    print(f"{'pandas top_k k=1 (idxmax)':<32}{seconds:>9.2f} s {len(got):>10,} rows")
+    assert got['Product_Name'].is_unique
+
+    if args.spark:
+        run_spark(df)
+
+
+if __name__ == '__main__':
+    main()
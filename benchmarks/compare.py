@@ -0,0 +1,48 @@
+"""
+Compare two result files of :mod:`benchmarks.run` and flag regressions::
+
+    python -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<head>.json
+
+Exits with status 1 when a case got worse than `--threshold` on its median
+or 90th percentile latency, throughput or peak RSS, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.harness import compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change counted as a regression (default 0.10)')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    if base.get('scale') != head.get('scale'):
+        print("warning: the runs used different scales, no regressions are flagged")
+    print(f"base {(base.get('commit') or '?')[:12]}  head {(head.get('commit') or '?')[:12]}")
+
+    rows = compare(base, head, args.threshold)
+    print(f"{'case':<22}{'metric':<14}{'base':>12}{'head':>12}{'change':>9}")
+    for r in rows:
+        base_value = '-' if r['base'] is None else f"{r['base']:.4g}"
+        head_value = '-' if r['head'] is None else f"{r['head']:.4g}"
+        change = '' if r['change'] is None else f"{r['change']:+.1%}"
+        flag = '  REGRESSION' if r['regression'] else ''
+        print(f"{r['case']:<22}{r['metric']:<14}{base_value:>12}{head_value:>12}{change:>9}{flag}")
+
+    regressions = [r for r in rows if r['regression']]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
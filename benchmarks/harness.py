@@ -0,0 +1,209 @@
+"""
+Timing, memory and result bookkeeping for :mod:`benchmarks.run`.
+
+A case is timed over several repetitions after a warm-up. Its result gives
+the latency distribution, throughput in the case's own units (rows, files,
+series) per second at the median latency, and the peak RSS of the process.
+Results are stored as JSON together with the commit they were measured on,
+and two result files can be compared with :func:`compare`.
+"""
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+# (metric, whether higher is better) compared by `compare`
+COMPARED = (('p50_seconds', False), ('p90_seconds', False), ('throughput', True), ('peak_rss_mb', False))
+
+
+def import_pyspark():
+    """
+    Import the installed pyspark package rather than the repository's pyspark.py.
+
+    Benchmarks run from the repository root, which is on ``sys.path`` ahead of
+    site-packages, so a plain ``import pyspark`` finds the notebook script.
+    Importing once without the root puts the package in ``sys.modules``, where
+    the later ``pyspark`` imports of the benchmarked modules find it.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = sys.path[:]
+    sys.path[:] = [p for p in path if os.path.abspath(p or os.curdir) != root]
+    try:
+        import pyspark
+    finally:
+        sys.path[:] = path
+    return pyspark
+
+
+def local_spark(app_name: str, conf: dict = None):
+    """
+    Local-mode SparkSession whose JVM runs outside the repository root.
+
+    Spark starts its Python workers with ``python -m pyspark.daemon`` in the
+    JVM's working directory, which would again put pyspark.py first on their
+    path, so the session is created from the temp directory instead.
+    """
+    import_pyspark()
+    from pyspark.sql import SparkSession
+
+    builder = SparkSession.builder.master('local[*]').appName(app_name)
+    for key, value in (conf or {}).items():
+        builder = builder.config(key, value)
+    cwd = os.getcwd()
+    os.chdir(tempfile.gettempdir())
+    try:
+        return builder.getOrCreate()
+    finally:
+        os.chdir(cwd)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+class Case:
+    """
+    One benchmarked hot path.
+
+    Parameters
+    ----------
+    name : str
+        Unique name, the key in the results.
+    fn : callable
+        ``fn(ctx)`` running the path once and returning how many units it
+        processed, e.g. rows read.
+    units : str
+        What `fn` counts, for the report.
+    repeat : int
+        Timed repetitions.
+    warmup : int
+        Untimed runs first, e.g. to open pooled connections or warm a cache.
+    setup : callable
+        ``setup(ctx)`` run untimed before every repetition.
+    """
+
+    def __init__(self, name, fn, units='rows', repeat=5, warmup=1, setup=None):
+        self.name = name
+        self.fn = fn
+        self.units = units
+        self.repeat = repeat
+        self.warmup = warmup
+        self.setup = setup
+
+
+def measure(case: Case, ctx: dict, repeat: int = None) -> dict:
+    """Run `case` in this process and return its statistics."""
+    baseline = peak_rss_mb()
+    for _ in range(case.warmup):
+        if case.setup is not None:
+            case.setup(ctx)
+        case.fn(ctx)
+    seconds, units = [], None
+    for _ in range(repeat or case.repeat):
+        if case.setup is not None:
+            case.setup(ctx)
+        start = time.perf_counter()
+        units = case.fn(ctx)
+        seconds.append(time.perf_counter() - start)
+    seconds = np.array(seconds)
+    p50 = float(np.percentile(seconds, 50))
+    return {'units': case.units,
+            'count': units,
+            'repeat': len(seconds),
+            'min_seconds': float(seconds.min()),
+            'mean_seconds': float(seconds.mean()),
+            **{f"p{p}_seconds": float(np.percentile(seconds, p)) for p in PERCENTILES},
+            'max_seconds': float(seconds.max()),
+            'throughput': units / p50 if units and p50 else None,
+            'baseline_rss_mb': baseline,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def measure_isolated(module: str, name: str, context_path: str, repeat: int = None) -> dict:
+    """
+    Run case `name` of `module` in a fresh interpreter, so its peak RSS is its own.
+
+    The module must handle ``--child NAME --context PATH [--repeat N]`` by
+    printing the result of :func:`measure` as JSON on its last line.
+    """
+    cmd = [sys.executable, '-m', module, '--child', name, '--context', context_path]
+    if repeat:
+        cmd += ['--repeat', str(repeat)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def revision() -> dict:
+    """Commit, branch and whether the work tree has uncommitted changes."""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], check=True, capture_output=True, text=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {'commit': git('rev-parse', 'HEAD'),
+            'branch': git('rev-parse', '--abbrev-ref', 'HEAD'),
+            'dirty': bool(status) if status is not None else None}
+
+
+def environment() -> dict:
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def write_results(path: str, cases: dict, scale: dict) -> dict:
+    """Write `cases` results with the revision and environment to `path`."""
+    results = {**revision(),
+               'created': datetime.datetime.now().isoformat(timespec='seconds'),
+               'environment': environment(),
+               'scale': scale,
+               'cases': cases}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def compare(base: dict, head: dict, threshold: float = 0.10) -> list:
+    """
+    Metric changes per case between two result files (as loaded dicts).
+
+    A change is a regression when it's worse than `threshold` (a fraction):
+    slower latencies or RSS, or lower throughput. Cases present in only one
+    file, or with different scales, are reported without a verdict.
+
+    Returns
+    -------
+    list of dict
+        ``{'case', 'metric', 'base', 'head', 'change', 'regression'}`` with
+        `change` the relative change, positive when `head` is worse.
+    """
+    rows = []
+    same_scale = base.get('scale') == head.get('scale')
+    for name in sorted(set(base['cases']) | set(head['cases'])):
+        old, new = base['cases'].get(name), head['cases'].get(name)
+        for metric, higher_is_better in COMPARED:
+            a = old.get(metric) if old else None
+            b = new.get(metric) if new else None
+            change = regression = None
+            if a and b:
+                change = (a - b) / a if higher_is_better else (b - a) / a
+                regression = bool(same_scale and change > threshold)
+            rows.append({'case': name, 'metric': metric, 'base': a, 'head': b,
+                         'change': change, 'regression': regression})
+    return rows
@@ -0,0 +1,256 @@
+"""
+Benchmark the hot paths on synthetic data and store the results as JSON.
+
+Generates a star schema in a throwaway Postgres cluster (or in a throwaway
+schema of an existing server with `--json-path`), a file tree, weekly sales
+series and an Excel workbook at the chosen scale. Then every case runs in its
+own interpreter, so the peak RSS reported is that case's::
+
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale medium --json-path $GSK_HOME/connection.json
+    python -m benchmarks.run --case dh_load_copy --case seasonal_decompose --repeat 10
+
+Results go to ``benchmarks/results/<commit>.json`` by default; compare two
+runs with ``python -m benchmarks.compare``.
+
+Cases:
+
+* ``dh_*``: `DataHelper` loads with each decoder, streamed and split
+  extracts, a small lookup's latency and `write_pg`.
+* ``fileopt_*``: `FileOpt.find_latest_file` on a large folder and
+  `find_files_recursive` over the tree.
+* ``seasonal_*``: `seasonal.decompose_frame`, the per-series statsmodels loop
+  of deseaonalize_ts.py on a subset, and `OnlineDeseasonalizer`.
+* ``excel_*``: `excel_report.write_workbook`, `pd.read_excel` as in
+  excel_related.py, and `ExcelCache` when warm.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from contextlib import ExitStack
+
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.harness import Case, measure, measure_isolated, revision, write_results
+
+STATSMODELS_SERIES = 200
+_state = {}
+
+
+def _cached(key, load):
+    if key not in _state:
+        _state[key] = load()
+    return _state[key]
+
+
+def _dh(ctx):
+    from data_helper import DataHelper
+
+    return _cached('dh', lambda: DataHelper(connection_params=dict(ctx['connection_params'],
+                                                                   schema=ctx['schema']),
+                                            cache_dir=os.path.join(ctx['workdir'], 'cache')))
+
+
+def _series(ctx):
+    return _cached('series', lambda: pd.read_parquet(ctx['series_path']))
+
+
+def _frame(ctx):
+    return _cached('frame', lambda: pd.read_parquet(ctx['frame_path']))
+
+
+def dh_load_read_sql(ctx):
+    return len(_dh(ctx).load_market_category(ctx['market'], 'ORAL CARE'))
+
+
+def dh_load_copy(ctx):
+    return len(_dh(ctx).load_market_category(ctx['market'], 'ORAL CARE', decoder='copy'))
+
+
+def dh_load_all_stream(ctx):
+    return sum(len(df) for df in _dh(ctx).load_market_category_all(chunksize=100_000))
+
+
+def dh_load_all_split(ctx):
+    return len(_dh(ctx).load_market_category_all(split_by='market', max_workers=4, decoder='copy'))
+
+
+def dh_lookup(ctx):
+    _dh(ctx).query(f"select distinct retailer_name from {ctx['schema']}.dim_geography where market_name = %s",
+                   params=(ctx['market'],))
+    return 1
+
+
+def dh_write_pg_setup(ctx):
+    _dh(ctx).truncate_table('margin', schema=ctx['schema'])
+
+
+def dh_write_pg(ctx):
+    df = _cached('margin', lambda: _frame(ctx)[['product_id', 'geography_id', 'time_id', 'margin']])
+    return _dh(ctx).write_pg('margin', df, schema=ctx['schema'])['rows']
+
+
+def fileopt_latest(ctx):
+    from file_operation import FileOpt
+
+    FileOpt(ctx['flat_dir']).find_latest_file(prefix='sales_', suffix='.csv', filename_only=True)
+    return ctx['flat_files']
+
+
+def fileopt_recursive(ctx):
+    from file_operation import FileOpt
+
+    return len(FileOpt(ctx['tree_root']).find_files_recursive(suffix='.csv'))
+
+
+def seasonal_decompose(ctx):
+    from seasonal import decompose_frame
+
+    decompose_frame(_series(ctx), by=['product_id', 'geography_id'], fill_value=0)
+    return ctx['series']
+
+
+def seasonal_statsmodels(ctx):
+    from statsmodels.tsa.seasonal import seasonal_decompose
+
+    def subset():
+        df = _series(ctx)
+        keys = df[['product_id', 'geography_id']].drop_duplicates().head(STATSMODELS_SERIES)
+        dates = pd.date_range(df['nrf_calendar_date'].min(), df['nrf_calendar_date'].max(), freq='7D')
+        df = df.merge(keys).set_index('nrf_calendar_date')
+        return [g['sales_units'].reindex(dates, fill_value=0)
+                for _, g in df.groupby(['product_id', 'geography_id'])]
+    deseasonalized = [s - seasonal_decompose(s, model='additive', period=52).seasonal
+                      for s in _cached('subset', subset)]
+    return len(deseasonalized)
+
+
+def seasonal_online(ctx):
+    from seasonal import OnlineDeseasonalizer
+
+    OnlineDeseasonalizer(period=52).update_frame(_series(ctx), by=['product_id', 'geography_id'])
+    return ctx['series']
+
+
+def excel_write(ctx):
+    from excel_report import write_workbook
+
+    write_workbook(os.path.join(ctx['workdir'], 'write.xlsx'), {'sales': _frame(ctx)})
+    return ctx['excel_rows']
+
+
+def excel_read(ctx):
+    return len(pd.read_excel(ctx['excel_path']))
+
+
+def excel_read_cached(ctx):
+    from excel_cache import ExcelCache
+
+    return len(ExcelCache(os.path.join(ctx['workdir'], 'excel_cache')).read_excel(ctx['excel_path']))
+
+
+CASES = {c.name: c for c in [
+    Case('dh_load_read_sql', dh_load_read_sql),
+    Case('dh_load_copy', dh_load_copy),
+    Case('dh_load_all_stream', dh_load_all_stream, repeat=3),
+    Case('dh_load_all_split', dh_load_all_split, repeat=3),
+    Case('dh_lookup', dh_lookup, units='queries', repeat=200, warmup=5),
+    Case('dh_write_pg', dh_write_pg, repeat=3, setup=dh_write_pg_setup),
+    Case('fileopt_latest', fileopt_latest, units='files'),
+    Case('fileopt_recursive', fileopt_recursive, units='files'),
+    Case('seasonal_decompose', seasonal_decompose, units='series', repeat=3),
+    Case('seasonal_statsmodels', seasonal_statsmodels, units='series', repeat=3),
+    Case('seasonal_online', seasonal_online, units='series', repeat=3),
+    Case('excel_write', excel_write, repeat=3),
+    Case('excel_read', excel_read, repeat=3, warmup=0),
+    Case('excel_read_cached', excel_read_cached),
+]}
+
+
+def prepare(stack, workdir, scale, args, cases):
+    """Generate the data `cases` need under `workdir` and return the context."""
+    from excel_report import write_workbook
+
+    ctx = dict(workdir=workdir, scale=scale, market=synthetic.MARKETS[0], series=scale['series'],
+               excel_rows=scale['excel_rows'])
+    if any(c.startswith('dh_') for c in cases):
+        if args.json_path:
+            from data_helper import read_connection_params
+            _, params = read_connection_params(args.json_path)
+            schema = stack.enter_context(synthetic.throwaway_schema(params))
+        else:
+            params = stack.enter_context(synthetic.throwaway_postgres(args.pg_bin))
+            schema = 'bench'
+        counts = synthetic.populate_star(params, schema, **scale)
+        print(f"star schema {schema}: {counts}", file=sys.stderr)
+        ctx.update(connection_params=params, schema=schema)
+    if any(c.startswith('fileopt_') for c in cases):
+        ctx['tree_root'] = os.path.join(workdir, 'tree')
+        ctx['flat_dir'] = synthetic.make_file_tree(ctx['tree_root'], scale['files'])
+        ctx['flat_files'] = len(os.listdir(ctx['flat_dir']))
+    if any(c.startswith('seasonal_') for c in cases):
+        ctx['series_path'] = os.path.join(workdir, 'series.parquet')
+        synthetic.make_series(scale['series'], weeks=scale['weeks']).to_parquet(ctx['series_path'])
+    if any(c.startswith(('excel_', 'dh_write')) for c in cases):
+        ctx['frame_path'] = os.path.join(workdir, 'frame.parquet')
+        frame = synthetic.make_sales_frame(scale['excel_rows'])
+        frame.to_parquet(ctx['frame_path'])
+        ctx['excel_path'] = os.path.join(workdir, 'read.xlsx')
+        write_workbook(ctx['excel_path'], {'sales': frame})
+    return ctx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(synthetic.SCALES), default='small')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='run only these cases')
+    parser.add_argument('--skip-db', action='store_true', help='skip the DataHelper cases')
+    parser.add_argument('--json-path', help='existing server to create a throwaway schema on')
+    parser.add_argument('--pg-bin', help='directory of initdb and pg_ctl for the throwaway cluster')
+    parser.add_argument('--repeat', type=int, help='override the repetitions of every case')
+    parser.add_argument('--out', help='results file, by default benchmarks/results/<commit>.json')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--context', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.context) as f:
+            ctx = json.load(f)
+        print(json.dumps(measure(CASES[args.child], ctx, args.repeat)))
+        return
+
+    cases = args.case or [c for c in CASES if not (args.skip_db and c.startswith('dh_'))]
+    scale = synthetic.SCALES[args.scale]
+    out = args.out
+    if out is None:
+        rev = revision()
+        name = (rev['commit'] or 'unknown')[:12] + ('-dirty' if rev['dirty'] else '')
+        out = os.path.join(os.path.dirname(__file__), 'results', f"{name}.json")
+
+    results = {}
+    with ExitStack() as stack:
+        workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='gsk_bench_'))
+        ctx = prepare(stack, workdir, scale, args, cases)
+        context_path = os.path.join(workdir, 'context.json')
+        with open(context_path, 'w') as f:
+            json.dump(ctx, f)
+
+        print(f"{'case':<22}{'units':>12}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}{'units/s':>14}{'peak MB':>10}")
+        for name in cases:
+            r = measure_isolated('benchmarks.run', name, context_path, args.repeat)
+            results[name] = r
+            if 'error' in r:
+                print(f"{name:<22} failed: {r['error']}")
+                continue
+            print(f"{name:<22}{r['count']:>12,}{r['p50_seconds']:>10.4f}{r['p90_seconds']:>10.4f}"
+                  f"{r['p99_seconds']:>10.4f}{r['throughput'] or 0:>14,.0f}{r['peak_rss_mb']:>10.0f}")
+
+    write_results(out, results, dict(scale, name=args.scale))
+    print(f"results written to {out}")
+
+
+if __name__ == '__main__':
+    main()
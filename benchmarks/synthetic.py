@@ -0,0 +1,269 @@
+"""
+Synthetic data for the benchmark harness: a star schema in Postgres, file
+trees and weekly sales series, all reproducible from a seed.
+
+The star schema has the tables and columns `DataHelper` reads
+(`fact_sales`, `dim_product`, `hier_product`, `dim_geography`,
+`hier_geography`, `dim_time`) and is generated inside the server with
+``generate_series``, so millions of fact rows load in seconds.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from query_builder import GSK_VENDORS
+
+MARKETS = ('AU', 'US', 'UK', 'DE', 'FR', 'IT', 'CA', 'JP')
+CATEGORIES = (('ORAL CARE', 'DENTURE CLEANSERS'), ('ORAL CARE', 'TOOTHPASTE'),
+              ('PAIN', 'TABLETS'), ('RESPIRATORY', 'NASAL SPRAY'))
+VENDORS = GSK_VENDORS[:2] + ('PROCTER & GAMBLE', 'COLGATE-PALMOLIVE')
+FIRST_WEEK = '2018-01-06'
+
+# products and stores are per market; fact rows = markets * products * stores * weeks
+SCALES = {
+    'small': dict(markets=2, products=40, stores=10, weeks=104, files=20_000, series=2_000,
+                  excel_rows=20_000),
+    'medium': dict(markets=4, products=200, stores=25, weeks=156, files=100_000, series=20_000,
+                   excel_rows=200_000),
+    'large': dict(markets=8, products=500, stores=50, weeks=156, files=500_000, series=100_000,
+                  excel_rows=1_000_000),
+}
+
+STAR_DDL = """
+    create schema {s};
+    create table {s}.dim_geography(geography_id int primary key, market_name text, channel_name text,
+                                   retailer_name text, format_name text, segment_name text,
+                                   retailer_status_flag bool);
+    create table {s}.hier_geography(geography_id int primary key);
+    create table {s}.dim_product(product_id int primary key, market_name text, vendor_name text,
+                                 brand_name text, product_name text, product_status_flag bool);
+    create table {s}.hier_product(product_id int primary key, category_name text, sub_category_name text);
+    create table {s}.dim_time(time_id int primary key, time_period_start date, time_period_end date,
+                              nrf_calendar_date date, period text);
+    create table {s}.fact_sales(product_id int, geography_id int, time_id int,
+                                sales_revenue numeric, sales_units numeric,
+                                sales_revenue_incremental numeric, sales_units_incremental numeric,
+                                acv_weighted_distribution numeric, price_per_unit numeric,
+                                price_per_unit_promo numeric, price_per_unit_non_promo numeric,
+                                price_effective_price numeric, cost_amount numeric);
+    create table {s}.margin(product_id int, geography_id int, time_id int, margin numeric,
+                            primary key (product_id, geography_id, time_id));
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _pg_bin(bin_dir=None) -> str:
+    if bin_dir is not None:
+        return bin_dir
+    initdb = shutil.which('initdb')
+    if initdb is not None:
+        return os.path.dirname(initdb)
+    try:
+        return subprocess.run(['pg_config', '--bindir'], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        raise RuntimeError("Postgres binaries not found; put initdb on PATH or pass bin_dir.")
+
+
+@contextmanager
+def throwaway_postgres(bin_dir: str = None):
+    """
+    Run a new Postgres cluster in a temporary directory for the duration of the block.
+
+    Durability is switched off, which is fine for data that is thrown away.
+    Postgres refuses to run as root, so run the harness as another user or
+    point it at an existing server (see :func:`throwaway_schema`).
+
+    Yields
+    ------
+    connection_params : dict
+        Parameters for `psycopg2.connect`, over a Unix socket in the directory.
+    """
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        raise RuntimeError("Postgres can't run as root; use an existing server with --json-path.")
+    bin_dir = _pg_bin(bin_dir)
+    root = tempfile.mkdtemp(prefix='gsk_bench_pg_')
+    data, port = os.path.join(root, 'data'), _free_port()
+    try:
+        subprocess.run([os.path.join(bin_dir, 'initdb'), '-D', data, '-U', 'postgres', '-A', 'trust',
+                        '-E', 'UTF8', '--no-sync'], check=True, capture_output=True)
+        options = (f"-p {port} -k {root} -c listen_addresses='' -c fsync=off "
+                   f"-c synchronous_commit=off -c full_page_writes=off")
+        subprocess.run([os.path.join(bin_dir, 'pg_ctl'), '-D', data, '-o', options, '-w',
+                        '-l', os.path.join(root, 'postgres.log'), 'start'], check=True, capture_output=True)
+        try:
+            yield dict(host=root, port=port, user='postgres', password='', dbname='postgres')
+        finally:
+            subprocess.run([os.path.join(bin_dir, 'pg_ctl'), '-D', data, '-m', 'immediate', 'stop'],
+                           capture_output=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@contextmanager
+def throwaway_schema(connection_params: dict, prefix: str = 'bench'):
+    """Yield the name of a new schema on an existing server, dropped after the block."""
+    import psycopg2
+
+    schema = f"{prefix}_{uuid.uuid4().hex[:8]}"
+    try:
+        yield schema
+    finally:
+        conn = psycopg2.connect(**connection_params)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"drop schema if exists {schema} cascade")
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def populate_star(connection_params: dict, schema: str, markets: int = 2, products: int = 40,
+                  stores: int = 10, weeks: int = 104, seed: float = 0.42, **_) -> dict:
+    """
+    Create and fill the star schema in `schema`.
+
+    Every product of a market sells in every store of that market every week.
+    Products cycle through :data:`CATEGORIES` and :data:`VENDORS`, so both
+    `load_market_category` and the GSK-only `load_market_category_all` have
+    rows; a tenth of stores and a fifth of products are inactive.
+
+    Returns
+    -------
+    dict
+        Row counts per table.
+    """
+    import psycopg2
+
+    names = list(MARKETS[:markets])
+    conn = psycopg2.connect(**connection_params)
+    try:
+        with conn.cursor() as cur:
+            s = schema
+            cur.execute(STAR_DDL.format(s=s))
+            cur.execute("select setseed(%s)", (seed,))
+            cur.execute(f"""
+                insert into {s}.dim_geography
+                select (m.i - 1) * %(stores)s + g, m.name, 'channel' || g %% 3, 'retailer' || g %% 7,
+                       'format' || g %% 2, 'segment' || g %% 4, g %% 10 <> 0
+                from unnest(%(names)s::text[]) with ordinality as m(name, i), generate_series(1, %(stores)s) g;
+                insert into {s}.hier_geography select geography_id from {s}.dim_geography;
+                insert into {s}.dim_product
+                select (m.i - 1) * %(products)s + p, m.name, (%(vendors)s::text[])[1 + p %% %(n_vendors)s],
+                       'BRAND' || p %% 13, 'PRODUCT ' || m.name || ' ' || p, p %% 5 <> 0
+                from unnest(%(names)s::text[]) with ordinality as m(name, i), generate_series(1, %(products)s) p;
+                insert into {s}.hier_product
+                select product_id, (%(categories)s::text[])[1 + product_id %% %(n_categories)s],
+                       (%(sub_categories)s::text[])[1 + product_id %% %(n_categories)s]
+                from {s}.dim_product;
+                insert into {s}.dim_time
+                select t, d, d + 6, d, 'W' || t
+                from generate_series(1, %(weeks)s) t, lateral (select date %(first)s + (t - 1) * 7 as d) w;
+            """, dict(stores=stores, products=products, weeks=weeks, names=names,
+                      vendors=list(VENDORS), n_vendors=len(VENDORS), first=FIRST_WEEK,
+                      categories=[c for c, _ in CATEGORIES], sub_categories=[c for _, c in CATEGORIES],
+                      n_categories=len(CATEGORIES)))
+            cur.execute(f"""
+                insert into {s}.fact_sales
+                select p.product_id, g.geography_id, t.time_id,
+                       round((u * price)::numeric, 2), u, round((u * price * 0.1)::numeric, 2),
+                       round((u * 0.1)::numeric, 2), round(random()::numeric, 4), round(price::numeric, 2),
+                       round((price * 0.8)::numeric, 2), round(price::numeric, 2), round((price * 0.95)::numeric, 2),
+                       round((u * price * 0.6)::numeric, 2)
+                from {s}.dim_product p
+                join {s}.dim_geography g on g.market_name = p.market_name
+                cross join {s}.dim_time t,
+                lateral (select round((20 + 10 * sin(2 * pi() * t.time_id / 52) + 5 * random())::numeric, 0) as u,
+                                2 + 8 * random() as price) x
+            """)
+            cur.execute(f"alter table {s}.fact_sales add primary key (product_id, geography_id, time_id)")
+            cur.execute(f"""
+                select (select count(*) from {s}.fact_sales), (select count(*) from {s}.dim_product),
+                       (select count(*) from {s}.dim_geography), (select count(*) from {s}.dim_time)
+            """)
+            counts = dict(zip(('fact_sales', 'dim_product', 'dim_geography', 'dim_time'), cur.fetchone()))
+        conn.commit()
+        # statistics for the planner, outside a transaction
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("analyze")
+    finally:
+        conn.close()
+    return counts
+
+
+def make_file_tree(root: str, files: int, depth: int = 2, fanout: int = 10, seed: int = 0) -> str:
+    """
+    Create `files` empty files spread over ``fanout ** depth`` directories under `root`.
+
+    Three in four are ``sales_*.csv``, the rest ``sales_*.json``, with
+    modification times spread over a year. Returns the directory holding
+    the most files, for flat lookups.
+    """
+    rng = np.random.default_rng(seed)
+    dirs = [root]
+    for _ in range(depth):
+        dirs = [os.path.join(d, f"d{i:02d}") for d in dirs for i in range(fanout)]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    where = rng.integers(0, len(dirs), files)
+    # a skewed tree: the first directory gets a large share, like a landing folder
+    where[:files // 4] = 0
+    mtimes = 1_600_000_000 + rng.integers(0, 365 * 86400, files)
+    for i, (d, mtime) in enumerate(zip(where, mtimes)):
+        path = os.path.join(dirs[d], f"sales_{i:07d}{'.json' if i % 4 == 0 else '.csv'}")
+        open(path, 'w').close()
+        os.utime(path, (mtime, mtime))
+    return dirs[0]
+
+
+def make_series(series: int, weeks: int = 156, period: int = 52, seed: int = 0) -> pd.DataFrame:
+    """
+    Long-format weekly sales of `series` product x geography series.
+
+    Each series is a level, a linear trend and a seasonal wave plus noise,
+    with 2% of the rows missing.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(weeks)
+    level = rng.uniform(10, 1000, (series, 1))
+    trend = rng.normal(0, 0.5, (series, 1)) * t
+    season = rng.uniform(0.05, 0.3, (series, 1)) * level * np.sin(2 * np.pi * (t + rng.integers(0, period, (series, 1))) / period)
+    units = np.maximum(level + trend + season + rng.normal(0, 0.05, (series, weeks)) * level, 0)
+    df = pd.DataFrame({
+        'product_id': np.repeat(np.arange(series) // 50, weeks),
+        'geography_id': np.repeat(np.arange(series) % 50, weeks),
+        'nrf_calendar_date': np.tile(pd.date_range(FIRST_WEEK, periods=weeks, freq='7D').to_numpy(), series),
+        'sales_units': units.ravel().round(0),
+    })
+    return df[rng.random(len(df)) >= 0.02].reset_index(drop=True)
+
+
+def make_sales_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A `load_market_category`-like extract of `rows` rows, for Excel and write benchmarks."""
+    rng = np.random.default_rng(seed)
+    units = rng.integers(0, 200, rows)
+    price = rng.uniform(2, 10, rows).round(2)
+    return pd.DataFrame({
+        'product_id': rng.integers(1, 10_000, rows),
+        'geography_id': rng.integers(1, 500, rows),
+        'time_id': np.arange(rows),
+        'brand_name': rng.choice(['POLIDENT', 'SENSODYNE', 'PARODONTAX', 'AQUAFRESH'], rows),
+        'retailer_name': rng.choice([f"retailer{i}" for i in range(7)], rows),
+        'nrf_calendar_date': pd.Timestamp(FIRST_WEEK) + pd.to_timedelta(rng.integers(0, 156, rows) * 7, 'D'),
+        'sales_units': units,
+        'sales_revenue': (units * price).round(2),
+        'margin': rng.uniform(0, 0.6, rows).round(4),
+    })
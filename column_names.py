@@ -0,0 +1,64 @@
+"""
+Column name sanitizing for pandas and Spark DataFrames.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+NON_WORD = re.compile(r'\W')
+
+
+@lru_cache(maxsize=1024)
+def column_mapping(columns: tuple) -> tuple:
+    """
+    New names for `columns` with every non-word character removed.
+
+    Names that sanitizing makes empty or duplicate get a ``_2``, ``_3``, ...
+    suffix. A name that is already clean is never renamed, so in
+    ``('Sales $', 'Sales')`` the second column keeps ``Sales`` and the first
+    becomes ``Sales_2``. Labels that aren't strings, e.g. pandas' default
+    integer columns, are sanitized as ``str(label)``. Results are cached per
+    tuple of source names, so a feed that keeps its layout is only ever
+    sanitized once.
+
+    Examples
+    --------
+    >>> column_mapping(('Product Name', 'Sales $', 'Sales', '%'))
+    ('ProductName', 'Sales_2', 'Sales', 'col_4')
+    """
+    columns = [str(c) for c in columns]
+    cleaned = [NON_WORD.sub('', c) for c in columns]
+    used = {new for old, new in zip(columns, cleaned) if old == new}
+    result = []
+    for i, (old, new) in enumerate(zip(columns, cleaned), 1):
+        if old != new or not new:
+            base = new or f"col_{i}"
+            new, n = base, 1
+            while new in used:
+                n += 1
+                new = f"{base}_{n}"
+            used.add(new)
+        result.append(new)
+    return tuple(result)
+
+
+def sanitize_columns(df):
+    """
+    Return `df` with sanitized column names, see :func:`column_mapping`.
+
+    Works on pandas and Spark DataFrames. The rename is a single ``toDF``
+    projection in Spark and a relabel of the column index in pandas, neither
+    copies data, and a frame whose names are already clean is returned as is.
+    """
+    columns = tuple(df.columns)
+    new = column_mapping(columns)
+    if new == columns:
+        return df
+    if isinstance(df, pd.DataFrame):
+        return df.set_axis(new, axis=1)
+    return df.toDF(*new)
@@ -0,0 +1,199 @@
+"""
+Thread-safe psycopg2 connection pool used by :class:`DataHelper`.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection became available within the wait timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable psycopg2 connections.
+
+    Idle connections are handed out most-recently-used first, so the pool
+    naturally shrinks back towards `minconn` once load drops and idle
+    connections outlive `idle_timeout`.
+
+    Parameters
+    ----------
+    connection_params : dict
+        Dictionary of parameters to pass to `psycopg2.connect`.
+    minconn : int
+        Number of idle connections kept open regardless of `idle_timeout`.
+    maxconn : int
+        Maximum number of connections open at the same time. Checkouts beyond
+        this block until a connection is returned.
+    idle_timeout : float
+        Seconds after which an idle connection above `minconn` is closed.
+    health_check_after : float or None
+        Connections idle for longer than this many seconds are probed with
+        ``select 1`` on checkout and replaced if the probe fails. `None`
+        disables the probe.
+
+    Examples
+    --------
+    >>> pool = ConnectionPool(connection_params, maxconn=4)
+    >>> with pool.connection() as conn:
+    ...     with conn.cursor() as cur:
+    ...         cur.execute('select 1')
+    >>> pool.stats
+    {'hits': 0, 'misses': 1, 'waits': 0, 'wait_seconds': 0.0, 'discarded': 0, 'open': 1, 'idle': 1}
+    """
+
+    def __init__(self,
+                 connection_params: dict,
+                 minconn: int = 1,
+                 maxconn: int = 10,
+                 idle_timeout: float = 300.0,
+                 health_check_after: float = 5.0):
+
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            raise ValueError("Expected 0 <= minconn <= maxconn and maxconn >= 1.")
+
+        self.connection_params = connection_params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+
+        self._idle = []  # (connection, returned_at), most recently used last
+        self._open = 0
+        self._cond = threading.Condition()
+        self._counters = dict(hits=0, misses=0, waits=0, wait_seconds=0.0, discarded=0)
+
+    @property
+    def stats(self) -> dict:
+        """Snapshot of the hit/miss/wait counters and current pool size."""
+        with self._cond:
+            return dict(self._counters, open=self._open, idle=len(self._idle))
+
+    def getconn(self, timeout: float = None):
+        """Check out a connection, waiting up to `timeout` seconds if the pool is full."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                self._prune()
+                while not self._idle and self._open >= self.maxconn:
+                    self._wait(deadline)
+                if not self._idle:
+                    self._open += 1
+                    break
+                conn, returned_at = self._idle.pop()
+
+            # probe outside the lock so a slow server doesn't stall other checkouts
+            if self._healthy(conn, returned_at):
+                with self._cond:
+                    self._counters['hits'] += 1
+                return conn
+            with self._cond:
+                self._discard(conn)
+
+        try:
+            conn = psycopg2.connect(**self.connection_params)
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._counters['misses'] += 1
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool, or close it if `discard` is set or it is broken."""
+
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._cond:
+            if discard or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager that checks a connection out and always returns it."""
+
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.putconn(conn, discard=bool(conn.closed))
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close every idle connection; checked-out connections are unaffected."""
+
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def _wait(self, deadline):
+        # called with self._cond held
+        start = time.monotonic()
+        self._counters['waits'] += 1
+        if deadline is None:
+            self._cond.wait()
+            timed_out = False
+        else:
+            timed_out = deadline <= start or not self._cond.wait(deadline - start)
+        self._counters['wait_seconds'] += time.monotonic() - start
+        if timed_out:
+            raise PoolTimeout("No connection became available before the timeout.")
+
+    def _prune(self):
+        # called with self._cond held; idle list is oldest first
+        cutoff = time.monotonic() - self.idle_timeout
+        while len(self._idle) > self.minconn and self._idle[0][1] < cutoff:
+            conn, _ = self._idle.pop(0)
+            self._discard(conn)
+
+    def _healthy(self, conn, returned_at) -> bool:
+        if conn.closed:
+            return False
+        if self.health_check_after is None:
+            return True
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('select 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        # called with self._cond held
+        self._open -= 1
+        self._counters['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
@@ -0,0 +1,257 @@
+"""
+Multi-file CSV ingest with declared or cached schemas.
+
+Retailer drops are directories of CSV files. Each directory is read in a
+single pass: the schema is either declared by the caller or inferred once from
+the head of the first file and cached on disk, so neither Spark's
+``inferSchema`` nor a second scan of the data is needed on later runs.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import pandas as pd
+
+from file_operation import FileOpt
+
+BACKENDS = ('arrow', 'spark')
+
+
+def _bounded_map(fn, items, max_workers):
+    """Like ``executor.map`` but with at most ``2 * max_workers`` results in flight."""
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = [executor.submit(fn, item) for item in islice(items, 2 * max_workers)]
+        while pending:
+            result = pending.pop(0).result()
+            pending.extend(executor.submit(fn, item) for item in islice(items, 1))
+            yield result
+
+
+class SchemaCache:
+    """
+    Inferred schemas on disk, keyed by dataset name and header line.
+
+    A file whose header differs from the cached one gets a new entry, so a
+    changed layout is re-inferred instead of being read with a stale schema.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name: str, backend: str, header) -> str:
+        digest = hashlib.sha256(json.dumps(list(header)).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, f"{name}-{digest}.{backend}.json")
+
+    def get(self, name, backend, header):
+        try:
+            with open(self.path(name, backend, header), 'r') as f:
+                return json.load(f)['schema']
+        except FileNotFoundError:
+            return None
+
+    def put(self, name, backend, header, schema):
+        path = self.path(name, backend, header)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({'header': list(header), 'schema': schema}, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+
+def _widen_arrow(schema):
+    """Inferred schema with integers as float64 and empty columns as strings."""
+    import pyarrow as pa
+
+    def widen(field):
+        if pa.types.is_integer(field.type):
+            return field.with_type(pa.float64())
+        if pa.types.is_null(field.type):
+            return field.with_type(pa.string())
+        return field
+    return pa.schema([widen(f) for f in schema])
+
+
+def _widen_spark(schema):
+    """Inferred schema with integers as doubles."""
+    from pyspark.sql.types import (ByteType, DoubleType, IntegerType, LongType, ShortType,
+                                   StructField, StructType)
+
+    return StructType([StructField(f.name, DoubleType(), f.nullable)
+                       if isinstance(f.dataType, (ByteType, ShortType, IntegerType, LongType)) else f
+                       for f in schema.fields])
+
+
+class CsvIngest:
+    """
+    Read many CSV files with one schema, in parallel, recording per-file stats.
+
+    Parameters
+    ----------
+    backend : str
+        ``'arrow'`` reads with `pyarrow.csv` on a thread pool and returns
+        pandas DataFrames; ``'spark'`` returns one Spark DataFrame over all
+        files and lets Spark read them as parallel partitions.
+    spark : pyspark.sql.SparkSession
+        Session used by the ``'spark'`` backend.
+    schema_cache_dir : str
+        Directory of cached inferred schemas. `None` infers on every read.
+    max_workers : int
+        Files read at the same time by the ``'arrow'`` backend.
+    count_rows : bool
+        With the ``'spark'`` backend, run one extra job scanning every file to
+        count its rows. Off by default, as it reads the data a second time.
+        The ``'arrow'`` backend always counts.
+
+    Attributes
+    ----------
+    stats : list of dict
+        One ``{'name', 'path', 'rows', 'bytes', 'seconds'}`` record per file
+        read, in read order. With the ``'spark'`` backend there are records
+        only with `count_rows`, and neither `bytes` nor a per-file `seconds`
+        is known.
+
+    Examples
+    --------
+    >>> ingest = CsvIngest(backend='arrow', schema_cache_dir='/tmp/gsk_schemas')
+    >>> paths = ingest.discover('/dbfs/mnt/Americas/Conformed/NA/US/Sales/Ecom/Target/Sales')
+    >>> sales = ingest.read(paths, name='Target')
+    >>> ingest.stats_frame()[['path', 'rows', 'seconds']]
+    """
+
+    def __init__(self, backend: str = 'arrow', spark=None, schema_cache_dir: str = None,
+                 max_workers: int = 4, count_rows: bool = False):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}.")
+        if backend == 'spark' and spark is None:
+            raise ValueError("The spark backend needs a SparkSession.")
+        self.backend = backend
+        self.spark = spark
+        self.schemas = SchemaCache(schema_cache_dir) if schema_cache_dir else None
+        self.max_workers = max_workers
+        self.count_rows = count_rows
+        self.stats = []
+
+    @staticmethod
+    def discover(folder: str, pattern: str = '*.csv', recursive: bool = False, **filters) -> list:
+        """
+        Sorted paths of the files in `folder` matching `pattern`, see :meth:`FileOpt.find_files_recursive`.
+
+        Subfolders, e.g. of archived or rejected drops, are only searched with `recursive`.
+        """
+        return FileOpt(folder).find_files_recursive(pattern=pattern, max_depth=None if recursive else 0,
+                                                    **filters)
+
+    def stats_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.stats, columns=['name', 'path', 'rows', 'bytes', 'seconds'])
+
+    def read(self, paths, name: str = 'csv', schema=None):
+        """
+        Read every file of `paths` as one table.
+
+        `schema` is a `pyarrow.Schema` or ``{column: arrow type name}`` for the
+        ``'arrow'`` backend, and a `StructType` or DDL string for ``'spark'``.
+        When it is `None` the schema comes from the cache, or is inferred from
+        the first file and cached under `name`. As that sample can't rule out
+        decimals further on, inferred integer columns are read as floats;
+        declare `schema` to keep them integral. Values that still don't fit
+        an inferred schema fail the read instead of becoming nulls.
+        """
+        paths = list(paths)
+        if not paths:
+            raise ValueError(f"No files to read for {name!r}.")
+        if self.backend == 'spark':
+            return self._read_spark(paths, name, schema)
+        frames = [df for _, df in self.iter_read(paths, name, schema)]
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_read(self, paths, name: str = 'csv', schema=None):
+        """
+        Yield ``(path, DataFrame)`` per file, in order, with the ``'arrow'`` backend.
+
+        Only a few files are decoded ahead of the consumer, so a large drop
+        can be processed without holding all of it in memory.
+        """
+        import pyarrow.csv as pv
+
+        if self.backend != 'arrow':
+            raise ValueError("iter_read is only available with the arrow backend.")
+        paths = list(paths)
+        schema = self._arrow_schema(paths[0], name, schema)
+        convert = pv.ConvertOptions(column_types=schema, strings_can_be_null=True)
+
+        def read_one(path):
+            start = time.perf_counter()
+            table = pv.read_csv(path, convert_options=convert)
+            df = table.to_pandas(date_as_object=False)
+            return path, df, time.perf_counter() - start
+
+        for path, df, seconds in _bounded_map(read_one, paths, self.max_workers):
+            self.stats.append({'name': name, 'path': path, 'rows': len(df),
+                               'bytes': os.path.getsize(path), 'seconds': seconds})
+            yield path, df
+
+    def _arrow_schema(self, first, name, schema):
+        import pyarrow as pa
+        import pyarrow.csv as pv
+
+        if isinstance(schema, dict):
+            return pa.schema([(c, pa.type_for_alias(t)) for c, t in schema.items()])
+        if schema is not None:
+            return schema
+
+        with open(first, 'r', newline='') as f:
+            header = f.readline().rstrip('\r\n').split(',')
+        if self.schemas is not None:
+            cached = self.schemas.get(name, 'arrow', header)
+            if cached is not None:
+                return _widen_arrow(pa.ipc.read_schema(pa.py_buffer(base64.b64decode(cached))))
+
+        # types are inferred from the first block only, the rest of the file isn't read,
+        # so integers are widened: a later ``1.5`` must not fail the read
+        with pv.open_csv(first) as reader:
+            schema = _widen_arrow(reader.schema)
+        if self.schemas is not None:
+            self.schemas.put(name, 'arrow', header,
+                             base64.b64encode(schema.serialize().to_pybytes()).decode('ascii'))
+        return schema
+
+    def _spark_schema(self, first, name, schema):
+        from pyspark.sql.types import StructType
+
+        if schema is not None:
+            return schema
+        header = self.spark.read.csv(first, header=True).columns
+        if self.schemas is not None:
+            cached = self.schemas.get(name, 'spark', header)
+            if cached is not None:
+                return _widen_spark(StructType.fromJson(cached))
+
+        schema = _widen_spark(self.spark.read.csv(first, header=True, inferSchema=True).schema)
+        if self.schemas is not None:
+            self.schemas.put(name, 'spark', header, schema.jsonValue())
+        return schema
+
+    def _read_spark(self, paths, name, schema):
+        from pyspark.sql.functions import input_file_name
+
+        # values not matching a schema inferred from one file fail the read,
+        # rather than being turned into nulls as in the default PERMISSIVE mode
+        mode = 'PERMISSIVE' if schema is not None else 'FAILFAST'
+        schema = self._spark_schema(paths[0], name, schema)
+        sdf = self.spark.read.csv(paths, header=True, schema=schema, mode=mode)
+        if self.count_rows:
+            counts = dict(sdf.groupBy(input_file_name().alias('path')).count().collect())
+            # Spark reports fully qualified URIs, match them back on the path suffix
+            for path in paths:
+                rows = next((n for uri, n in counts.items() if uri.endswith(path.lstrip('/'))), 0)
+                self.stats.append({'name': name, 'path': path, 'rows': rows,
+                                   'bytes': None, 'seconds': None})
+        return sdf
@@ -6,16 +6,125 @@ Proprietary and confidential
 Unauthorized copying of this file, via any medium, is strictly prohibited.
 """
 import datetime
+import functools
+import io
 import json
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from os.path import join
 
+import numpy as np
 import pandas as pd
 import psycopg2
+from psycopg2.extensions import encodings
 
+from columnar import FACT_SALES_TYPES, arrow_schema, read_copy
+from connection_pool import ConnectionPool, PoolTimeout
+from extract_store import ExtractStore
+from query_builder import (GSK_VENDORS, MARKET_CATEGORY_ALL_COLUMNS, SalesQuery,
+                           execute_prepared, quote_ident)
+from query_metrics import QueryMetrics, QueryTrace, TimedConnection, TimedCursor
+from result_cache import ResultCache
 
-def stringable(x):
-    return isinstance(x, str) or isinstance(x, datetime.datetime)
+
+REQUIRED_PARAMS = {'user', 'password', 'host', 'dbname', 'port'}
+COPY_NULL = r'\N'
+DECODERS = ('read_sql', 'copy')
+RESTATE_WINDOW = datetime.timedelta(weeks=4)
+STAR_TABLES = ('fact_sales', 'dim_product', 'hier_product', 'dim_geography', 'hier_geography', 'dim_time')
+
+
+def copy_null(df: pd.DataFrame) -> str:
+    """
+    NULL marker for copying `df`: :data:`COPY_NULL`, unless a string equals it.
+
+    In CSV mode an unquoted field equal to the marker is loaded as NULL, and
+    `to_csv` doesn't quote such a value, so a genuine ``'\\N'`` string would
+    be loaded as NULL. A suffixed marker no value equals is picked instead.
+    """
+    taken = set()
+    for _, s in df.select_dtypes(include=['object', 'string', 'category']).items():
+        if s.isin([COPY_NULL]).any():
+            s = s.dropna().astype(str)
+            taken.update(s[s.str.startswith(COPY_NULL)])
+    marker, n = COPY_NULL, 0
+    while marker in taken:
+        marker, n = f"{COPY_NULL}{n}", n + 1
+    return marker
+
+
+def _integral_floats_as_ints(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with float columns holding only whole numbers (and NaN) as ``Int64``.
+
+    Integer columns with nulls arrive as floats, and their ``1.0`` isn't valid
+    input for an integer column, while ``1`` is for any numeric one.
+    """
+    ints = {}
+    for c, s in df.select_dtypes(include='floating').items():
+        values = s.to_numpy(dtype='float64', na_value=np.nan)
+        known = values[~np.isnan(values)]
+        if len(known) and (np.abs(known) < 2 ** 53).all() and (known == np.round(known)).all():
+            ints[c] = s.astype('Int64')
+    if not ints:
+        return df
+    out = df.copy(deep=False)
+    for c, s in ints.items():
+        out[c] = s
+    return out
+
+
+def to_copy_buffer(df: pd.DataFrame, null: str = COPY_NULL) -> io.StringIO:
+    """Serialize a frame as CSV suitable for ``COPY ... FROM STDIN``, with `null` for missing values."""
+    df = _integral_floats_as_ints(df)
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False, na_rep=null)
+    buf.seek(0)
+    return buf
+
+
+def read_connection_params(json_path: str = None, connection_params: dict = None):
+    """
+    Resolve connection parameters the way :class:`DataHelper` does.
+
+    Returns
+    -------
+    schema, connection_params: str, dict
+        The `schema` entry, and the entries of :data:`REQUIRED_PARAMS`.
+    """
+    try:
+        d = connection_params.copy()
+    except AttributeError:
+        if json_path is None:
+            json_path = join(os.environ['GSK_HOME'], 'connection.json')
+        with open(json_path, 'r') as f:
+            d = json.load(f)
+    schema = d.pop('schema', None)
+    return schema, {k: d[k] for k in d.keys() & REQUIRED_PARAMS}
+
+
+def traced(method):
+    """Record the queries run by a :class:`DataHelper` method under its name."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._labelled(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def frame_from_rows(rows, description) -> pd.DataFrame:
+    """Build a DataFrame from DB-API rows the way `pd.read_sql` does."""
+    columns = [c.name for c in description]
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def frame_from_cursor(cur) -> pd.DataFrame:
+    return frame_from_rows(cur.fetchall(), cur.description)
 
 
 class DataHelper:
@@ -28,6 +137,19 @@ class DataHelper:
         Absolute path to a JSON file containing the connection parameters.
     connection_params : dict
         Dictionary of parameters to pass to `psycopg2.connect`.
+    pool_min, pool_max : int
+        Bounds of the connection pool shared by every method.
+    idle_timeout : float
+        Seconds after which idle pooled connections above `pool_min` are closed.
+    health_check_after : float or None
+        Pooled connections idle for longer than this are probed before reuse.
+    cache_dir : str
+        Directory of the local result cache used by ``cache=True`` loads.
+        Defaults to ``$GSK_HOME/cache``.
+    cache_max_bytes : int
+        Size above which least recently used cache entries are evicted.
+    metrics : query_metrics.QueryMetrics
+        Registry recording every query; a new one by default.
 
     Examples
     --------
@@ -54,206 +176,754 @@ class DataHelper:
 
     >>> au_cleansers = dh.load_market_category('AU', 'ORAL CARE', 'DENTURE CLEANSERS')
 
+    Repeated loads can be served from a local cache, which is refreshed
+    whenever the star schema tables change.
+
+    >>> au_cleansers = dh.load_market_category('AU', 'ORAL CARE', 'DENTURE CLEANSERS', cache=True)
+    >>> dh.invalidate_cache('AU', 'ORAL CARE', 'DENTURE CLEANSERS')
+
     You may also query the database directly using the :class:`DataHelper`.
 
     >>> dh.query("select distinct vendor_name from test_star.dim_product where brand_name = 'AQUAFRESH'")
            vendor_name
     0  GLAXOSMITHKLINE
 
+    Connections come from a pool owned by the `DataHelper`. Calls made inside
+    :meth:`session` share one connection, and calls made inside
+    :meth:`transaction` also share one transaction.
+
+    >>> with dh.transaction():
+    ...     dh.truncate_table('margin', schema='test_star')
+    ...     dh.write_pg('margin', margin_df, schema='test_star')
+    >>> dh.pool.stats
+    {'hits': 2, 'misses': 1, 'waits': 0, 'wait_seconds': 0.0, 'discarded': 0, 'open': 1, 'idle': 1}
+
+    Every call is timed and sized in :attr:`metrics`, recorded under the
+    public method that was called.
+
+    >>> dh.metrics.summary()[['name', 'calls', 'total_seconds', 'execute_seconds', 'rows']]
+                       name  calls  total_seconds  execute_seconds  rows
+    0  load_market_category      1           2.31             1.92  1040
+    1                 query      1           0.01             0.01     1
+
     """
 
-    required = {'user', 'password', 'host', 'dbname', 'port'}
+    required = REQUIRED_PARAMS
+
+    def __init__(self,
+                 json_path: str = None,
+                 connection_params: dict = None,
+                 pool_min: int = 1,
+                 pool_max: int = 10,
+                 idle_timeout: float = 300.0,
+                 health_check_after: float = 5.0,
+                 cache_dir: str = None,
+                 cache_max_bytes: int = 5 * 1024 ** 3,
+                 metrics: QueryMetrics = None):
+
+        self.schema, self.connection_params = read_connection_params(json_path, connection_params)
+        self.pool = ConnectionPool(self.connection_params,
+                                   minconn=pool_min,
+                                   maxconn=pool_max,
+                                   idle_timeout=idle_timeout,
+                                   health_check_after=health_check_after)
+        self._local = threading.local()
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self._cache = None
+        self._extracts = None
+        self.metrics = metrics if metrics is not None else QueryMetrics()
+
+    @property
+    def cache(self) -> ResultCache:
+        """The local result cache, created on first use."""
+        if self._cache is None:
+            root = self.cache_dir or join(os.environ['GSK_HOME'], 'cache')
+            self._cache = ResultCache(root, max_bytes=self.cache_max_bytes)
+        return self._cache
+
+    # noinspection SqlResolve
+    def freshness(self) -> tuple:
+        """
+        Cheap probe of whether the star schema has changed.
+
+        Combines the latest `time_id` in `dim_time` with the number of rows
+        inserted, updated or deleted in the star schema tables since the
+        statistics were last reset. The server publishes these counters with a
+        delay of a few seconds, so call :meth:`invalidate_cache` after writing
+        to the star schema from the same process.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    select (select max(time_id) from {self.schema}.dim_time),
+                           (select coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+                            from pg_stat_user_tables
+                            where schemaname = %s and relname = any(%s))
+                """, (self.schema, list(STAR_TABLES)))
+                return cur.fetchone()
+
+    @traced
+    def cached_query(self, query, params=None, decoder: str = 'read_sql') -> pd.DataFrame:
+        """Like :meth:`query`, but served from the local cache while the schema is unchanged."""
+
+        key = self._cache_key(query, params, decoder)
+        token = self.freshness()
+        df = self.cache.get(key, token)
+        if df is None:
+            df = self.query(query, decoder=decoder, params=params)
+            self.cache.put(key, token, df)
+        return df
+
+    def _cache_key(self, query, params, decoder):
+        sql, params = self._sql_params(query, params)
+        return self.cache.key(sql, dict(params=params, decoder=decoder))
+
+    @property
+    def extracts(self) -> ExtractStore:
+        """Store of incrementally refreshed extracts, under the cache directory."""
+        if self._extracts is None:
+            self._extracts = ExtractStore(join(self.cache.root, 'extracts'))
+        return self._extracts
+
+    @traced
+    def refresh_market_category(self, market=None, category=None, sub_category=None,
+                                only_active=False, restate_window=RESTATE_WINDOW,
+                                decoder='read_sql'):
+        """
+        Incrementally refresh the local extract of a market/category combination.
 
-    def __init__(self, json_path: str = None, connection_params: dict = None):
+        The first call pulls the full history. Later calls only fetch rows with
+        `nrf_calendar_date` after the stored high-water mark minus
+        `restate_window`, replace that trailing window in the local extract and
+        append anything newer, so restated periods are picked up too.
 
+        Parameters
+        ----------
+        market, category, sub_category, only_active
+            As in :meth:`load_market_category`.
+        restate_window : datetime.timedelta
+            Trailing window re-pulled on every refresh.
+        decoder : str
+            ``'read_sql'`` or ``'copy'``, see :meth:`query`.
+
+        Returns
+        -------
+        market_category: pandas DataFrame
+            The full, refreshed extract.
+        """
+
+        name = self._cache_key(self.query_string(market, category, sub_category, only_active), None, decoder)
+        return self._refresh(
+                name,
+                lambda since: self.query(
+                        self.query_string(market, category, sub_category, only_active, since=since),
+                        decoder=decoder),
+                restate_window)
+
+    @traced
+    def refresh_market_category_all(self, restate_window=RESTATE_WINDOW, decoder='read_sql'):
+        """Incrementally refresh the local extract of :meth:`load_market_category_all`."""
+
+        name = self._cache_key(self.query_string_all(), None, decoder)
+        return self._refresh(
+                name,
+                lambda since: self.query(self.query_string_all(since=since), decoder=decoder),
+                restate_window)
+
+    def _refresh(self, name, load, restate_window):
+        meta = self.extracts.meta(name)
+        if meta is None or meta['high_water_mark'] is None:
+            df = load(None)
+        else:
+            cutoff = meta['high_water_mark'] - restate_window
+            df = self.extracts.merge(name, load(cutoff), cutoff)
+        self.extracts.save(name, df)
+        return df
+
+    def invalidate_cache(self, market=None, category=None, sub_category=None, only_active=False):
+        """
+        Drop cached results of :meth:`load_market_category` for one combination.
+
+        With no arguments the whole cache is cleared.
+        """
+        if market is None and category is None and sub_category is None:
+            self.cache.invalidate()
+            return
+        query = self.query_string(market, category, sub_category, only_active)
+        for decoder in DECODERS:
+            self.cache.invalidate(self._cache_key(query, None, decoder))
+
+    @contextmanager
+    def session(self):
+        """
+        Run every call in the block on one pooled connection.
+
+        Each call still commits on its own; use :meth:`transaction` to commit
+        them together.
+        """
+        with self._bind(in_transaction=False) as conn:
+            yield conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run every call in the block on one pooled connection and one transaction.
+
+        The transaction commits when the block exits and rolls back if it raises.
+        Inside :meth:`session` the session's connection runs the transaction;
+        nested in another transaction the block is a savepoint, so only its own
+        work is rolled back if it raises and the outer block still decides
+        whether everything commits.
+        """
+        bound = getattr(self._local, 'conn', None)
+        if bound is not None and self._local.in_transaction:
+            with self._savepoint(bound):
+                yield bound
+            return
+        with self._bind(in_transaction=True) as conn:
+            # a session's binding becomes transactional for the block
+            self._local.in_transaction = True
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                self._local.in_transaction = False
+
+    @contextmanager
+    def _savepoint(self, conn):
+        self._local.savepoints = getattr(self._local, 'savepoints', 0) + 1
+        name = f"dh_savepoint_{self._local.savepoints}"
         try:
-            d = connection_params.copy()
-        except AttributeError:
-            if json_path is None:
-                json_path = join(os.environ['GSK_HOME'], 'connection.json')
-            with open(json_path, 'r') as f:
-                d = json.load(f)
+            with conn.cursor() as cur:
+                cur.execute(f"SAVEPOINT {name}")
+            try:
+                yield
+            except BaseException:
+                with conn.cursor() as cur:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                raise
+            with conn.cursor() as cur:
+                cur.execute(f"RELEASE SAVEPOINT {name}")
         finally:
-            self.schema = d.pop('schema', None)
+            self._local.savepoints -= 1
+
+    @contextmanager
+    def _bind(self, in_transaction):
+        bound = getattr(self._local, 'conn', None)
+        if bound is not None:
+            # nested blocks join the outer one
+            yield bound
+            return
+        with self.pool.connection() as conn:
+            self._local.conn = conn
+            self._local.in_transaction = in_transaction
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    @contextmanager
+    def connection(self, trace: QueryTrace = None, bind: bool = True):
+        """
+        Check out a connection for a single call.
 
-        self.connection_params = {k: d[k] for k in d.keys() & self.required}
+        Reuses the connection bound by :meth:`session`/:meth:`transaction` if
+        any, and commits on exit unless a transaction is open. The time
+        waiting for the pool is added to `trace`.
 
-    def query(self, query: str) -> pd.DataFrame:
-        with psycopg2.connect(**self.connection_params) as conn:
-            df = pd.read_sql(query, conn)
+        With ``bind=False`` a connection of its own is used outside of a
+        transaction, even in a :meth:`session`, and it isn't bound to the
+        thread, so calls made while the block is suspended, e.g. between the
+        chunks of a stream, can't commit on it.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.in_transaction:
+            yield conn
+            return
+        start = time.perf_counter()
+        with self._bind(in_transaction=False) if bind else self.pool.connection() as conn:
+            if trace is not None:
+                trace.add('connect', time.perf_counter() - start)
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Close the idle connections held by the pool."""
+        self.pool.closeall()
+
+    @contextmanager
+    def _labelled(self, name):
+        if getattr(self._local, 'label', None) is not None:
+            # the outermost public method names the trace
+            yield
+            return
+        self._local.label = name
+        try:
+            yield
+        finally:
+            self._local.label = None
+
+    @contextmanager
+    def _trace(self, sql=None, params=None, decoder=None, name=None):
+        """Record the block as one call in :attr:`metrics`."""
+        trace = QueryTrace(name or getattr(self._local, 'label', None) or 'query', sql, decoder,
+                           deep_memory=self.metrics.deep_memory)
+        complete = True
+        try:
+            yield trace
+        except GeneratorExit:
+            # a stream closed before its end
+            complete = False
+            raise
+        except Exception as e:
+            trace.error = repr(e)
+            raise
+        finally:
+            trace.finish()
+            if complete and self.metrics.should_explain(trace):
+                self._explain(trace, params)
+            self.metrics.record(trace)
+
+    def _explain(self, trace, params):
+        # on a connection of its own, read-only and rolled back, so neither the
+        # caller's transaction nor the data can be affected
+        try:
+            with self.pool.connection(timeout=5) as conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SET TRANSACTION READ ONLY")
+                        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {trace.sql}", params or None)
+                        trace.plan = cur.fetchone()[0]
+                finally:
+                    conn.rollback()
+        except (psycopg2.Error, PoolTimeout) as e:
+            trace.plan = {'error': repr(e)}
+
+    @traced
+    def query(self, query, chunksize: int = None, decoder: str = 'read_sql',
+              params=None, prepare: bool = None):
+        """
+        Run `query` and return the result as a DataFrame.
+
+        `query` is either SQL text, with optional psycopg2 `params`, or a
+        :class:`query_builder.SalesQuery`. Builder queries are run through a
+        prepared statement per pooled connection unless `prepare` is `False`,
+        so repeated calls with different filter values skip planning.
+
+        If `chunksize` is given, rows are streamed through a server-side cursor
+        and an iterator of DataFrames of at most `chunksize` rows is returned
+        instead, so peak memory depends on the chunk size and not on the
+        size of the result.
+
+        `decoder` picks how a whole result is decoded: ``'read_sql'`` goes
+        through `pd.read_sql`, ``'copy'`` exports the result with ``COPY`` and
+        parses it column-wise with the Postgres result types (see
+        :mod:`columnar`), which is much cheaper for multi-million-row pulls.
+        :class:`query_builder.SalesQuery` results also get the `fact_sales`
+        dtypes of :data:`columnar.FACT_SALES_TYPES`.
+        """
+        if decoder not in DECODERS:
+            raise ValueError(f"Unknown decoder {decoder!r}, expected one of {DECODERS}.")
+        if chunksize is not None:
+            # the generator runs after this call returns, so take the label now
+            name = self._local.label
+            return (df for _, df in self._stream(query, chunksize, params, name=name))
+
+        if prepare is None:
+            prepare = isinstance(query, SalesQuery)
+        sql, params = self._sql_params(query, params)
+
+        with self._trace(sql, params, decoder) as trace, self.connection(trace) as conn:
+            if decoder == 'copy':
+                with conn.cursor() as cur:
+                    sql = cur.mogrify(sql, params).decode(encodings[conn.encoding]) if params else sql
+                # only the fact_sales extract has known column types
+                dtypes = FACT_SALES_TYPES if isinstance(query, SalesQuery) else None
+                df = read_copy(conn, sql, dtypes, trace=trace)
+            elif prepare:
+                if not isinstance(query, SalesQuery):
+                    raise ValueError("Only SalesQuery queries can be prepared.")
+                with TimedCursor(conn.cursor(), trace) as cur:
+                    execute_prepared(cur, query)
+                    with trace.phase('decode'):
+                        df = frame_from_cursor(cur)
+            else:
+                # read_sql's own execute and fetch are timed by the proxy, the rest is decoding
+                with trace.phase('decode'):
+                    df = pd.read_sql(sql, TimedConnection(conn, trace), params=params or None)
+            trace.add_frame(df)
         return df
 
-    def load_pg(self, table_name):
-        """Load a postgres table into a spark dataframe."""
+    @staticmethod
+    def _sql_params(query, params=None):
+        if isinstance(query, SalesQuery):
+            if params is not None:
+                raise ValueError("SalesQuery carries its own parameters.")
+            return query.render()
+        return query, params
 
-        with psycopg2.connect(**self.connection_params) as connection:
-            df = pd.read_sql(f"select * from {table_name}", connection)
-        return df
+    @traced
+    def load_pg(self, table_name, chunksize: int = None, decoder: str = 'read_sql'):
+        """Load a postgres table into a pandas dataframe, optionally in chunks."""
+
+        return self.query(f"select * from {table_name}", chunksize=chunksize, decoder=decoder)
+
+    @traced
+    def query_to_parquet(self, query, path: str, chunksize: int = 100_000, params=None) -> int:
+        """
+        Stream the result of `query` into a Parquet file at `path`.
+
+        Each chunk of `chunksize` rows is written as its own row group. Column
+        types come from the Postgres result description so that chunks with
+        only nulls in a column still agree on the file schema.
 
+        Returns
+        -------
+        rows: int
+            Number of rows written.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = 0
+        writer = None
+        try:
+            for description, df in self._stream(query, chunksize, params):
+                if writer is None:
+                    schema = arrow_schema(description, pa.Table.from_pandas(df, preserve_index=False).schema)
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False))
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    def _stream(self, query, chunksize: int, params=None, name=None):
+        """Yield ``(cursor.description, DataFrame)`` chunks from a named server-side cursor."""
+
+        sql, params = self._sql_params(query, params)
+        # committing would close the named cursor, so other calls between chunks
+        # must not share its connection
+        with self._trace(sql, params, name=name) as trace, self.connection(trace, bind=False) as conn:
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                cur.itersize = chunksize
+                cur = TimedCursor(cur, trace)
+                cur.execute(sql, params)
+                first = True
+                while True:
+                    rows = cur.fetchmany(chunksize)
+                    if not rows and not first:
+                        break
+                    with trace.phase('decode'):
+                        df = frame_from_rows(rows, cur.description)
+                    trace.add_frame(df)
+                    yield cur.description, df
+                    first = False
+                    if len(rows) < chunksize:
+                        break
+
+    @traced
     def write_pg(self,
                  table_name: str,
                  df: pd.DataFrame,
                  on_conflict='DO NOTHING',
-                 schema=None):
-        """Insert values into Postgres subject to named constraint."""
-
-        records = df.to_dict(orient="record")
-
-        if schema is None:
-            # TODO it's complicated ... hopefully we can change this later
-            raise ValueError("Schema must be provided.")
+                 schema=None,
+                 batch_size: int = 100_000) -> dict:
+        """
+        Insert values into Postgres subject to named constraint.
 
-        def format_if_string(x):
-            return f"$${x}$$" if stringable(x) else x
+        Rows are streamed with ``COPY ... FROM STDIN`` in batches of
+        `batch_size` into a temporary staging table, which is then merged into
+        the target with ``INSERT ... SELECT ... ON CONFLICT {on_conflict}``.
 
-        def row_vals(row):
-            return ", ".join(f"{format_if_string(row[col])}" for col in df.columns)
+        Parameters
+        ----------
+        table_name : str
+            Target table, without schema.
+        df : pandas DataFrame
+            Rows to write. Column names must match the target table. Names
+            are quoted, so their case must match too.
+        on_conflict : str
+            Conflict action appended to ``ON CONFLICT``.
+        schema : str
+            Schema of the target table.
+        batch_size : int
+            Number of rows serialized and copied per round trip.
 
-        all_records = ", ".join(f"({row_vals(row)})" for row in records)
-        query = f"""
-            INSERT INTO {schema}.{table_name} ({', '.join(df.columns)}) 
-            VALUES {all_records} ON CONFLICT {on_conflict}
+        Returns
+        -------
+        stats: dict
+            `rows` copied, `inserted` into the target, `seconds` elapsed and
+            `rows_per_sec`.
         """
 
-        self.sql_execute(query)
+        if schema is None:
+            # TODO it's complicated ... hopefully we can change this later
+            raise ValueError("Schema must be provided.")
 
+        # quoted like asyncpg's copy_to_table does, so names match exactly
+        columns = ', '.join(quote_ident(c) for c in df.columns)
+        target = f"{quote_ident(schema)}.{quote_ident(table_name)}"
+        staging = quote_ident(f"stage_{table_name}")
+
+        insert = f"""
+                    INSERT INTO {target} ({columns})
+                    SELECT {columns} FROM {staging} ON CONFLICT {on_conflict}
+                """
+
+        start = time.perf_counter()
+        with self._trace(insert) as trace, self.connection(trace) as conn:
+            with TimedCursor(conn.cursor(), trace) as cur:
+                cur.execute(f"""
+                    CREATE TEMP TABLE {staging}
+                    (LIKE {target} INCLUDING DEFAULTS)
+                    ON COMMIT DROP
+                """)
+                for lo in range(0, len(df), batch_size):
+                    batch = df.iloc[lo:lo + batch_size]
+                    # serializing is the write path's counterpart of decoding
+                    with trace.phase('decode'):
+                        null = copy_null(batch)
+                        buf = to_copy_buffer(batch, null)
+                    with trace.phase('execute'):
+                        cur.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{null}')",
+                                        buf)
+                    trace.bytes += buf.tell()
+                    trace.rows += len(batch)
+                cur.execute(insert)
+                inserted = cur.rowcount
+                cur.execute(f"DROP TABLE {staging}")
+        seconds = time.perf_counter() - start
+
+        return {'rows': len(df),
+                'inserted': inserted,
+                'seconds': seconds,
+                'rows_per_sec': len(df) / seconds if seconds else float('inf')}
+
+    @traced
     def truncate_table(self, table_name: str, schema: str):
         """ Truncate the existing table"""
 
         query_string = f"""
-            TRUNCATE TABLE  {schema}.{table_name}
+            TRUNCATE TABLE {quote_ident(schema)}.{quote_ident(table_name)}
         """
         self.sql_execute(query_string)
 
+    @traced
     def sql_execute(self, query):
-        with psycopg2.connect(**self.connection_params) as conn:
-            with conn.cursor() as cur:
+        with self._trace(query) as trace, self.connection(trace) as conn:
+            with TimedCursor(conn.cursor(), trace) as cur:
                 cur.execute(query)
-            conn.commit()
+                trace.rows = max(cur.rowcount, 0)
 
+    @traced
     def load_market_category(self, market=None, category=None,
-                             sub_category=None, only_active=False):
+                             sub_category=None, only_active=False,
+                             chunksize=None, decoder='read_sql', cache=False,
+                             columns=None, start_date=None, end_date=None,
+                             date_column='nrf_calendar_date', channels=None, retailers=None):
         """
         Load the sales data for a market/category combination.
 
         Parameters
         ----------
-        market : str
+        market : str or list of str
             `market_name` to look for in `dim_market`
-        category : str
+        category : str or list of str
             `category_name` to look for in `dim_category`
-        sub_category : str
+        sub_category : str or list of str
             `sub_category_name` to look for in `dim_sub_category`
         only_active : bool
             Whether or not to keep only products where `product_status_flag` is
             true. If set to `False`, all deactivated products will be returned.
+        chunksize : int
+            If given, stream the result and return an iterator of DataFrames
+            with at most `chunksize` rows each.
+        decoder : str
+            ``'read_sql'`` or ``'copy'``, see :meth:`query`.
+        cache : bool
+            Serve the result from the local cache while the star schema is
+            unchanged. Cannot be combined with `chunksize`.
+        columns : list of str
+            Output columns to return. Only these are read and shipped by the
+            database; by default every product column and measure is returned.
+        start_date, end_date : datetime.date
+            Inclusive window on `date_column`, applied in the database.
+        date_column : str
+            ``'nrf_calendar_date'`` or ``'time_period_start'``.
+        channels, retailers : str or list of str
+            `channel_name`/`retailer_name` values to keep.
 
         Returns
         -------
-        market_category: spark DataFrame
+        market_category: pandas DataFrame or iterator of DataFrames
         """
 
-        with psycopg2.connect(**self.connection_params) as conn:
-            df = pd.read_sql(
-                    self.query_string(market, category, sub_category, only_active),
-                    conn
-            )
-        return df
+        query = self.query_string(market, category, sub_category, only_active,
+                                  columns=columns, start_date=start_date, end_date=end_date,
+                                  date_column=date_column, channels=channels, retailers=retailers)
+        if cache:
+            if chunksize is not None:
+                raise ValueError("cache and chunksize cannot be combined.")
+            return self.cached_query(query, decoder=decoder)
+        return self.query(query, chunksize=chunksize, decoder=decoder)
 
-    # noinspection SqlResolve
-    def query_string(self, market, category, sub_category, only_active=True):
-        return f"""
-            with this_geo as (
-                select  dg.geography_id,
-                        market_name,
-                        channel_name,
-                        retailer_name,
-                        format_name,
-                        segment_name
-                from {self.schema}.dim_geography dg
-                where market_name = '{market}' and retailer_status_flag
-            ),this_category as (
-                select dp.*
-                from {self.schema}.dim_product dp
-                join {self.schema}.hier_product hp on dp.product_id = hp.product_id
-                where category_name = '{category}'
-                and sub_category_name = '{sub_category}'
-                {'and product_status_flag' * only_active}
-            )
-            select this_category.*,
-                   this_geo.geography_id,
-                   this_geo.channel_name,
-                   this_geo.retailer_name,
-                   this_geo.format_name,
-                   this_geo.segment_name,
-                   time_period_start,
-                   time_period_end,
-                   nrf_calendar_date,
-                   period,
-                   sales_revenue,
-                   sales_units,
-                   sales_revenue_incremental,
-                   sales_units_incremental,
-                   acv_weighted_distribution,
-                   price_per_unit,
-                   price_per_unit_promo,
-                   price_per_unit_non_promo,
-                   price_effective_price,
-                   cost_amount
-            from {self.schema}.fact_sales fs
-            inner join this_category on this_category.product_id = fs.product_id
-            inner join this_geo on this_geo.geography_id = fs.geography_id
-            inner join {self.schema}.dim_time dt on fs.time_id = dt.time_id
-            where this_geo.market_name = this_category.market_name
-            """
+    def query_string(self, market, category, sub_category, only_active=True, since=None, **filters):
+        """
+        Build the query behind :meth:`load_market_category`.
 
-    def load_market_category_all(self):
+        Each of `market`, `category` and `sub_category` may be a single value
+        or a list, so one round trip can fetch several segments; `None` skips
+        that filter. `filters` are the projection and filter options of
+        :class:`query_builder.SalesQuery`.
 
-        with psycopg2.connect(**self.connection_params) as conn:
-            df = pd.read_sql(self.query_string_all(), conn)
-        return df
+        Returns
+        -------
+        query: query_builder.SalesQuery
+        """
+        return SalesQuery(self.schema,
+                          markets=market,
+                          categories=category,
+                          sub_categories=sub_category,
+                          only_active=only_active,
+                          since=since,
+                          **filters)
+
+    @traced
+    def load_market_category_all(self, chunksize=None, decoder='read_sql', cache=False,
+                                 split_by=None, max_workers=4, retries=2, stream=False,
+                                 columns=None, start_date=None, end_date=None,
+                                 date_column='nrf_calendar_date', channels=None, retailers=None):
+        """
+        Load the sales data of every market/category for the GSK vendors.
+
+        Parameters
+        ----------
+        chunksize : int
+            If given, stream the result and return an iterator of DataFrames
+            with at most `chunksize` rows each.
+        decoder : str
+            ``'read_sql'`` or ``'copy'``, see :meth:`query`.
+        cache : bool
+            Serve the result from the local cache while the star schema is
+            unchanged.
+        split_by : str
+            ``'market'`` or ``'year'`` to split the extraction into one query
+            per market or per calendar year and run them concurrently on
+            pooled connections. Use a pool at least `max_workers` large.
+        max_workers : int
+            Maximum number of segments extracted at the same time.
+        retries : int
+            Number of times a segment is retried after a connection error.
+        stream : bool
+            With `split_by`, return an iterator of ``(segment, DataFrame)``
+            pairs instead of one concatenated DataFrame.
+        columns : list of str
+            Output columns to return. Only these are read and shipped by the
+            database; by default every product column and measure is returned.
+        start_date, end_date : datetime.date
+            Inclusive window on `date_column`, applied in the database.
+        date_column : str
+            ``'nrf_calendar_date'`` or ``'time_period_start'``.
+        channels, retailers : str or list of str
+            `channel_name`/`retailer_name` values to keep.
+
+        Returns
+        -------
+        market_category: pandas DataFrame or iterator
+            Segments always come back in sorted segment order.
+        """
 
-    def query_string_all(self):
-        return f"""
-            with this_geo as (
-                select  dg.geography_id,
-                        market_name,
-                        channel_name,
-                        retailer_name,
-                        format_name,
-                        segment_name
-                from {self.schema}.dim_geography dg
-                join {self.schema}.hier_geography hg on dg.geography_id = hg.geography_id
-                where retailer_status_flag
-            ),this_category as (
-                select dp.*
-                from {self.schema}.dim_product dp
-                join {self.schema}.hier_product hp on dp.product_id = hp.product_id
-            )
-            select this_category.*,
-                   this_geo.geography_id,
-                   this_geo.channel_name,
-                   this_geo.retailer_name,
-                   this_geo.format_name,
-                   this_geo.segment_name,
-                   time_period_start,
-                   time_period_end,
-                   sales_revenue,
-                   sales_units,
-                   nrf_calendar_date,
-                   sales_revenue_incremental,
-                   sales_units_incremental,
-                   acv_weighted_distribution,
-                   price_per_unit,
-                   price_per_unit_promo,
-                   price_per_unit_non_promo,
-                   price_effective_price,
-                   cost_amount,
-                   dt.period
-            from {self.schema}.fact_sales fs
-            inner join this_category on this_category.product_id = fs.product_id
-            inner join this_geo on this_geo.geography_id = fs.geography_id
-            inner join {self.schema}.dim_time dt on fs.time_id = dt.time_id
-            where this_geo.market_name = this_category.market_name
-            and vendor_name in ('GLAXOSMITHKLINE','GSK','GLAXOSMITHKLINE CONSUMER HEALTHCARE','GLAXOSMITHKL.C.H.','GSK (GREAT BRITAIN)')
+        filters = dict(columns=columns, start_date=start_date, end_date=end_date,
+                       date_column=date_column, channels=channels, retailers=retailers)
+        if split_by is not None:
+            if chunksize is not None or cache:
+                raise ValueError("split_by cannot be combined with chunksize or cache.")
+            segments = self._extract_segments(split_by, decoder, max_workers, retries, filters)
+            if stream:
+                return segments
+            return pd.concat([df for _, df in segments], ignore_index=True)
+
+        query = self.query_string_all(**filters)
+        if cache:
+            if chunksize is not None:
+                raise ValueError("cache and chunksize cannot be combined.")
+            return self.cached_query(query, decoder=decoder)
+        return self.query(query, chunksize=chunksize, decoder=decoder)
+
+    def segments(self, split_by: str) -> list:
+        """Sorted segment values for :meth:`load_market_category_all` with `split_by`."""
+
+        if split_by == 'market':
+            query = f"""
+                select distinct market_name from {self.schema}.dim_geography
+                where retailer_status_flag order by 1
+            """
+        elif split_by == 'year':
+            query = f"""
+                select distinct extract(year from nrf_calendar_date)::int
+                from {self.schema}.dim_time order by 1
             """
+        else:
+            raise ValueError(f"Unknown split_by {split_by!r}, expected 'market' or 'year'.")
+
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return [row[0] for row in cur.fetchall()]
+
+    def _extract_segments(self, split_by, decoder, max_workers, retries, filters):
+        """Yield ``(segment, DataFrame)`` in segment order while extracting concurrently."""
+
+        def segment_query(segment):
+            if split_by == 'market':
+                return self.query_string_all(markets=segment, **filters)
+            return self.query_string_all(since=datetime.date(segment - 1, 12, 31),
+                                         until=datetime.date(segment, 12, 31),
+                                         **filters)
+
+        def extract(segment):
+            for attempt in range(retries + 1):
+                try:
+                    # worker threads don't see the caller's label
+                    with self._labelled('load_market_category_all'):
+                        return self.query(segment_query(segment), decoder=decoder)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    if attempt == retries:
+                        raise
+                    time.sleep(min(2 ** attempt, 30))
+
+        segments = self.segments(split_by)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map submits everything up front but yields in input order
+            yield from zip(segments, executor.map(extract, segments))
+
+    def query_string_all(self, since=None, until=None, markets=None, **filters):
+        """
+        Build the query behind :meth:`load_market_category_all`.
+
+        `filters` are the projection and filter options of
+        :class:`query_builder.SalesQuery`.
+
+        Returns
+        -------
+        query: query_builder.SalesQuery
+        """
+        return SalesQuery(self.schema,
+                          markets=markets,
+                          vendors=GSK_VENDORS,
+                          since=since,
+                          until=until,
+                          hier_geography=True,
+                          select=MARKET_CATEGORY_ALL_COLUMNS,
+                          **filters)
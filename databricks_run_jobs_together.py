@@ -1,15 +1,18 @@
-def run_with_retry(notebook, timeout, args = {}, max_retries = 3):
-  num_retries = 0
-  while True:
-    try:
-      return dbutils.notebook.run(notebook, timeout, args)
-    except Exception as e:
-      if num_retries > max_retries:
-        raise e
-      else:
-        print("Retrying error", e)
-        num_retries += 1
- ENVIRONMENT = dbutils.widgets.get('environment')
+from job_runner import JobRunner, Task
+
+def run_with_retry(notebook, timeout, args = None, max_retries = 3):
+  # max_retries is the number of retries after the first attempt, with exponential backoff between them
+  runner = JobRunner(run_fn=dbutils.notebook.run, max_workers=1)
+  return runner.run_task(Task(notebook, notebook, args, timeout, max_retries))
+
+ENVIRONMENT = dbutils.widgets.get('environment')
 #  enviroment is the parameter of existing jobs
 # to execute
 run_with_retry("/Users/tony/prod/UpdateAllBMC", 25200,args = {'environment':ENVIRONMENT}, max_retries = 0)
+
+# to execute several jobs together; independent ones run at the same time,
+# depends_on waits for other jobs to succeed
+# runner = JobRunner(run_fn=dbutils.notebook.run, max_workers=4)
+# runner.run([Task('bmc', "/Users/tony/prod/UpdateAllBMC", {'environment':ENVIRONMENT}, 25200),
+#             Task('report', "/Users/tony/prod/Report", {'environment':ENVIRONMENT}, depends_on=['bmc'])])
+# print(pd.DataFrame(runner.attempts))
@@ -0,0 +1,118 @@
+"""
+Cached reads of Excel sheets such as the ``*_MARGIN.xlsx`` cost maps.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from result_cache import ResultCache
+
+
+class ExcelCache:
+    """
+    `pd.read_excel` backed by a Feather copy of each sheet.
+
+    The first read of a sheet parses the workbook and stores the result in a
+    :class:`result_cache.ResultCache`. Later reads memory-map the stored copy
+    for as long as the workbook's mtime and size are unchanged; editing the
+    workbook replaces the stored copy on its next read.
+
+    Parameters
+    ----------
+    root : str
+        Cache directory. Defaults to ``gsk_excel_cache`` in the temp directory.
+    max_bytes : int
+        Size above which the least recently read sheets are evicted.
+
+    Examples
+    --------
+    >>> excel = ExcelCache('/dbfs/tmp/gsk_excel_cache')
+    >>> cost_map = excel.read_excel(f"{path}/{market}/{category}_MARGIN.xlsx",
+    ...                             sheet_name="MarginCost", dtype={'upc': 'string'})
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = 2 * 1024 ** 3):
+        self.root = root or os.path.join(tempfile.gettempdir(), 'gsk_excel_cache')
+        self.cache = ResultCache(self.root, max_bytes)
+
+    @staticmethod
+    def _key(path, sheet_name, dtype, kwargs):
+        return ResultCache.key(os.path.abspath(path),
+                               {'sheet_name': sheet_name, 'dtype': dtype, 'kwargs': kwargs})
+
+    @staticmethod
+    def _token(path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def read_excel(self, path: str, sheet_name=0, dtype: dict = None, **kwargs):
+        """
+        Read sheets, from the cache when the workbook hasn't changed.
+
+        `dtype` maps columns to their types, which are applied while parsing
+        instead of being inferred. Other arguments go to `pd.read_excel`. As
+        there, a list of sheets or ``sheet_name=None`` (every sheet) returns
+        ``{sheet: DataFrame}``; each sheet is cached on its own.
+        """
+        token = self._token(path)
+        names = self._sheet_names(path, sheet_name)
+        frames = {s: self.cache.get(self._key(path, s, dtype, kwargs), token) for s in names}
+        missing = [s for s, df in frames.items() if df is None]
+        if missing:
+            parsed = pd.read_excel(path, sheet_name=missing, dtype=dtype, **kwargs)
+            for s in missing:
+                frames[s] = parsed[s]
+                try:
+                    self.cache.put(self._key(path, s, dtype, kwargs), token, parsed[s])
+                except (TypeError, ValueError):
+                    # columns Arrow can't store, e.g. mixed types, are re-read every time
+                    pass
+        if sheet_name is None or isinstance(sheet_name, list):
+            return frames
+        return frames[sheet_name]
+
+    @staticmethod
+    def _sheet_names(path, sheet_name) -> list:
+        if sheet_name is None:
+            with pd.ExcelFile(path) as workbook:
+                return workbook.sheet_names
+        return list(sheet_name) if isinstance(sheet_name, list) else [sheet_name]
+
+    def _is_cached(self, path, sheet_name, dtype, kwargs) -> bool:
+        token = self._token(path)
+        return all(os.path.exists(self.cache.path(self._key(path, s, dtype, kwargs), token))
+                   for s in self._sheet_names(path, sheet_name))
+
+    def read_many(self, paths, sheet_name=0, dtype: dict = None, processes: int = None,
+                  **kwargs) -> dict:
+        """
+        Read the same sheet of many workbooks, parsing stale ones in parallel.
+
+        Workbooks that aren't cached yet are parsed in a process pool, since
+        parsing XLSX is CPU bound, then every sheet is loaded from the cache.
+        Returns ``{path: DataFrame}``, or ``{path: {sheet: DataFrame}}`` for a
+        list of sheets or ``sheet_name=None``.
+
+        Examples
+        --------
+        >>> paths = [f"{path}/{m}/{c}_MARGIN.xlsx" for m in markets for c in categories]
+        >>> cost_maps = excel.read_many(paths, sheet_name="MarginCost")
+        """
+        paths = list(paths)
+        stale = [p for p in paths if not self._is_cached(p, sheet_name, dtype, kwargs)]
+        if len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                list(executor.map(_parse, [(self.root, self.cache.max_bytes, p, sheet_name, dtype, kwargs)
+                                           for p in stale]))
+        return {p: self.read_excel(p, sheet_name, dtype, **kwargs) for p in paths}
+
+
+def _parse(args):
+    root, max_bytes, path, sheet_name, dtype, kwargs = args
+    ExcelCache(root, max_bytes).read_excel(path, sheet_name, dtype, **kwargs)
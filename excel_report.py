@@ -0,0 +1,175 @@
+"""
+Multi-sheet Excel report writer for large DataFrames.
+
+Rows are streamed through xlsxwriter's ``constant_memory`` mode with one
+typed write call per cell, taken from column arrays converted once, instead
+of `DataFrame.to_excel` building a cell object for every value first.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TABLE_STYLE = 'Table Style Medium 21'
+# colours of TABLE_STYLE (accent 6 of the default theme), used when tables aren't available
+HEADER_FORMAT = {'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#70AD47'}
+BAND_FORMAT = {'bg_color': '#E2EFDA'}
+DATE_FORMAT = 'yyyy-mm-dd'
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+# text written for infinite values, as `DataFrame.to_excel`'s default `inf_rep`
+INF_REP = 'inf'
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB, or `None` if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _inf_text(v):
+    """`v`, or :data:`INF_REP` if it is an infinite float, which Excel can't store."""
+    if isinstance(v, float) and math.isinf(v):
+        return INF_REP if v > 0 else f"-{INF_REP}"
+    return v
+
+
+def _column_writer(worksheet, series, formats):
+    """Values of `series` as a list with `None` for nulls, and the write call for them."""
+    kind = series.dtype.kind
+    if kind in 'iuf':
+        values = series.astype('float64').to_numpy()
+        if np.isfinite(values).all():
+            return values.tolist(), worksheet.write_number, None
+        values = [None if v != v else _inf_text(v) for v in values.tolist()]
+        # infinities are text, write() picks the call per value
+        return values, worksheet.write, None
+    if kind == 'b':
+        if series.hasnans:
+            # nullable booleans
+            return series.astype(object).where(series.notna(), None).tolist(), worksheet.write_boolean, None
+        return series.tolist(), worksheet.write_boolean, None
+    if kind == 'M':
+        if getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_localize(None)
+        values = [None if v is pd.NaT else v for v in series.dt.to_pydatetime().tolist()]
+        return values, worksheet.write_datetime, formats['datetime']
+    if pd.api.types.infer_dtype(series, skipna=True) == 'string':
+        values = series.astype(object).where(series.notna(), None).tolist()
+        return values, worksheet.write_string, None
+    values = series.astype(object).where(series.notna(), None).tolist()
+    if pd.api.types.infer_dtype(series, skipna=True) == 'date':
+        return values, worksheet.write_datetime, formats['date']
+    return [_inf_text(v) for v in values], worksheet.write, None
+
+
+def _write_sheet(workbook, formats, name, data, constant_memory, style, column_width):
+    worksheet = workbook.add_worksheet(name)
+    n_rows, n_cols = data.shape
+    worksheet.set_column(0, max(n_cols - 1, 0), column_width)
+
+    if constant_memory:
+        # add_table() isn't supported in constant_memory mode: header style,
+        # banding and filter buttons stand in for the table
+        worksheet.write_row(0, 0, [str(c) for c in data.columns], formats['header'])
+        if n_rows and n_cols:
+            worksheet.conditional_format(1, 0, n_rows, n_cols - 1, {
+                'type': 'formula', 'criteria': '=MOD(ROW(),2)=0', 'format': formats['band']})
+        worksheet.autofilter(0, 0, n_rows, max(n_cols - 1, 0))
+        worksheet.freeze_panes(1, 0)
+    else:
+        worksheet.write_row(0, 0, [str(c) for c in data.columns])
+
+    columns = [_column_writer(worksheet, data.iloc[:, c], formats) for c in range(n_cols)]
+    writers = [(write, fmt) for _, write, fmt in columns]
+    # constant_memory needs rows written in order
+    for r, row in enumerate(zip(*(values for values, _, _ in columns)), 1):
+        for c, v in enumerate(row):
+            if v is not None:
+                write, fmt = writers[c]
+                write(r, c, v, fmt)
+
+    if not constant_memory and n_cols:
+        worksheet.add_table(0, 0, n_rows, n_cols - 1,
+                            {'columns': [{'header': str(c)} for c in data.columns],
+                             'style': style,
+                             'name': name})
+
+
+def write_workbook(path: str,
+                   sheets: dict,
+                   constant_memory: bool = True,
+                   style: str = TABLE_STYLE,
+                   column_width: float = 36) -> list:
+    """
+    Write `sheets`, a ``{sheet name: DataFrame}`` dict, to the workbook at `path`.
+
+    With `constant_memory` only the current row is held by xlsxwriter, so
+    memory stays flat however long the sheets are. Excel tables can't be
+    created in that mode, so each sheet gets a styled header row, banded rows
+    and an autofilter instead. Pass ``constant_memory=False`` to get real
+    tables in `style`, as `DataFrame.to_excel` + `add_table` did.
+
+    Returns
+    -------
+    list of dict
+        ``{'workbook', 'sheet', 'rows', 'seconds', 'peak_rss_mb'}`` per
+        sheet. `peak_rss_mb` is the peak of the writing process up to the end
+        of that sheet; the last entry's `seconds` includes closing the file.
+
+    Examples
+    --------
+    >>> stats = write_workbook(excel_sheet_path, dict(newly_added=new_prod, lapsed_prod=lapsed_prod))
+    >>> pd.DataFrame(stats)
+    """
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': constant_memory,
+                                         'remove_timezone': True})
+    formats = {'header': workbook.add_format(HEADER_FORMAT),
+               'band': workbook.add_format(BAND_FORMAT),
+               'date': workbook.add_format({'num_format': DATE_FORMAT}),
+               'datetime': workbook.add_format({'num_format': DATETIME_FORMAT})}
+    stats = []
+    for name, data in sheets.items():
+        start = time.perf_counter()
+        _write_sheet(workbook, formats, name, data, constant_memory, style, column_width)
+        stats.append({'workbook': path, 'sheet': name, 'rows': len(data),
+                      'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()})
+    start = time.perf_counter()
+    workbook.close()
+    if stats:
+        stats[-1]['seconds'] += time.perf_counter() - start
+        stats[-1]['peak_rss_mb'] = peak_rss_mb()
+    return stats
+
+
+def _write_workbook(args):
+    path, sheets, kwargs = args
+    return write_workbook(path, sheets, **kwargs)
+
+
+def write_workbooks(workbooks: dict, processes: int = None, **kwargs) -> list:
+    """
+    Write independent workbooks in parallel processes.
+
+    `workbooks` is ``{path: {sheet name: DataFrame}}``; other arguments are
+    passed to :func:`write_workbook`. Returns the per-sheet stats of every
+    workbook.
+    """
+    jobs = [(path, sheets, kwargs) for path, sheets in workbooks.items()]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return [s for stats in executor.map(_write_workbook, jobs) for s in stats]
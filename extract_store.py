@@ -0,0 +1,90 @@
+"""
+Local Parquet store of incrementally refreshed extracts.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import datetime
+import json
+import os
+
+import pandas as pd
+
+
+class ExtractStore:
+    """
+    Directory of named extracts, each a Parquet file plus a JSON sidecar that
+    records the extract's high-water mark.
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the extracts. Created if missing.
+    watermark : str
+        Date column whose maximum is the high-water mark of an extract.
+
+    Examples
+    --------
+    >>> store = ExtractStore('/tmp/gsk_extracts')
+    >>> store.save('au_cleansers', df)
+    >>> store.meta('au_cleansers')['high_water_mark']
+    datetime.date(2020, 12, 26)
+    """
+
+    def __init__(self, root: str, watermark: str = 'nrf_calendar_date'):
+        self.root = root
+        self.watermark = watermark
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name, ext):
+        return os.path.join(self.root, f"{name}.{ext}")
+
+    def meta(self, name: str):
+        """Metadata of extract `name`, or `None` if it has never been saved."""
+        try:
+            with open(self._path(name, 'json'), 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta['high_water_mark'] is not None:
+            meta['high_water_mark'] = datetime.date.fromisoformat(meta['high_water_mark'])
+        return meta
+
+    def load(self, name: str) -> pd.DataFrame:
+        return pd.read_parquet(self._path(name, 'parquet'))
+
+    def save(self, name: str, df: pd.DataFrame, **extra):
+        """Replace extract `name` with `df` and record its high-water mark."""
+        high_water_mark = pd.to_datetime(df[self.watermark]).max() if len(df) else pd.NaT
+        meta = dict(extra,
+                    high_water_mark=None if pd.isna(high_water_mark) else high_water_mark.date().isoformat(),
+                    rows=len(df),
+                    refreshed_at=datetime.datetime.now().isoformat(timespec='seconds'))
+
+        # write data before metadata so a crash never leaves a mark ahead of the data
+        path = self._path(name, 'parquet')
+        df.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        path = self._path(name, 'json')
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def merge(self, name: str, fresh: pd.DataFrame, cutoff) -> pd.DataFrame:
+        """
+        Replace the rows of extract `name` after `cutoff` by `fresh`.
+
+        Rows on or before `cutoff` are kept from the stored extract, so `fresh`
+        must hold every row after `cutoff`.
+        """
+        df = self.load(name)
+        keep = pd.to_datetime(df[self.watermark]) <= pd.Timestamp(cutoff)
+        return pd.concat([df[keep], fresh], ignore_index=True)
+
+    def drop(self, name: str):
+        for ext in ('parquet', 'json'):
+            try:
+                os.remove(self._path(name, ext))
+            except FileNotFoundError:
+                pass
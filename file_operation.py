@@ -1,5 +1,11 @@
 import os
 import fnmatch
+import re
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 class FileOpt:
@@ -7,21 +13,74 @@ class FileOpt:
     FileOpt is a class with multiple file related operation functions:
     find_files_by_wildcard
     find_latest_file
+    find_files_recursive
+    watch
+    invalidate
     ==============================
     Parameter:
     p
         default path that FileOpt works at
+    use_catalog
+        if true, keep an in-memory catalog of each scanned directory and serve
+        repeated lookups from it until the directory's mtime changes
     """
 
-    def __init__(self, p):
+    def __init__(self, p, use_catalog=False):
         self.dir = p
+        self.use_catalog = use_catalog
+        # folder -> (directory st_mtime_ns, [(name, st_ctime)])
+        self._catalog = {}
+        self._patterns = {}
 
     """
     Note: find_latest_file didn't use glob.glob 
     because glob doesn't return error alert when user don't have permission to a directory
     This can cause unnecessary confusion when debugging
+
+    Directories are read with os.scandir, which returns names and file types in one pass.
+    On Linux each DirEntry.stat() is still one stat call per file, so find_latest_file
+    costs about the same as os.listdir plus os.path.getctime; only Windows gets the
+    stat result from the directory listing. Repeated lookups are made cheap by
+    use_catalog, which stats a directory's files once and then only notices files being
+    added, removed or renamed (those change the directory mtime), not files rewritten
+    in place.
     """
 
+    def _matcher(self, prefix, suffix):
+        """
+        compiled matcher for prefix*suffix, equivalent to fnmatch.fnmatch
+        """
+        key = (prefix, suffix)
+        if key not in self._patterns:
+            normcase = os.path.normcase
+            match = re.compile(fnmatch.translate(normcase(prefix + '*' + suffix))).match
+            if normcase('A') != 'A':
+                self._patterns[key] = lambda name: match(normcase(name))
+            else:
+                self._patterns[key] = match
+        return self._patterns[key]
+
+    def _catalog_entries(self, folder):
+        """
+        [(name, ctime)] of every entry in folder, rescanned only when the folder's mtime changed
+        """
+        mtime = os.stat(folder).st_mtime_ns
+        cached = self._catalog.get(folder)
+        if cached is None or cached[0] != mtime:
+            with os.scandir(folder) as it:
+                cached = (mtime, [(e.name, e.stat().st_ctime) for e in it])
+            self._catalog[folder] = cached
+        return cached[1]
+
+    def invalidate(self, folder=''):
+        """
+        drop the catalog of 'folder', or of every folder if folder has no value
+        """
+        if folder == '':
+            self._catalog.clear()
+        else:
+            self._catalog.pop(folder, None)
+
     """
     Function:
         find_files_by_wildcard
@@ -43,12 +102,11 @@ class FileOpt:
 
     def find_files_by_wildcard(self, folder='', prefix='', suffix=''):
         check_path = folder if folder != '' else self.dir
-        file_list = os.listdir(check_path)
-        matched_files = []
-        for i in file_list:
-            if fnmatch.fnmatch(i, prefix + '*' + suffix):
-                matched_files.append(i)
-        return matched_files
+        match = self._matcher(prefix, suffix)
+        if self.use_catalog:
+            return [name for name, _ in self._catalog_entries(check_path) if match(name)]
+        with os.scandir(check_path) as it:
+            return [e.name for e in it if match(e.name)]
 
     """
     Function:
@@ -72,10 +130,277 @@ class FileOpt:
     """
 
     def find_latest_file(self, folder='', prefix='', suffix='', filename_only=False):
-        file_list = self.find_files_by_wildcard(folder=folder, prefix=prefix, suffix=suffix)
-        a = [self.dir + '/' + i for i in file_list]
-        latest_file = max(a, key=lambda x: os.path.getctime(x))
-        return os.path.basename(latest_file) if filename_only else latest_file
+        check_path = folder if folder != '' else self.dir
+        match = self._matcher(prefix, suffix)
+        if self.use_catalog:
+            matched = [(name, ctime) for name, ctime in self._catalog_entries(check_path) if match(name)]
+        else:
+            # only matching entries are stat'ed; on Linux that is still one stat call each
+            with os.scandir(check_path) as it:
+                matched = [(e.name, e.stat().st_ctime) for e in it if match(e.name)]
+        latest_file = max(matched, key=lambda x: x[1])[0]
+        return latest_file if filename_only else os.path.join(check_path, latest_file)
+
+    """
+    Function:
+        find_files_recursive
+    Parameters:
+    -----------
+    folder
+        the root of the tree to search.
+        if folder has no value then it will look for the default path p defined in __init__
+    prefix, suffix :: str
+        prefix and suffix of the filename to search. can be null
+    pattern :: str
+        fnmatch pattern for the filename, e.g. 'sales_*_2021??.csv'. overrides prefix and suffix
+    min_size, max_size :: int
+        keep files whose size in bytes is within these bounds. can be null
+    modified_after, modified_before :: float
+        keep files whose mtime (seconds since the epoch) is within these bounds. can be null
+    max_workers :: int
+        number of threads listing directories at the same time. each level of the tree
+        is listed in parallel, which hides the latency of network mounts
+    max_depth :: int
+        levels of subdirectories to descend into, 0 for 'folder' only. can be null for the whole tree
+
+    Returns:
+    --------
+    matched_files ::  list
+        sorted full paths of the files under 'folder' that pass every filter
+    """
+
+    def find_files_recursive(self, folder='', prefix='', suffix='', pattern=None,
+                             min_size=None, max_size=None, modified_after=None, modified_before=None,
+                             max_workers=8, max_depth=None):
+        check_path = folder if folder != '' else self.dir
+        match = self._matcher_for(prefix, suffix, pattern)
+        need_stat = any(x is not None for x in (min_size, max_size, modified_after, modified_before))
+
+        def keep(entry):
+            if not match(entry.name):
+                return False
+            if not need_stat:
+                return True
+            st = entry.stat()
+            return ((min_size is None or st.st_size >= min_size)
+                    and (max_size is None or st.st_size <= max_size)
+                    and (modified_after is None or st.st_mtime > modified_after)
+                    and (modified_before is None or st.st_mtime <= modified_before))
+
+        def scan(path):
+            files, dirs = [], []
+            try:
+                with os.scandir(path) as it:
+                    for e in it:
+                        if e.is_dir(follow_symlinks=False):
+                            dirs.append(e.path)
+                        elif keep(e):
+                            files.append(e.path)
+            except PermissionError:
+                # same as os.walk: unreadable subdirectories are skipped, the root still raises
+                if path == check_path:
+                    raise
+            return files, dirs
+
+        matched, level, depth = [], [check_path], 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while level:
+                next_level = []
+                for files, dirs in executor.map(scan, level):
+                    matched.extend(files)
+                    next_level.extend(dirs)
+                level = next_level if max_depth is None or depth < max_depth else []
+                depth += 1
+        return sorted(matched)
+
+    """
+    Function:
+        watch
+    Parameters:
+    -----------
+    folder
+        the root of the tree to watch.
+        if folder has no value then it will look for the default path p defined in __init__
+    prefix, suffix, pattern
+        filename filters, same as find_files_recursive
+    recursive :: boolean
+        if true then also watch subdirectories, including ones created later
+    timeout :: float
+        stop after this many seconds. can be null to watch forever
+    interval :: float
+        seconds between scans when polling
+    use_inotify :: boolean
+        use inotify (Linux only). defaults to true when it is available, otherwise the tree is polled
+
+    Returns:
+    --------
+    generator of str
+        full paths of files that arrive or are modified after the watch started.
+        with inotify a file is reported once it is closed after writing or moved into place,
+        so half-written drops are not picked up. if the kernel's event queue overflows, the tree
+        is rescanned for files changed since the last read, so a file can be reported twice
+    """
+
+    def watch(self, folder='', prefix='', suffix='', pattern=None, recursive=True,
+              timeout=None, interval=1.0, use_inotify=None):
+        check_path = folder if folder != '' else self.dir
+        match = self._matcher_for(prefix, suffix, pattern)
+        if use_inotify is None:
+            use_inotify = _Inotify.available()
+        if use_inotify:
+            return self._watch_inotify(check_path, match, recursive, timeout)
+        return self._watch_polling(check_path, match, recursive, timeout, interval)
+
+    def _matcher_for(self, prefix, suffix, pattern):
+        if pattern is None:
+            return self._matcher(prefix, suffix)
+        return re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+
+    def _snapshot(self, root, recursive):
+        if recursive:
+            paths = self.find_files_recursive(folder=root)
+        else:
+            with os.scandir(root) as it:
+                paths = [e.path for e in it if e.is_file()]
+        snapshot = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _watch_polling(self, root, match, recursive, timeout, interval):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        seen = self._snapshot(root, recursive)
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(interval if deadline is None else max(0.0, min(interval, deadline - time.monotonic())))
+            current = self._snapshot(root, recursive)
+            for path, state in sorted(current.items()):
+                if seen.get(path) != state and match(os.path.basename(path)):
+                    yield path
+            seen = current
+
+    def _watch_inotify(self, root, match, recursive, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with _Inotify() as notify:
+            notify.add(root)
+            if recursive:
+                for dirpath, dirnames, _ in os.walk(root):
+                    for d in dirnames:
+                        notify.add(os.path.join(dirpath, d))
+            checkpoint = time.time_ns()
+            while deadline is None or time.monotonic() < deadline:
+                wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                read_at = time.time_ns()
+                events, overflowed = notify.read(wait)
+                if overflowed:
+                    # the kernel dropped events queued since the last read: rescan for
+                    # files changed since then, and watch directories created meanwhile
+                    if recursive:
+                        for dirpath, _, _ in os.walk(root):
+                            notify.add(dirpath)
+                    for path, (mtime_ns, _) in sorted(self._snapshot(root, recursive).items()):
+                        if mtime_ns >= checkpoint and match(os.path.basename(path)):
+                            yield path
+                    events = []
+                checkpoint = read_at
+                for path, is_dir in events:
+                    if not is_dir:
+                        if match(os.path.basename(path)):
+                            yield path
+                    elif recursive:
+                        # files can land in a new directory before its watch exists
+                        for dirpath, dirnames, filenames in os.walk(path):
+                            notify.add(dirpath)
+                            for f in sorted(filenames):
+                                if match(f):
+                                    yield os.path.join(dirpath, f)
+
+
+class _Inotify:
+    """
+    Minimal ctypes binding of Linux inotify, reporting completed writes and moves.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    HEADER = struct.Struct('iIII')
+
+    @staticmethod
+    def _libc():
+        import ctypes
+        import ctypes.util
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    @classmethod
+    def available(cls):
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            return hasattr(cls._libc(), 'inotify_init1')
+        except OSError:
+            return False
+
+    def __init__(self):
+        import ctypes
+        self._ctypes = ctypes
+        self._lib = self._libc()
+        self.fd = self._lib.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        # path -> watch descriptor, so adding a watch doesn't scan every existing one
+        self.descriptors = {}
+
+    def add(self, path):
+        if path in self.descriptors:
+            return
+        wd = self._lib.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            raise OSError(self._ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        self.watches[wd] = path
+        self.descriptors[path] = wd
+
+    def read(self, timeout):
+        """
+        wait up to timeout seconds and return ([(path, is_dir)], overflowed) of the events
+        received. overflowed is true when the kernel queue overflowed and events were lost
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], False
+        data = os.read(self.fd, 64 * 1024)
+        events, offset, overflowed = [], 0, False
+        while offset < len(data):
+            wd, mask, _, length = self.HEADER.unpack_from(data, offset)
+            offset += self.HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if wd == -1 and mask & self.IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if wd not in self.watches or not name:
+                continue
+            is_dir = bool(mask & self.IN_ISDIR)
+            # plain files are only reported once closed or moved in, directories as soon as created
+            if is_dir or not mask & self.IN_CREATE:
+                events.append((os.path.join(self.watches[wd], name), is_dir))
+        return events, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 # test = FileOpt('/Users/gaowei_1/Downloads')
@@ -0,0 +1,213 @@
+"""
+Run Databricks notebooks and Python callables together, with retries.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import datetime
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class JobFailed(RuntimeError):
+    """Raised by :meth:`JobRunner.run` when tasks failed; `errors` maps task name to exception."""
+
+    def __init__(self, errors: dict, results: dict):
+        self.errors = errors
+        self.results = results
+        super().__init__(f"{len(errors)} task(s) failed: {', '.join(errors)}")
+
+
+class Task:
+    """
+    One unit of work for :class:`JobRunner`.
+
+    Parameters
+    ----------
+    name : str
+        Unique name, used in `depends_on` and in the results.
+    target : str or callable
+        Notebook path, run through the runner's `run_fn`, or a callable
+        called with ``**args``.
+    args : dict
+        Notebook widget values, or keyword arguments of the callable.
+    timeout : float
+        Seconds one attempt may take.
+    max_retries : int
+        Attempts after the first one fails, so at most ``1 + max_retries``.
+    depends_on : sequence of str
+        Tasks that must succeed before this one starts.
+    """
+
+    def __init__(self, name: str, target, args: dict = None, timeout: float = 3600,
+                 max_retries: int = 0, depends_on=()):
+        self.name = name
+        self.target = target
+        self.args = dict(args or {})
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.depends_on = tuple(depends_on)
+
+
+class JobRunner:
+    """
+    Run a list or DAG of tasks on a bounded thread pool.
+
+    Tasks whose dependencies have succeeded run concurrently, up to
+    `max_workers` at a time. A failed attempt is retried after an
+    exponential backoff with jitter; a task that still fails makes its
+    dependents be skipped while unrelated tasks carry on.
+
+    Parameters
+    ----------
+    run_fn : callable
+        ``run_fn(notebook, timeout, args)`` running a notebook task, e.g.
+        ``dbutils.notebook.run``. Only needed for notebook tasks, and can be
+        any stub when testing locally.
+    max_workers : int
+        Tasks running at the same time.
+    backoff : float
+        Delay before the first retry, doubled for every later one.
+    max_backoff : float
+        Upper bound of the delay.
+
+    Attributes
+    ----------
+    attempts : list of dict
+        ``{'task', 'attempt', 'start', 'end', 'seconds', 'status', 'error'}``
+        for every attempt, with `status` one of ``'ok'``, ``'error'``,
+        ``'timeout'``.
+
+    Examples
+    --------
+    >>> runner = JobRunner(run_fn=dbutils.notebook.run, max_workers=3)
+    >>> results = runner.run([
+    ...     Task('bmc', '/Users/tony/prod/UpdateAllBMC', {'environment': ENVIRONMENT}, timeout=25200),
+    ...     Task('margin', '/Users/tony/prod/UpdateMargin', {'environment': ENVIRONMENT}, max_retries=2),
+    ...     Task('report', '/Users/tony/prod/Report', depends_on=['bmc', 'margin']),
+    ... ])
+    >>> pd.DataFrame(runner.attempts)
+    """
+
+    def __init__(self, run_fn=None, max_workers: int = 4, backoff: float = 30.0,
+                 max_backoff: float = 600.0):
+        self.run_fn = run_fn
+        self.max_workers = max_workers
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempts = []
+        self._lock = threading.Lock()
+
+    def delay(self, retry: int) -> float:
+        """Seconds to wait before retry number `retry` (1-based): half fixed, half random."""
+        ceiling = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _call(self, task):
+        if callable(task.target):
+            # a thread can't be stopped, so a callable that times out is left running
+            outcome = {}
+
+            def target():
+                try:
+                    outcome['result'] = task.target(**task.args)
+                except BaseException as e:
+                    outcome['error'] = e
+            worker = threading.Thread(target=target, name=f"task-{task.name}", daemon=True)
+            worker.start()
+            worker.join(task.timeout)
+            if worker.is_alive():
+                raise TimeoutError(f"Task {task.name!r} timed out after {task.timeout} s.")
+            if 'error' in outcome:
+                raise outcome['error']
+            return outcome.get('result')
+
+        if self.run_fn is None:
+            raise ValueError(f"Task {task.name!r} is a notebook but the runner has no run_fn.")
+        return self.run_fn(task.target, task.timeout, task.args)
+
+    def run_task(self, task: Task):
+        """Run `task` with its retries and return its result."""
+        for attempt in range(1, task.max_retries + 2):
+            start = datetime.datetime.now()
+            began = time.perf_counter()
+            status, error = 'ok', None
+            try:
+                return self._call(task)
+            except Exception as e:
+                status, error = ('timeout' if isinstance(e, TimeoutError) else 'error'), e
+                if attempt > task.max_retries:
+                    raise
+                print(f"Retrying {task.name} after error: {e!r}")
+            finally:
+                with self._lock:
+                    self.attempts.append({'task': task.name, 'attempt': attempt, 'start': start,
+                                          'end': datetime.datetime.now(),
+                                          'seconds': time.perf_counter() - began,
+                                          'status': status, 'error': repr(error) if error else None})
+            time.sleep(self.delay(attempt))
+
+    @staticmethod
+    def _check(tasks):
+        names = [t.name for t in tasks]
+        if len(set(names)) != len(names):
+            raise ValueError("Task names must be unique.")
+        known = set(names)
+        for t in tasks:
+            missing = set(t.depends_on) - known
+            if missing:
+                raise ValueError(f"Task {t.name!r} depends on unknown task(s) {sorted(missing)}.")
+        # Kahn's algorithm: whatever can't be ordered is on a cycle
+        remaining = {t.name: set(t.depends_on) for t in tasks}
+        while True:
+            ready = [n for n, deps in remaining.items() if not deps]
+            if not ready:
+                break
+            for n in ready:
+                del remaining[n]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        if remaining:
+            raise ValueError(f"Dependency cycle between {sorted(remaining)}.")
+
+    def run(self, tasks, raise_on_error: bool = True) -> dict:
+        """
+        Run `tasks` and return ``{name: result}`` of those that succeeded.
+
+        With `raise_on_error`, :class:`JobFailed` is raised once every task
+        that could run has finished, if any failed. Tasks skipped because a
+        dependency failed are listed in its `errors` too.
+        """
+        tasks = list(tasks)
+        self._check(tasks)
+        waiting = {t.name: t for t in tasks}
+        results, errors = {}, {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while waiting or running:
+                for name, task in list(waiting.items()):
+                    failed = [d for d in task.depends_on if d in errors]
+                    if failed:
+                        errors[name] = RuntimeError(f"Skipped, dependency {failed[0]!r} failed.")
+                        del waiting[name]
+                    elif all(d in results for d in task.depends_on):
+                        running[executor.submit(self.run_task, task)] = name
+                        del waiting[name]
+                if not running:
+                    # only tasks skipped above were left
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors[name] = e
+
+        if errors and raise_on_error:
+            raise JobFailed(errors, results)
+        return results
@@ -0,0 +1,550 @@
+"""
+Streaming JSON / NDJSON reader into columnar batches.
+
+Vendor feeds are multi-GB, either one nested document or one record per line
+(NDJSON). A document is scanned incrementally: only the records selected by a
+path such as ``glossary.GlossDiv.GlossList.GlossEntry`` are ever decoded, and
+everything around them is skipped over. NDJSON files are split into byte
+ranges that worker processes read independently.
+
+Records are flattened (``GlossDef.para``) and collected into pandas or Arrow
+batches of `batch_size` rows, so memory depends on the batch size and not on
+the file size.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+CHUNK_SIZE = 1 << 20
+BLOCK_SIZE = 64 << 20
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# a complete string literal, a string cut off by the end of the buffer, or a bracket
+_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|"|[\[\]{}]', re.DOTALL)
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(r'[^,\]}\s]+')
+_STEP = re.compile(r'([^.\[\]]+)|\[(\*|\d+)\]')
+
+
+def parse_path(path) -> tuple:
+    """
+    Steps of a JSONPath-like expression.
+
+    Keys are separated by dots; ``[*]`` or ``*`` is every element of an
+    array and ``[n]`` one element. A leading ``$`` is allowed, e.g.
+    ``$.feed.items[*].sku`` -> ``('feed', 'items', '*', 'sku')``.
+    """
+    if path is None or isinstance(path, (list, tuple)):
+        return tuple(path or ())
+    path = path.strip()
+    if path.startswith('$'):
+        path = path[1:]
+    steps, pos = [], 0
+    while pos < len(path):
+        if path[pos] == '.':
+            pos += 1
+            continue
+        match = _STEP.match(path, pos)
+        if match is None:
+            raise ValueError(f"Bad path {path!r} at position {pos}.")
+        key, index = match.groups()
+        if index is None:
+            steps.append(key)
+        else:
+            steps.append('*' if index == '*' else int(index))
+        pos = match.end()
+    return tuple(steps)
+
+
+def select(value, steps):
+    """Values at `steps` (see :func:`parse_path`) inside an already decoded `value`."""
+    if not steps:
+        yield value
+        return
+    step, rest = steps[0], steps[1:]
+    if step == '*':
+        if isinstance(value, list):
+            for item in value:
+                yield from select(item, rest)
+    elif isinstance(step, int):
+        if isinstance(value, list) and -len(value) <= step < len(value):
+            yield from select(value[step], rest)
+    elif isinstance(value, dict) and step in value:
+        yield from select(value[step], rest)
+
+
+class _Scanner:
+    """Incremental walk over a text stream, keeping only the unread tail in memory."""
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r}, got {self.peek()!r}.")
+        self.pos += 1
+
+    def _match(self, pattern):
+        # a match running into the end of the buffer may continue in the next chunk
+        while True:
+            match = pattern.match(self.buf, self.pos)
+            if match is not None and (match.end() < len(self.buf) or self.eof):
+                return match
+            if not self.fill() and match is None:
+                raise ValueError(f"Truncated JSON near {self.buf[self.pos:self.pos + 40]!r}.")
+
+    def string(self) -> str:
+        self.peek()
+        match = self._match(_STRING)
+        self.pos = match.end()
+        return self.decoder.decode(match.group())
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number is only complete once a delimiter follows it: "-2" may be "-2.5e3"
+            if (self.eof or self.buf[self.pos] in '{["tfnNI'
+                    or (end < len(self.buf) and self.buf[end] in ' \t\n\r,]}')):
+                self.pos = end
+                return value
+            if not self.fill():
+                self.pos = end
+                return value
+
+    def skip(self):
+        """Move past the next value without decoding it."""
+        char = self.peek()
+        if char == '"':
+            self.pos = self._match(_STRING).end()
+        elif char in '{[':
+            depth = 0
+            while True:
+                match = _STRUCTURE.search(self.buf, self.pos)
+                if match is None or match.group() == '"':
+                    # keep an unfinished string, drop everything before it
+                    self.pos = len(self.buf) if match is None else match.start()
+                    if not self.fill():
+                        raise ValueError("Truncated JSON.")
+                    continue
+                self.pos = match.end()
+                token = match.group()
+                if token in '{[':
+                    # decoding and dropping is much faster than stepping through
+                    # brackets in Python, but only for values that fit in the buffer
+                    try:
+                        _, end = self.decoder.raw_decode(self.buf, match.start())
+                    except json.JSONDecodeError:
+                        depth += 1
+                    else:
+                        self.pos = end
+                        if depth == 0:
+                            return
+                elif token in '}]':
+                    depth -= 1
+                    if depth == 0:
+                        return
+        elif char:
+            self.pos = self._match(_SCALAR).end()
+
+    def walk(self, steps):
+        """Decoded values at `steps` below the value at the current position."""
+        if not steps:
+            yield self.value()
+            return
+        step, rest = steps[0], steps[1:]
+        char = self.peek()
+        if char == '{' and isinstance(step, str) and step != '*':
+            self.pos += 1
+            while self.peek() != '}':
+                key = self.string()
+                self.expect(':')
+                if key == step:
+                    yield from self.walk(rest)
+                else:
+                    self.skip()
+                if self.peek() == ',':
+                    self.pos += 1
+            self.pos += 1
+        elif char == '[' and (step == '*' or isinstance(step, int)):
+            self.pos += 1
+            index = 0
+            while self.peek() != ']':
+                if step == '*' or step == index:
+                    yield from self.walk(rest)
+                else:
+                    self.skip()
+                index += 1
+                if self.peek() == ',':
+                    self.pos += 1
+            self.pos += 1
+        else:
+            self.skip()
+
+
+def _ijson_prefix(steps):
+    if any(isinstance(s, int) for s in steps):
+        return None
+    return '.'.join('item' if s == '*' else s for s in steps)
+
+
+def iter_records(source, path=None, backend: str = 'auto', chunk_size: int = CHUNK_SIZE):
+    """
+    Yield the records at `path` in a JSON document, reading it incrementally.
+
+    Parameters
+    ----------
+    source : str or file
+        Path of the document, or an open text (or, for ijson, binary) file.
+    path : str or tuple
+        See :func:`parse_path`. Empty yields the whole document; ending on an
+        array yields it as one record, add ``[*]`` for its elements.
+    backend : {'auto', 'ijson', 'python'}
+        ``ijson`` (its C backend, if installed) or the pure-Python scanner.
+        ``auto`` uses ijson when it is installed and `path` has no ``[n]``.
+    chunk_size : int
+        Characters read at a time by the Python scanner.
+
+    Examples
+    --------
+    >>> list(iter_records('data.json', 'glossary.GlossDiv.GlossList.GlossEntry'))
+    [{'ID': 'SGML', 'SortAs': 'SGML', ...}]
+    """
+    steps = parse_path(path)
+    if backend not in ('auto', 'ijson', 'python'):
+        raise ValueError(f"backend must be 'auto', 'ijson' or 'python', not {backend!r}.")
+    if backend == 'auto':
+        try:
+            import ijson  # noqa: F401
+            backend = 'ijson' if _ijson_prefix(steps) is not None else 'python'
+        except ImportError:
+            backend = 'python'
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb' if backend == 'ijson' else 'r', encoding=None if backend == 'ijson' else 'utf-8') as f:
+            yield from iter_records(f, steps, backend, chunk_size)
+        return
+
+    if backend == 'ijson':
+        import ijson
+        prefix = _ijson_prefix(steps)
+        if prefix is None:
+            raise ValueError("The ijson backend doesn't support [n] steps.")
+        yield from ijson.items(source, prefix, use_float=True)
+    else:
+        scanner = _Scanner(source, chunk_size)
+        while scanner.peek():
+            # concatenated documents are read one after the other
+            yield from scanner.walk(steps)
+
+
+def flatten(record, sep: str = '.', max_level: int = None) -> dict:
+    """
+    One flat row of a nested record: ``{'GlossDef': {'para': x}}`` ->
+    ``{'GlossDef.para': x}``. Lists are kept as values.
+    """
+    row = {}
+
+    def visit(value, prefix, level):
+        if isinstance(value, dict) and value and (max_level is None or level < max_level):
+            for key, item in value.items():
+                visit(item, f"{prefix}{sep}{key}" if prefix else str(key), level + 1)
+        else:
+            row[prefix or 'value'] = value
+    visit(record, '', 0)
+    return row
+
+
+def _cast(table, schema):
+    import pyarrow as pa
+
+    if isinstance(schema, pa.Schema):
+        fields, keep = schema, True
+    else:
+        fields, keep = [pa.field(name, pa.type_for_alias(t) if isinstance(t, str) else t)
+                        for name, t in (schema or {}).items()], False
+    for field in fields:
+        if field.name not in table.column_names:
+            table = table.append_column(field, pa.nulls(table.num_rows, field.type))
+        elif table.schema.field(field.name).type != field.type:
+            table = table.set_column(table.column_names.index(field.name), field,
+                                     table[field.name].cast(field.type))
+    return table.select(schema.names) if keep else table
+
+
+def _flatten_structs(table, sep):
+    names, columns = [], []
+
+    def visit(name, column):
+        import pyarrow as pa
+
+        if pa.types.is_struct(column.type) and column.type.num_fields:
+            for field, child in zip(column.type, column.flatten()):
+                visit(f"{name}{sep}{field.name}", child)
+        else:
+            names.append(name)
+            columns.append(column)
+    for name, column in zip(table.column_names, table.columns):
+        visit(name, column)
+    return table.from_arrays(columns, names=names)
+
+
+def _column(values, type_=None):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed types, e.g. a number on one line and text on the next: keep the text
+        text = pa.array([v if v is None or isinstance(v, str) else json.dumps(v) for v in values],
+                        pa.string())
+        return text if type_ is None else text.cast(type_)
+
+
+def to_batch(rows, schema=None, as_arrow: bool = False):
+    """
+    DataFrame or `pyarrow.Table` of flat `rows`.
+
+    `schema` is a `pyarrow.Schema`, giving the columns and their types, or
+    ``{column: arrow type name}`` for some of them. Declared columns get
+    that type (and are present even if no row has them), so batches read
+    separately line up; other columns are inferred. A column whose values
+    have mixed types is read as strings, with non-strings JSON-encoded.
+    """
+    import pyarrow as pa
+
+    if isinstance(schema, pa.Schema):
+        names, declared = schema.names, {f.name: f.type for f in schema}
+    else:
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        declared = {name: pa.type_for_alias(t) if isinstance(t, str) else t
+                    for name, t in (schema or {}).items()}
+        names += [name for name in declared if name not in names]
+    arrays = [_column([row.get(name) for row in rows], declared.get(name)) for name in names]
+    table = pa.Table.from_arrays(arrays, names=names)
+    return table if as_arrow else table.to_pandas()
+
+
+def _batches(records, batch_size, schema, as_arrow, sep):
+    records = iter(records)
+    while True:
+        rows = [flatten(r, sep) for r in islice(records, batch_size)]
+        if not rows:
+            return
+        yield to_batch(rows, schema, as_arrow)
+
+
+def iter_batches(source, path=None, batch_size: int = 100_000, schema=None,
+                 as_arrow: bool = False, sep: str = '.', backend: str = 'auto'):
+    """
+    Flattened records at `path` of a JSON document, `batch_size` rows at a time.
+
+    See :func:`iter_records` for `source`, `path` and `backend` and
+    :func:`to_batch` for `schema` and `as_arrow`.
+    """
+    yield from _batches(iter_records(source, path, backend), batch_size, schema, as_arrow, sep)
+
+
+def ndjson_ranges(path: str, block_size: int = BLOCK_SIZE) -> list:
+    """
+    ``(start, end)`` byte ranges of about `block_size` covering `path`.
+
+    A range owns the lines that start inside it, so ranges can be cut
+    anywhere and read independently.
+    """
+    size = os.path.getsize(path)
+    return [(lo, min(lo + block_size, size)) for lo in range(0, size, block_size)] or [(0, 0)]
+
+
+def _range_bytes(path: str, start: int, end: int) -> bytes:
+    # the lines starting in [start, end)
+    with open(path, 'rb') as f:
+        if start:
+            # finish the line running into the range; it belongs to the previous one
+            f.seek(start - 1)
+            f.readline()
+        first = f.tell()
+        if first >= end:
+            return b''
+        data = f.read(end - first)
+        if not data.endswith(b'\n'):
+            data += f.readline()
+    return data
+
+
+def iter_ndjson_range(path: str, start: int, end: int, steps=()):
+    """Records at `steps` of the lines of `path` starting in ``[start, end)``."""
+    for line in _range_bytes(path, start, end).splitlines():
+        if line.strip():
+            yield from select(json.loads(line), steps)
+
+
+def _read_range(args):
+    import pyarrow as pa
+    import pyarrow.json
+
+    path, start, end, steps, schema, sep = args
+    data = _range_bytes(path, start, end)
+    if not data.strip():
+        return None
+    table = None
+    if not steps:
+        # whole lines as records: Arrow's own JSON reader, several times faster
+        try:
+            table = pa.json.read_json(pa.BufferReader(data))
+        except pa.ArrowInvalid:
+            # e.g. a field that is a number on one line and a string on another
+            pass
+        else:
+            table = _cast(_flatten_structs(table, sep), schema)
+    if table is None:
+        rows = [flatten(r, sep) for line in data.splitlines() if line.strip()
+                for r in select(json.loads(line), steps)]
+        if not rows:
+            return None
+        table = to_batch(rows, schema, as_arrow=True)
+    # Arrow's IPC format pickles much faster than a list of batches
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def iter_ndjson(path: str, path_expr=None, schema=None, as_arrow: bool = False, sep: str = '.',
+                processes: int = None, block_size: int = BLOCK_SIZE):
+    """
+    Flattened records of an NDJSON file, one batch per byte range, in file order.
+
+    Ranges are read by a process pool, at most ``2 * processes`` in flight,
+    so memory stays around that many ranges' worth of rows.
+
+    Parameters
+    ----------
+    path : str
+        The NDJSON file.
+    path_expr : str or tuple
+        Records within each line (see :func:`parse_path`), e.g.
+        ``'order.lines[*]'``; by default each line is one record.
+    schema : pyarrow.Schema or dict
+        See :func:`to_batch`. Declaring types keeps ranges consistent.
+    as_arrow : bool
+        Yield `pyarrow.Table` instead of DataFrame.
+    processes : int
+        Worker processes, ``os.cpu_count()`` by default; 1 reads in this process.
+    block_size : int
+        Bytes per range.
+    """
+    import pyarrow as pa
+
+    steps = parse_path(path_expr)
+    jobs = [(path, lo, hi, steps, schema, sep) for lo, hi in ndjson_ranges(path, block_size)]
+    processes = processes or os.cpu_count() or 1
+
+    def convert(buf):
+        table = pa.ipc.open_stream(buf).read_all()
+        return table if as_arrow else table.to_pandas()
+
+    if processes == 1 or len(jobs) == 1:
+        for job in jobs:
+            buf = _read_range(job)
+            if buf is not None:
+                yield convert(buf)
+        return
+
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = [executor.submit(_read_range, job) for job in islice(jobs, 2 * processes)]
+        while pending:
+            buf = pending.pop(0).result()
+            pending.extend(executor.submit(_read_range, job) for job in islice(jobs, 1))
+            if buf is not None:
+                yield convert(buf)
+
+
+def _concat(tables):
+    """
+    Concatenate tables read separately, e.g. per byte range or batch.
+
+    A column missing or all-null in some tables takes the type seen in the
+    others, and numeric types are widened. A column that is e.g. a number in
+    one table and text in another is read as strings, with non-strings
+    JSON-encoded, as :func:`to_batch` does within a batch.
+    """
+    import pyarrow as pa
+
+    try:
+        return pa.concat_tables(tables, promote_options='permissive')
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    types = {}
+    for table in tables:
+        for field in table.schema:
+            if not pa.types.is_null(field.type):
+                types.setdefault(field.name, set()).add(field.type)
+    conflicting = set()
+    for name, seen in types.items():
+        try:
+            pa.unify_schemas([pa.schema([(name, t)]) for t in seen], promote_options='permissive')
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            conflicting.add(name)
+
+    def as_text(column):
+        return pa.array([v if v is None or isinstance(v, str) else json.dumps(v, default=str)
+                         for v in column.to_pylist()], pa.string())
+
+    unified = []
+    for table in tables:
+        for name in conflicting & set(table.column_names):
+            table = table.set_column(table.column_names.index(name), name, as_text(table[name]))
+        unified.append(table)
+    return pa.concat_tables(unified, promote_options='permissive')
+
+
+def read_ndjson(path: str, path_expr=None, schema=None, as_arrow: bool = False, **kwargs):
+    """All of :func:`iter_ndjson` in one DataFrame or `pyarrow.Table`."""
+    tables = list(iter_ndjson(path, path_expr, schema, as_arrow=True, **kwargs))
+    table = _concat(tables) if tables else to_batch([], schema, as_arrow=True)
+    return table if as_arrow else table.to_pandas()
+
+
+def read_json(source, path=None, schema=None, as_arrow: bool = False, **kwargs):
+    """All of :func:`iter_batches` in one DataFrame or `pyarrow.Table`."""
+    tables = list(iter_batches(source, path, schema=schema, as_arrow=True, **kwargs))
+    table = _concat(tables) if tables else to_batch([], schema, as_arrow=True)
+    return table if as_arrow else table.to_pandas()
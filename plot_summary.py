@@ -0,0 +1,358 @@
+"""
+Distribution and pair plots of large extracts, drawn from streamed summaries.
+
+The data is read once, chunk by chunk, into fixed-size summaries: a fine
+histogram per column (from which coarser histograms, quantiles, box stats and
+a binned KDE are derived), 2-D bin counts per column pair and a reservoir
+sample of rows for scatter plots. Plots are then drawn from the summaries, so
+neither memory nor render time grows with the number of rows.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def iter_chunks(source, columns, chunksize: int = 1_000_000):
+    """
+    Yield DataFrame chunks of `columns` from `source`.
+
+    `source` is a DataFrame, a Parquet file or directory of Parquet files, a
+    callable returning an iterable of DataFrames (e.g. a lambda around
+    ``DataHelper.query(sql, chunksize=...)``), or such an iterable itself.
+    """
+    if isinstance(source, pd.DataFrame):
+        for lo in range(0, len(source), chunksize):
+            yield source.iloc[lo:lo + chunksize][columns]
+    elif isinstance(source, (str, os.PathLike)):
+        import pyarrow.parquet as pq
+
+        for path in _parquet_files(source):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+    else:
+        for chunk in (source() if callable(source) else source):
+            yield chunk[columns]
+
+
+def _parquet_files(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.parquet'))
+    return [path]
+
+
+def parquet_ranges(path, columns) -> dict:
+    """``{column: (min, max)}`` from Parquet row group statistics, without reading the data."""
+    import pyarrow.parquet as pq
+
+    ranges = {}
+    for file in _parquet_files(path):
+        meta = pq.ParquetFile(file).metadata
+        names = [meta.schema.column(i).name for i in range(meta.num_columns)]
+        for g in range(meta.num_row_groups):
+            group = meta.row_group(g)
+            for c in columns:
+                stats = group.column(names.index(c)).statistics
+                if stats is not None and stats.has_null_count and stats.null_count == group.num_rows:
+                    # all null, so the writer has no min/max and nothing to bound
+                    continue
+                if stats is None or not stats.has_min_max:
+                    raise ValueError(f"No statistics for column {c!r} in {file}.")
+                lo, hi = ranges.get(c, (stats.min, stats.max))
+                ranges[c] = (min(lo, stats.min), max(hi, stats.max))
+    missing = [c for c in columns if c not in ranges]
+    if missing:
+        raise ValueError(f"No values for columns {missing} in {path}.")
+    return {c: (float(lo), float(hi)) for c, (lo, hi) in ranges.items()}
+
+
+class StreamingSummary:
+    """
+    Fixed-size summary of numeric columns, updated chunk by chunk.
+
+    Parameters
+    ----------
+    ranges : dict
+        ``{column: (min, max)}`` of the fine histograms. Values outside are
+        counted in the edge bins, so use the data's range, e.g. from
+        :func:`parquet_ranges`.
+    bins : int
+        Fine histogram bins per column. Quantiles are exact to within one
+        fine bin, ``(max - min) / bins``.
+    pairs : sequence of (str, str)
+        Column pairs to count on a 2-D grid, for joint plots.
+    pair_bins : int
+        Bins per axis of the 2-D grids.
+    sample_size : int
+        Rows kept in the uniform reservoir sample, for scatter plots and
+        box plot fliers.
+    seed : int
+        Seed of the reservoir sampling.
+    """
+
+    def __init__(self, ranges: dict, bins: int = 4096, pairs=(), pair_bins: int = 200,
+                 sample_size: int = 10_000, seed: int = 0):
+        self.columns = list(ranges)
+        self.ranges = {c: (float(lo), float(hi) if hi > lo else float(lo) + 1.0)
+                       for c, (lo, hi) in ranges.items()}
+        self.bins = bins
+        self.counts = {c: np.zeros(bins, dtype='int64') for c in self.columns}
+        self.n = {c: 0 for c in self.columns}
+        self.nulls = {c: 0 for c in self.columns}
+        self.sum = {c: 0.0 for c in self.columns}
+        self.sumsq = {c: 0.0 for c in self.columns}
+        self.min = {c: np.inf for c in self.columns}
+        self.max = {c: -np.inf for c in self.columns}
+        self.pairs = [tuple(p) for p in pairs]
+        self.pair_bins = pair_bins
+        self.pair_counts = {p: np.zeros((pair_bins, pair_bins), dtype='int64') for p in self.pairs}
+        self.sample_size = sample_size
+        self.rows = 0
+        self._sample = np.empty((0, len(self.columns)))
+        self._rng = np.random.default_rng(seed)
+
+    def edges(self, column: str, bins: int = None) -> np.ndarray:
+        lo, hi = self.ranges[column]
+        return np.linspace(lo, hi, (bins or self.bins) + 1)
+
+    def _bin(self, column, values, bins):
+        lo, hi = self.ranges[column]
+        index = ((values - lo) * (bins / (hi - lo))).astype('int64')
+        return np.clip(index, 0, bins - 1)
+
+    def update(self, chunk: pd.DataFrame):
+        """Add the rows of `chunk`."""
+        values = chunk[self.columns].to_numpy(dtype='float64', na_value=np.nan)
+        for j, c in enumerate(self.columns):
+            x = values[:, j]
+            x = x[np.isfinite(x)]
+            self.nulls[c] += len(values) - len(x)
+            if not len(x):
+                continue
+            self.counts[c] += np.bincount(self._bin(c, x, self.bins), minlength=self.bins)
+            self.n[c] += len(x)
+            self.sum[c] += x.sum()
+            self.sumsq[c] += np.square(x).sum()
+            self.min[c] = min(self.min[c], x.min())
+            self.max[c] = max(self.max[c], x.max())
+
+        for x, y in self.pairs:
+            xy = values[:, [self.columns.index(x), self.columns.index(y)]]
+            xy = xy[np.isfinite(xy).all(axis=1)]
+            flat = (self._bin(x, xy[:, 0], self.pair_bins) * self.pair_bins
+                    + self._bin(y, xy[:, 1], self.pair_bins))
+            self.pair_counts[(x, y)] += np.bincount(flat, minlength=self.pair_bins ** 2).reshape(
+                self.pair_bins, self.pair_bins)
+
+        self._reservoir(values)
+        self.rows += len(values)
+
+    def _reservoir(self, values):
+        # algorithm R, vectorized: row i of the stream replaces a random slot with
+        # probability k / (i + 1); later rows overwrite earlier ones in order
+        k, seen = self.sample_size, self.rows
+        fill = min(max(k - len(self._sample), 0), len(values))
+        if fill:
+            self._sample = np.vstack([self._sample, values[:fill]])
+        rest = values[fill:]
+        if not len(rest):
+            return
+        position = seen + fill + np.arange(len(rest))
+        slot = (self._rng.random(len(rest)) * (position + 1)).astype('int64')
+        keep = slot < k
+        self._sample[slot[keep]] = rest[keep]
+
+    @property
+    def sample(self) -> pd.DataFrame:
+        return pd.DataFrame(self._sample, columns=self.columns)
+
+    def histogram(self, column: str, bins: int = 64):
+        """``(counts, edges)`` with `bins` bins, which must divide the fine bin count."""
+        if self.bins % bins:
+            raise ValueError(f"bins must divide {self.bins}, got {bins}.")
+        return self.counts[column].reshape(bins, -1).sum(axis=1), self.edges(column, bins)
+
+    def quantiles(self, column: str, q) -> np.ndarray:
+        """Quantiles interpolated within the fine histogram."""
+        counts = self.counts[column]
+        cumulative = np.concatenate([[0], np.cumsum(counts)])
+        target = np.asarray(q, dtype='float64') * cumulative[-1]
+        edges = self.edges(column)
+        result = np.interp(target, cumulative, edges)
+        return np.clip(result, self.min[column], self.max[column])
+
+    def mean(self, column: str) -> float:
+        """Mean of the non-null values, NaN if there are none."""
+        n = self.n[column]
+        return self.sum[column] / n if n else float('nan')
+
+    def std(self, column: str) -> float:
+        """Sample standard deviation of the non-null values, NaN if there are none."""
+        n = self.n[column]
+        if not n:
+            return float('nan')
+        var = (self.sumsq[column] - self.sum[column] ** 2 / n) / max(n - 1, 1)
+        return float(np.sqrt(max(var, 0.0)))
+
+    def box_stats(self, column: str, whis: float = 1.5) -> dict:
+        """Box plot statistics in the format of `matplotlib.cbook.boxplot_stats`."""
+        q1, med, q3 = self.quantiles(column, [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        low, high = q1 - whis * iqr, q3 + whis * iqr
+        # whiskers end at the data's min/max, or else at the most extreme
+        # non-empty fine bin inside the fences
+        edges = self.edges(column)
+        inside = (self.counts[column] > 0) & (edges[1:] >= low) & (edges[:-1] <= high)
+        lo, hi = self.min[column], self.max[column]
+        whislo = lo if lo >= low or not inside.any() else max(low, edges[:-1][inside].min())
+        whishi = hi if hi <= high or not inside.any() else min(high, edges[1:][inside].max())
+        sample = self._sample[:, self.columns.index(column)]
+        sample = sample[np.isfinite(sample)]
+        return {'label': column, 'mean': self.mean(column), 'med': med, 'q1': q1, 'q3': q3,
+                'iqr': iqr, 'whislo': whislo, 'whishi': whishi,
+                # only a sample of the outliers: drawing all of them is what doesn't scale
+                'fliers': sample[(sample < low) | (sample > high)]}
+
+    def kde(self, column: str, points: int = 512, bw: float = None):
+        """
+        ``(grid, density)`` of a Gaussian KDE binned on the fine histogram.
+
+        The default bandwidth is Scott's rule, as in `scipy.stats.gaussian_kde`.
+        """
+        n, std = self.n[column], self.std(column)
+        if bw is None:
+            bw = std * n ** (-1 / 5) if std > 0 else 1.0
+        lo, hi = self.ranges[column]
+        width = (hi - lo) / self.bins
+        radius = int(np.ceil(4 * bw / width))
+        kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) * width / bw) ** 2) / (bw * np.sqrt(2 * np.pi))
+        # each fine bin is a point mass at its center; padding keeps the tails past the range
+        density = np.convolve(np.pad(self.counts[column], radius), kernel, mode='same') / n
+        centers = lo + (np.arange(self.bins + 2 * radius) - radius + 0.5) * width
+        grid = np.linspace(centers[0], centers[-1], points)
+        return grid, np.interp(grid, centers, density)
+
+    def violin_stats(self, column: str, points: int = 100) -> dict:
+        """Violin statistics in the format of `matplotlib.cbook.violin_stats`."""
+        grid, density = self.kde(column, points)
+        return {'coords': grid, 'vals': density, 'mean': self.mean(column),
+                'median': float(self.quantiles(column, 0.5)),
+                'min': self.min[column], 'max': self.max[column]}
+
+    def counts2d(self, x: str, y: str):
+        """``(counts, x_edges, y_edges)`` of a column pair."""
+        return self.pair_counts[(x, y)], self.edges(x, self.pair_bins), self.edges(y, self.pair_bins)
+
+
+def summarize(source, columns, ranges: dict = None, chunksize: int = 1_000_000, **kwargs) -> StreamingSummary:
+    """
+    Stream `source` (see :func:`iter_chunks`) into a :class:`StreamingSummary`.
+
+    Without `ranges`, Parquet sources take them from their statistics and
+    other sources are read twice, so a one-shot iterator needs `ranges`.
+    Other arguments go to :class:`StreamingSummary`.
+
+    Examples
+    --------
+    >>> dh.query_to_parquet(dh.query_string_all(), '/tmp/fact_sales.parquet')
+    >>> summary = summarize('/tmp/fact_sales.parquet', ['sales_units', 'price_per_unit'],
+    ...                     pairs=[('price_per_unit', 'sales_units')])
+    >>> plot_hist(summary, 'sales_units', kde=True)
+    """
+    columns = list(columns)
+    if ranges is None:
+        if isinstance(source, (str, os.PathLike)):
+            ranges = parquet_ranges(source, columns)
+        else:
+            lo = pd.Series(np.inf, index=columns)
+            hi = pd.Series(-np.inf, index=columns)
+            for chunk in iter_chunks(source, columns, chunksize):
+                lo = np.fmin(lo, chunk.min())
+                hi = np.fmax(hi, chunk.max())
+            ranges = {c: (lo[c], hi[c]) for c in columns}
+    summary = StreamingSummary({c: ranges[c] for c in columns}, **kwargs)
+    for chunk in iter_chunks(source, columns, chunksize):
+        summary.update(chunk)
+    return summary
+
+
+def _axes(ax):
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    return ax
+
+
+def plot_hist(summary: StreamingSummary, column: str, bins: int = 64, kde: bool = False, ax=None):
+    """Histogram of `column`, like ``sns.distplot(df[column], bins=bins, kde=kde)``."""
+    ax = _axes(ax)
+    counts, edges = summary.histogram(column, bins)
+    if kde:
+        density = counts / (counts.sum() * np.diff(edges))
+        # pre-binned counts drawn through hist(weights=), which any matplotlib has
+        ax.hist(edges[:-1], bins=edges, weights=density, alpha=0.4)
+        ax.plot(*summary.kde(column))
+    else:
+        ax.hist(edges[:-1], bins=edges, weights=counts)
+    ax.set_xlabel(column)
+    return ax
+
+
+def plot_box(summary: StreamingSummary, columns, ax=None, **kwargs):
+    """Box plots of `columns` with `Axes.bxp`; fliers come from the reservoir sample."""
+    ax = _axes(ax)
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    ax.bxp([summary.box_stats(c) for c in columns], **kwargs)
+    return ax
+
+
+def plot_violin(summary: StreamingSummary, columns, ax=None, **kwargs):
+    """Violin plots of `columns` with `Axes.violin`, from binned KDEs."""
+    ax = _axes(ax)
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    ax.violin([summary.violin_stats(c) for c in columns], showmedians=True, **kwargs)
+    ax.set_xticks(range(1, len(columns) + 1))
+    ax.set_xticklabels(columns)
+    return ax
+
+
+def plot_joint(summary: StreamingSummary, x: str, y: str, ax=None, log: bool = True, cmap='Greens'):
+    """2-D bin counts of a column pair, in place of ``sns.jointplot(kind='hex')``."""
+    from matplotlib.colors import LogNorm
+
+    ax = _axes(ax)
+    counts, x_edges, y_edges = summary.counts2d(x, y)
+    masked = np.ma.masked_equal(counts.T, 0)
+    ax.pcolormesh(x_edges, y_edges, masked, cmap=cmap, norm=LogNorm() if log else None)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    return ax
+
+
+def plot_pairs(summary: StreamingSummary, columns=None, bins: int = 64, **scatter_kwargs):
+    """
+    Pair grid of `columns`: histograms on the diagonal and scatter plots of
+    the reservoir sample elsewhere, in place of ``PairGrid.map(plt.scatter)``.
+    """
+    import matplotlib.pyplot as plt
+
+    columns = list(columns or summary.columns)
+    sample = summary.sample
+    k = len(columns)
+    fig, axes = plt.subplots(k, k, figsize=(2.5 * k, 2.5 * k), squeeze=False)
+    scatter_kwargs.setdefault('s', 4)
+    scatter_kwargs.setdefault('alpha', 0.5)
+    for i, y in enumerate(columns):
+        for j, x in enumerate(columns):
+            ax = axes[i, j]
+            if i == j:
+                plot_hist(summary, x, bins=bins, ax=ax)
+            else:
+                ax.scatter(sample[x], sample[y], **scatter_kwargs)
+            ax.set_xlabel(x if i == k - 1 else '')
+            ax.set_ylabel(y if j == 0 else '')
+    return fig
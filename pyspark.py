@@ -10,19 +10,25 @@ import re
 
 
 # load csv files
+from csv_ingest import CsvIngest
 
-def load_sales(retailers):
+def load_sales(retailers, schema=None):
+  # every csv in each retailer's Sales folder (not its subfolders) is read in one pass. the schema is declared
+  # or inferred once per retailer and cached, instead of inferSchema scanning the data twice
   sales_file = {}
   path = '/mnt/Americas/Conformed/NA/US/Sales/Ecom/'
+  dbfs_root = '/dbfs{}'.format(path)
+  ingest = CsvIngest(backend='spark', spark=spark, schema_cache_dir=os.path.join(dbfs_root, '_schemas'))
   for retail in retailers:
-    dbfs_root = '/dbfs{}'.format(path)
     sales_path = os.path.join(dbfs_root, retail, 'Sales')
-#     if the file exist
-    if len(glob.glob(os.path.join(sales_path, '*.csv')))==1:
-      sales_file[retail] = spark.read.csv(os.path.join(path, retail, 'Sales', '*.csv'), header=True, inferSchema=True)
-    else: 
-      print('{} has no or more than one sales data updated or updated is not csv format'.format(retail))
-  return sales_file   
+    files = ingest.discover(sales_path) if os.path.isdir(sales_path) else []
+    if files:
+      # list files through the dbfs fuse mount, read them through spark
+      spark_paths = [os.path.join(path, retail, 'Sales', os.path.relpath(f, sales_path)) for f in files]
+      sales_file[retail] = ingest.read(spark_paths, name=retail, schema=schema)
+    else:
+      print('{} has no sales data updated or updated is not csv format'.format(retail))
+  return sales_file
 
 
 # read multiple datasource
@@ -31,13 +37,12 @@ cat_file=load_cat(retailers)
 sales_file = load_sales(retailers)
 
 # Use RE to cleanup the cell values
+from column_names import sanitize_columns
 
 def cleanup_col(retailer:str, file = 'sales_file'):
-  col = []
-  old_col = eval(file)[retailer].columns
-  for i in range(len(old_col)):
-    col.append(re.sub('\W', '', eval(file)[retailer].columns[i]))
-  eval(file)[retailer] = eval(file)[retailer].toDF(*col)
+  # one toDF projection; the old -> new mapping is cached per source schema
+  frames = globals()[file]
+  frames[retailer] = sanitize_columns(frames[retailer])
   
 # spark df display
 sales_file['Target'].limit(100).display()
@@ -61,10 +66,11 @@ result1.display()
 
 # this cell is to find the first one in the group. 
 # for example, if we want to only keep the most frequent TCIN for a same product name, the code will be like below
-window = Window.partitionBy("Product_Name").orderBy(desc('count'))
- 
-result1.withColumn('rank', rank().over(window))\
- .filter(col('rank') == 1).drop('rank')\
+# top_k_per_group does it in one aggregation instead of a window over every partition;
+# ties='all' keeps every TCIN tied for the top count, like rank() == 1
+from top_k import top_k_per_group
+
+top_k_per_group(result1, 'Product_Name', 'count', ties='all')\
  .display()
 
 
@@ -81,6 +87,11 @@ user_schema = st.StructType([
 
 walmart_sdf = spark.createDataFrame(walmart.loc[1:,:4], schema = user_schema)
 
+# or send the frame as arrow batches with the types declared up front, instead of
+# pickling it row by row as strings and casting afterwards
+from spark_arrow import to_spark
+walmart_sdf = to_spark(spark, walmart.loc[1:,:4], columns=col[:5], schema={'Dim_WmItemNbr': 'int32'})
+
 # change column data type
 wsdf = walmart_sdf.withColumn('upc',walmart_sdf['Dim_WmItemNbr'].cast(IntegerType()))
 wsdf.columns
@@ -0,0 +1,285 @@
+"""
+Parameterized builder for the `fact_sales` extract queries.
+
+Filter values are bound as parameters instead of pasted into the SQL, so the
+statement text only depends on which filters are used. That lets the same
+text be prepared once per connection and executed with different values.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import hashlib
+import weakref
+
+import psycopg2.extensions
+
+GSK_VENDORS = ('GLAXOSMITHKLINE', 'GSK', 'GLAXOSMITHKLINE CONSUMER HEALTHCARE',
+               'GLAXOSMITHKL.C.H.', 'GSK (GREAT BRITAIN)')
+
+# select lists of `DataHelper.load_market_category` and `load_market_category_all`
+MARKET_CATEGORY_COLUMNS = (
+    'this_category.*',
+    'this_geo.geography_id',
+    'this_geo.channel_name',
+    'this_geo.retailer_name',
+    'this_geo.format_name',
+    'this_geo.segment_name',
+    'time_period_start',
+    'time_period_end',
+    'nrf_calendar_date',
+    'period',
+    'sales_revenue',
+    'sales_units',
+    'sales_revenue_incremental',
+    'sales_units_incremental',
+    'acv_weighted_distribution',
+    'price_per_unit',
+    'price_per_unit_promo',
+    'price_per_unit_non_promo',
+    'price_effective_price',
+    'cost_amount',
+)
+MARKET_CATEGORY_ALL_COLUMNS = (
+    'this_category.*',
+    'this_geo.geography_id',
+    'this_geo.channel_name',
+    'this_geo.retailer_name',
+    'this_geo.format_name',
+    'this_geo.segment_name',
+    'time_period_start',
+    'time_period_end',
+    'sales_revenue',
+    'sales_units',
+    'nrf_calendar_date',
+    'sales_revenue_incremental',
+    'sales_units_incremental',
+    'acv_weighted_distribution',
+    'price_per_unit',
+    'price_per_unit_promo',
+    'price_per_unit_non_promo',
+    'price_effective_price',
+    'cost_amount',
+    'dt.period',
+)
+
+
+# where each projectable column comes from; anything else is a product column
+GEOGRAPHY_COLUMNS = ('geography_id', 'channel_name', 'retailer_name', 'format_name', 'segment_name')
+TIME_COLUMNS = ('time_period_start', 'time_period_end', 'nrf_calendar_date', 'period')
+FACT_COLUMNS = ('time_id', 'sales_revenue', 'sales_units', 'sales_revenue_incremental',
+                'sales_units_incremental', 'acv_weighted_distribution', 'price_per_unit',
+                'price_per_unit_promo', 'price_per_unit_non_promo', 'price_effective_price',
+                'cost_amount')
+DATE_COLUMNS = ('nrf_calendar_date', 'time_period_start')
+
+
+def quote_ident(name: str) -> str:
+    """Quote `name` as a Postgres identifier, so case and reserved words are kept."""
+    if not isinstance(name, str):
+        raise ValueError(f"Column names must be strings, got {name!r}.")
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class SalesQuery:
+    """
+    A `fact_sales` extract joined to its product, geography and time dimensions.
+
+    Parameters
+    ----------
+    schema : str
+        Schema of the star tables.
+    markets, categories, sub_categories, vendors : str or list of str
+        Values to keep; `None` applies no filter on that column.
+    only_active : bool
+        Keep only products where `product_status_flag` is true.
+    since, until : datetime.date
+        Keep rows with ``since < nrf_calendar_date <= until``.
+    hier_geography : bool
+        Restrict geographies to those present in `hier_geography`.
+    select : sequence of str
+        Select list of the outer query, used when `columns` is not given.
+    columns : sequence of str
+        Output column names to project. Only these are read from
+        `dim_product` and shipped back, instead of ``dp.*`` and every measure.
+    start_date, end_date : datetime.date
+        Inclusive window on `date_column`.
+    date_column : str
+        ``'nrf_calendar_date'`` or ``'time_period_start'``.
+    channels, retailers : str or list of str
+        `channel_name`/`retailer_name` values to keep.
+
+    Examples
+    --------
+    >>> q = SalesQuery('test_star', markets=['AU', 'NZ'], categories='ORAL CARE')
+    >>> sql, params = q.render()
+    >>> params
+    [['AU', 'NZ'], ['ORAL CARE']]
+
+    Projection and filters are pushed into the generated SQL:
+
+    >>> q = SalesQuery('test_star', markets='AU', columns=['brand_name', 'sales_units'],
+    ...                start_date=datetime.date(2020, 1, 1), retailers=['ret0'])
+    """
+
+    def __init__(self, schema, markets=None, categories=None, sub_categories=None,
+                 only_active=False, vendors=None, since=None, until=None,
+                 hier_geography=False, select=MARKET_CATEGORY_COLUMNS, columns=None,
+                 start_date=None, end_date=None, date_column='nrf_calendar_date',
+                 channels=None, retailers=None):
+        if date_column not in DATE_COLUMNS:
+            raise ValueError(f"Unknown date_column {date_column!r}, expected one of {DATE_COLUMNS}.")
+
+        self.schema = schema
+        self.markets = _as_list(markets)
+        self.categories = _as_list(categories)
+        self.sub_categories = _as_list(sub_categories)
+        self.vendors = _as_list(vendors)
+        self.only_active = only_active
+        self.since = since
+        self.until = until
+        self.hier_geography = hier_geography
+        self.select = tuple(select)
+        self.columns = _as_list(columns)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.date_column = date_column
+        self.channels = _as_list(channels)
+        self.retailers = _as_list(retailers)
+
+    def _projection(self):
+        """Outer select list and `this_category` select list."""
+        if self.columns is None:
+            return self.select, ('dp.*',)
+
+        # names are quoted, not pasted, as they may come straight from callers
+        outer, product = [], ['dp.product_id', 'dp.market_name']
+        for name in self.columns:
+            column = quote_ident(name)
+            if name in GEOGRAPHY_COLUMNS:
+                outer.append(f"this_geo.{column}")
+            elif name in TIME_COLUMNS:
+                outer.append(f"dt.{column}")
+            elif name in FACT_COLUMNS:
+                outer.append(f"fs.{column}")
+            else:
+                if name not in ('product_id', 'market_name'):
+                    product.append(column)
+                outer.append(f"this_category.{column}")
+        return outer, product
+
+    def render(self, style: str = 'pyformat'):
+        """
+        Render the SQL text and its parameter list.
+
+        `style` is ``'pyformat'`` (``%s``, for psycopg2) or ``'numeric'``
+        (``$1``, for ``PREPARE`` and asyncpg).
+        """
+        if style not in ('pyformat', 'numeric'):
+            raise ValueError(f"Unknown style {style!r}, expected 'pyformat' or 'numeric'.")
+        params = []
+
+        def bind(value, cast):
+            params.append(value)
+            return f"%s::{cast}" if style == 'pyformat' else f"${len(params)}::{cast}"
+
+        def where(*conditions):
+            kept = [c for c in conditions if c]
+            return f"where {' and '.join(kept)}" if kept else ''
+
+        s = self.schema
+        geo_where = where(
+                'retailer_status_flag',
+                self.markets is not None and f"dg.market_name = any({bind(self.markets, 'text[]')})",
+                self.channels is not None and f"channel_name = any({bind(self.channels, 'text[]')})",
+                self.retailers is not None and f"retailer_name = any({bind(self.retailers, 'text[]')})",
+        )
+        category_where = where(
+                self.categories is not None and f"category_name = any({bind(self.categories, 'text[]')})",
+                self.sub_categories is not None and f"sub_category_name = any({bind(self.sub_categories, 'text[]')})",
+                self.only_active and 'product_status_flag',
+                self.vendors is not None and f"vendor_name = any({bind(self.vendors, 'text[]')})",
+        )
+        outer_where = where(
+                'this_geo.market_name = this_category.market_name',
+                self.since is not None and f"dt.nrf_calendar_date > {bind(self.since, 'date')}",
+                self.until is not None and f"dt.nrf_calendar_date <= {bind(self.until, 'date')}",
+                self.start_date is not None and f"dt.{self.date_column} >= {bind(self.start_date, 'date')}",
+                self.end_date is not None and f"dt.{self.date_column} <= {bind(self.end_date, 'date')}",
+        )
+        hier_join = (f"join {s}.hier_geography hg on dg.geography_id = hg.geography_id"
+                     if self.hier_geography else '')
+        outer, product = self._projection()
+        select = ',\n                   '.join(outer)
+
+        sql = f"""
+            with this_geo as (
+                select  dg.geography_id,
+                        market_name,
+                        channel_name,
+                        retailer_name,
+                        format_name,
+                        segment_name
+                from {s}.dim_geography dg
+                {hier_join}
+                {geo_where}
+            ),this_category as (
+                select {', '.join(product)}
+                from {s}.dim_product dp
+                join {s}.hier_product hp on dp.product_id = hp.product_id
+                {category_where}
+            )
+            select {select}
+            from {s}.fact_sales fs
+            inner join this_category on this_category.product_id = fs.product_id
+            inner join this_geo on this_geo.geography_id = fs.geography_id
+            inner join {s}.dim_time dt on fs.time_id = dt.time_id
+            {outer_where}
+            """
+        return sql, params
+
+    @property
+    def sql(self) -> str:
+        return self.render()[0]
+
+    @property
+    def params(self) -> list:
+        return self.render()[1]
+
+    def literal(self, cursor) -> str:
+        """The SQL with its parameters inlined, e.g. for ``COPY (...) TO STDOUT``."""
+        sql, params = self.render()
+        encoding = psycopg2.extensions.encodings[cursor.connection.encoding]
+        return cursor.mogrify(sql, params).decode(encoding)
+
+
+# names of the statements already prepared on each connection
+_prepared = weakref.WeakKeyDictionary()
+
+
+def execute_prepared(cursor, query: SalesQuery):
+    """
+    Execute `query` on `cursor` through a per-connection prepared statement.
+
+    The statement is prepared on first use on a connection and reused by
+    every later call with the same filters, whatever their values, so
+    Postgres skips parsing and planning from scratch.
+    """
+    sql, params = query.render('numeric')
+    name = 'sales_' + hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]
+    names = _prepared.setdefault(cursor.connection, set())
+    if name not in names:
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        names.add(name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
@@ -0,0 +1,274 @@
+"""
+Per-call timing, size and plan records for :class:`data_helper.DataHelper`.
+
+Every query is recorded as a :class:`QueryTrace`, with its time split into
+checking out a connection, executing, fetching rows and decoding them into a
+DataFrame. Traces are collected by a :class:`QueryMetrics` registry, which
+summarizes them per query shape and can export them as JSON lines.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import datetime
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+PHASES = ('connect', 'execute', 'fetch', 'decode')
+# statements EXPLAIN ANALYZE may run again without side effects
+READ_ONLY = re.compile(r'^\s*(select|with|values|table)\b', re.IGNORECASE)
+SAMPLE_ROWS = 100
+
+
+def sql_id(sql: str) -> str:
+    """Short hash of `sql` with whitespace normalized, grouping calls of the same query."""
+    return hashlib.sha1(' '.join(sql.split()).encode('utf-8')).hexdigest()[:12]
+
+
+def text_bytes(rows) -> int:
+    """Approximate size of `rows` as text on the wire, from a sample of them."""
+    if not rows:
+        return 0
+    sample = rows[::max(1, len(rows) // SAMPLE_ROWS)][:SAMPLE_ROWS]
+    size = sum(len(str(v)) + 1 for row in sample for v in row if v is not None)
+    return int(size * len(rows) / len(sample))
+
+
+class QueryTrace:
+    """
+    Timings and sizes of one call.
+
+    Attributes
+    ----------
+    name : str
+        The :class:`DataHelper` method called, e.g. ``'load_market_category'``.
+    sql : str
+        The statement, with placeholders for bound parameters.
+    seconds : dict
+        Seconds spent in each of :data:`PHASES`. Time in none of them, e.g.
+        committing, only counts towards `total_seconds`. Writes count
+        serializing rows as `decode` and streaming them as `execute`.
+    rows, bytes : int
+        Rows returned (affected, for statements, or written), and their
+        approximate size as sent over the wire.
+    memory_bytes : int
+        Largest ``DataFrame.memory_usage()`` of the result or, when streamed,
+        of any chunk. Object columns only count their pointers unless
+        `deep_memory`, as sizing their values means visiting every one.
+    plan : list
+        ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` output, for calls slower
+        than the registry's `explain_threshold`.
+    """
+
+    def __init__(self, name: str, sql: str = None, decoder: str = None, deep_memory: bool = False):
+        self.name = name
+        self.sql = sql
+        self.decoder = decoder
+        self.started = datetime.datetime.now()
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.total_seconds = None
+        self.rows = 0
+        self.bytes = 0
+        self.memory_bytes = 0
+        self.plan = None
+        self.error = None
+        self.deep_memory = deep_memory
+        self._start = time.perf_counter()
+        self._nested = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time spent in the block to phase `name`, less that of phases nested in it."""
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds[name] += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def add(self, phase: str, seconds: float):
+        self.seconds[phase] += seconds
+
+    def add_frame(self, df: pd.DataFrame):
+        self.rows += len(df)
+        self.memory_bytes = max(self.memory_bytes, int(df.memory_usage(deep=self.deep_memory).sum()))
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._start
+
+    def as_dict(self) -> dict:
+        return {'name': self.name,
+                'sql_id': sql_id(self.sql) if self.sql else None,
+                'sql': self.sql,
+                'decoder': self.decoder,
+                'started': self.started.isoformat(),
+                'total_seconds': self.total_seconds,
+                **{f"{p}_seconds": s for p, s in self.seconds.items()},
+                'rows': self.rows,
+                'bytes': self.bytes,
+                'memory_bytes': self.memory_bytes,
+                'plan': self.plan,
+                'error': self.error}
+
+
+class TimedCursor:
+    """DB-API cursor proxy adding its execute and fetch time and fetched bytes to a trace."""
+
+    def __init__(self, cursor, trace: QueryTrace):
+        self._cursor = cursor
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, *args, **kwargs):
+        with self._trace.phase('execute'):
+            return self._cursor.execute(*args, **kwargs)
+
+    def _fetch(self, method, *args):
+        with self._trace.phase('fetch'):
+            rows = getattr(self._cursor, method)(*args)
+        self._trace.bytes += text_bytes(rows if method != 'fetchone' else [rows] if rows else [])
+        return rows
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, *args):
+        return self._fetch('fetchmany', *args)
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+
+class TimedConnection:
+    """Connection proxy whose cursors are :class:`TimedCursor`, e.g. for `pd.read_sql`."""
+
+    def __init__(self, conn, trace: QueryTrace):
+        self._conn = conn
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._trace)
+
+
+class QueryMetrics:
+    """
+    In-process registry of :class:`QueryTrace` records.
+
+    Parameters
+    ----------
+    explain_threshold : float
+        Calls of read-only statements taking at least this many seconds get
+        their plan captured with ``EXPLAIN (ANALYZE, BUFFERS)``. This runs
+        the query a second time, so keep it well above typical durations.
+        `None` never explains.
+    trace_path : str
+        JSONL file every trace is appended to as it is recorded.
+    max_traces : int
+        Most recent traces kept in memory for :meth:`summary`.
+    deep_memory : bool
+        Size results with ``memory_usage(deep=True)``, which includes the
+        values of object and string columns but scans every one of them.
+
+    Examples
+    --------
+    >>> dh = DataHelper(json_path=json_path, metrics=QueryMetrics(explain_threshold=30,
+    ...                                                           trace_path='queries.jsonl'))
+    >>> au_cleansers = dh.load_market_category('AU', 'ORAL CARE', 'DENTURE CLEANSERS')
+    >>> dh.metrics.summary().head()
+    """
+
+    def __init__(self, explain_threshold: float = None, trace_path: str = None,
+                 max_traces: int = 10_000, deep_memory: bool = False):
+        self.explain_threshold = explain_threshold
+        self.trace_path = trace_path
+        self.deep_memory = deep_memory
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def should_explain(self, trace: QueryTrace) -> bool:
+        return (self.explain_threshold is not None and trace.error is None and trace.sql is not None
+                and trace.total_seconds >= self.explain_threshold and bool(READ_ONLY.match(trace.sql)))
+
+    def record(self, trace: QueryTrace):
+        record = trace.as_dict()
+        with self._lock:
+            self._traces.append(record)
+            if self.trace_path is not None:
+                with open(self.trace_path, 'a') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+
+    @property
+    def traces(self) -> list:
+        """Recorded traces as dicts, oldest first."""
+        with self._lock:
+            return list(self._traces)
+
+    def frame(self) -> pd.DataFrame:
+        """The recorded traces, one row each."""
+        return pd.DataFrame(self.traces, columns=list(QueryTrace('').as_dict()))
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Calls aggregated per method and query, slowest in total first.
+
+        Columns are the number of `calls` and `errors`, total, mean, median,
+        95th percentile and max seconds, total seconds per phase, rows and
+        bytes, and the largest result `memory_bytes`.
+        """
+        df = self.frame()
+        if df.empty:
+            return pd.DataFrame()
+        df['failed'] = df['error'].notna()
+        # calls without a statement are grouped by name alone
+        df['sql_id'] = df['sql_id'].fillna('')
+        grouped = df.groupby(['name', 'sql_id'], sort=False)
+        out = grouped.agg(calls=('total_seconds', 'size'),
+                          errors=('failed', 'sum'),
+                          total_seconds=('total_seconds', 'sum'),
+                          mean_seconds=('total_seconds', 'mean'),
+                          p50_seconds=('total_seconds', 'median'),
+                          p95_seconds=('total_seconds', lambda s: np.percentile(s, 95)),
+                          max_seconds=('total_seconds', 'max'),
+                          **{f"{p}_seconds": (f"{p}_seconds", 'sum') for p in PHASES},
+                          rows=('rows', 'sum'),
+                          bytes=('bytes', 'sum'),
+                          memory_bytes=('memory_bytes', 'max'),
+                          sql=('sql', 'first'))
+        return out.sort_values('total_seconds', ascending=False).reset_index()
+
+    def export_jsonl(self, path: str) -> int:
+        """Write the recorded traces to `path`, one JSON object per line; returns how many."""
+        traces = self.traces
+        with open(path, 'w') as f:
+            for record in traces:
+                f.write(json.dumps(record, default=str) + '\n')
+        return len(traces)
+
+    def reset(self):
+        with self._lock:
+            self._traces.clear()
@@ -0,0 +1,140 @@
+"""
+Size-bounded on-disk cache of query results stored as Feather files.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+
+def _digest(obj, length=32) -> str:
+    text = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:length]
+
+
+class ResultCache:
+    """
+    Least-recently-used cache of DataFrames under a local directory.
+
+    Each entry is an uncompressed Feather file named after the query key and
+    a freshness token, so a hit can be served with a memory-mapped read. An
+    entry is only returned while its token matches the current one, and
+    writing a new version of a key removes the older versions.
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the cache files. Created if missing.
+    max_bytes : int
+        Total size above which the least recently used entries are evicted.
+
+    Examples
+    --------
+    >>> cache = ResultCache('/tmp/gsk_cache', max_bytes=2 * 1024 ** 3)
+    >>> key = cache.key("select * from test_star.dim_time")
+    >>> cache.get(key, token=(202052, 1893)) is None
+    True
+    >>> cache.put(key, (202052, 1893), df)
+    >>> cache.get(key, token=(202052, 1893)).equals(df)
+    True
+    """
+
+    suffix = '.feather'
+
+    def __init__(self, root: str, max_bytes: int = 5 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(sql: str, params: dict = None) -> str:
+        """Cache key for a rendered SQL statement and its parameters."""
+        return _digest({'sql': ' '.join(sql.split()), 'params': params})
+
+    def path(self, key: str, token) -> str:
+        return os.path.join(self.root, f"{key}-{_digest(token, 16)}{self.suffix}")
+
+    def get(self, key: str, token):
+        """Return the cached frame for `key` at `token`, or `None` on a miss."""
+        from pyarrow import feather
+
+        path = self.path(key, token)
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except FileNotFoundError:
+            return None
+        # touch the entry so eviction sees it as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process since the read, which is still valid
+            pass
+        return table.to_pandas()
+
+    def put(self, key: str, token, df: pd.DataFrame):
+        """Store `df` for `key` at `token`, replacing older versions of `key`."""
+        from pyarrow import feather
+
+        path = self.path(key, token)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # feather v2 keeps the index in the pandas metadata, and to_pandas restores it
+            feather.write_feather(df, tmp, compression='uncompressed')
+            os.replace(tmp, path)
+        except BaseException:
+            self._remove(tmp)
+            raise
+
+        with self._lock:
+            for stale in self._entries(key):
+                if stale != path:
+                    self._remove(stale)
+            self._evict(keep=path)
+
+    def invalidate(self, key: str = None):
+        """Remove every version of `key`, or the whole cache if `key` is `None`."""
+        with self._lock:
+            for path in self._entries(key):
+                self._remove(path)
+
+    @property
+    def size(self) -> int:
+        """Total bytes currently held by the cache."""
+        return sum(os.path.getsize(p) for p in self._entries())
+
+    def _entries(self, key=None):
+        pattern = f"{key}-*{self.suffix}" if key else f"*{self.suffix}"
+        return glob.glob(os.path.join(self.root, pattern))
+
+    def _evict(self, keep=None):
+        entries = []
+        for path in self._entries():
+            if path == keep:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
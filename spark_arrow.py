@@ -0,0 +1,152 @@
+"""
+pandas / NumPy / list <-> Spark conversion through Arrow record batches.
+
+`spark.createDataFrame` on lists of rows, or on pandas without Arrow
+enabled, pickles every row through Python. Here the data is first turned
+into a typed Arrow table, so columns arrive in Spark with their final types
+and move as columnar batches.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+ARROW_CONF = 'spark.sql.execution.arrow.pyspark.enabled'
+FALLBACK_CONF = 'spark.sql.execution.arrow.pyspark.fallback.enabled'
+
+
+@contextmanager
+def arrow_enabled(spark):
+    """Turn Arrow transfers on, without silent fallback to rows, for the duration of the block."""
+    previous = {key: spark.conf.get(key, None) for key in (ARROW_CONF, FALLBACK_CONF)}
+    spark.conf.set(ARROW_CONF, 'true')
+    spark.conf.set(FALLBACK_CONF, 'false')
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                spark.conf.unset(key)
+            else:
+                spark.conf.set(key, value)
+
+
+def to_arrow(data, columns=None, schema=None):
+    """
+    Typed `pyarrow.Table` from a DataFrame, dict of columns, NumPy array or list.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame, dict, numpy.ndarray or list
+        A list of scalars is one column; a list of lists/tuples is rows.
+    columns : list of str
+        Column names, for arrays and lists, or to rename a DataFrame's columns.
+    schema : pyarrow.Schema or dict
+        Full schema, or ``{column: arrow type name}`` for the columns whose
+        type shouldn't be inferred, e.g. ``{'Dim_WmItemNbr': 'int32'}``.
+    """
+    import pyarrow as pa
+
+    if isinstance(data, np.ndarray):
+        if data.dtype.names:
+            data = pd.DataFrame(data)
+        else:
+            data = np.atleast_2d(data.T).T
+            names = columns or [f"_{i}" for i in range(data.shape[1])]
+            data = {name: data[:, i] for i, name in enumerate(names)}
+    elif isinstance(data, (list, tuple)):
+        if data and isinstance(data[0], (list, tuple)):
+            names = columns or [f"_{i}" for i in range(len(data[0]))]
+            data = {name: list(values) for name, values in zip(names, zip(*data))}
+        else:
+            data = {(columns or ['value'])[0]: list(data)}
+    elif isinstance(data, pd.DataFrame) and columns is not None:
+        data = data.set_axis(list(columns), axis=1)
+
+    if isinstance(schema, pa.Schema):
+        if isinstance(data, pd.DataFrame):
+            return pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+        return pa.Table.from_pydict(data, schema=schema)
+
+    declared = {c: pa.type_for_alias(t) if isinstance(t, str) else t for c, t in (schema or {}).items()}
+    if isinstance(data, pd.DataFrame):
+        data = {c: data[c] for c in data.columns}
+    arrays, names = [], []
+    for name, values in data.items():
+        if isinstance(values, pd.Series):
+            values = pa.Array.from_pandas(values)
+        else:
+            values = pa.array(values, from_pandas=True)
+        # a cast also parses strings, e.g. item numbers read from Excel as text
+        if name in declared and values.type != declared[name]:
+            values = values.cast(declared[name])
+        arrays.append(values)
+        names.append(str(name))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def _row_chunks(data, chunk_rows):
+    """Slices of at most `chunk_rows` rows of any input :func:`to_arrow` takes, at least one."""
+    n = len(next(iter(data.values()), ())) if isinstance(data, dict) else len(data)
+    for lo in range(0, max(n, 1), chunk_rows):
+        rows = slice(lo, lo + chunk_rows)
+        if isinstance(data, pd.DataFrame):
+            yield data.iloc[rows]
+        elif isinstance(data, dict):
+            yield {c: values[rows] for c, values in data.items()}
+        else:
+            yield data[rows]
+
+
+def to_spark(spark, data, columns=None, schema=None, chunk_rows: int = 1_000_000):
+    """
+    Spark DataFrame from `data` (see :func:`to_arrow`), sent as Arrow batches.
+
+    Inputs longer than `chunk_rows` are sliced, converted to Arrow, sent
+    and unioned chunk by chunk, so the driver never holds a converted copy
+    of the whole input. Types are inferred from the first chunk, and later
+    chunks are cast to them; declare in `schema` any column that could be
+    all null there.
+
+    Examples
+    --------
+    >>> walmart_sdf = to_spark(spark, walmart.loc[1:, :4], columns=col[:5],
+    ...                        schema={'Dim_WmItemNbr': 'int32'})
+    >>> class_ids = to_spark(spark, exception_list0_replace, columns=['class_id'])
+    """
+    import pyspark
+    from pyspark.sql.pandas.types import from_arrow_schema
+
+    # Spark 4 takes Arrow tables as they are, older versions go through pandas
+    native = int(pyspark.__version__.split('.')[0]) >= 4
+    arrow_schema = spark_schema = None
+    parts = []
+    with arrow_enabled(spark):
+        for rows in _row_chunks(data, chunk_rows):
+            chunk = to_arrow(rows, columns, schema)
+            if arrow_schema is None:
+                arrow_schema = chunk.schema
+                spark_schema = from_arrow_schema(arrow_schema)
+            elif chunk.schema != arrow_schema:
+                chunk = chunk.cast(arrow_schema)
+            if not native:
+                # object columns keep nullable integers from turning into floats
+                chunk = chunk.to_pandas(date_as_object=True, integer_object_nulls=True)
+            parts.append(spark.createDataFrame(chunk, schema=spark_schema))
+    sdf = parts[0]
+    for part in parts[1:]:
+        sdf = sdf.unionByName(part)
+    return sdf
+
+
+def to_pandas(sdf) -> pd.DataFrame:
+    """pandas DataFrame of a Spark DataFrame, collected as Arrow batches."""
+    if hasattr(sdf, 'toArrow'):
+        # Spark 4 can hand back the Arrow table itself
+        return sdf.toArrow().to_pandas()
+    with arrow_enabled(sdf.sparkSession):
+        return sdf.toPandas()
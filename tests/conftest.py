@@ -0,0 +1,41 @@
+"""
+Shared fixtures.
+
+Tests needing Postgres run against the server described by the JSON file in
+``$GSK_TEST_CONNECTION`` (same format as ``$GSK_HOME/connection.json``), each
+in a throwaway schema, and are skipped when it isn't set.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def connection_params():
+    from data_helper import read_connection_params
+
+    path = os.environ.get('GSK_TEST_CONNECTION')
+    if not path:
+        pytest.skip("GSK_TEST_CONNECTION is not set")
+    return read_connection_params(path)[1]
+
+
+@pytest.fixture
+def schema(connection_params):
+    from benchmarks.synthetic import throwaway_schema
+
+    with throwaway_schema(connection_params, prefix='test') as schema:
+        yield schema
+
+
+@pytest.fixture
+def dh(connection_params, schema, tmp_path):
+    from data_helper import DataHelper
+
+    dh = DataHelper(connection_params=dict(connection_params, schema=schema), cache_dir=str(tmp_path / 'cache'))
+    dh.sql_execute(f"create schema {schema}")
+    yield dh
+    dh.close()
@@ -0,0 +1,17 @@
+import asyncio
+
+import pandas as pd
+
+from async_data_helper import AsyncDataHelper
+
+
+def test_write_pg_quotes_like_the_sync_path(dh, connection_params, schema):
+    dh.sql_execute(f'create table {schema}."Margin" ("Product" int primary key, "Margin" numeric)')
+    df = pd.DataFrame({'Product': [1, 2], 'Margin': [0.5, None]})
+    assert dh.write_pg('Margin', df, schema=schema)['inserted'] == 2
+
+    async def write():
+        async with AsyncDataHelper(connection_params=dict(connection_params, schema=schema)) as adh:
+            return await adh.write_pg('Margin', df.assign(Product=[3, 4]), schema=schema)
+    assert asyncio.run(write())['inserted'] == 2
+    assert dh.query(f'select "Product" from {schema}."Margin" order by 1')['Product'].tolist() == [1, 2, 3, 4]
@@ -0,0 +1,12 @@
+import pandas as pd
+
+from column_names import column_mapping, sanitize_columns
+
+
+def test_column_mapping_suffixes_collisions():
+    assert column_mapping(('Product Name', 'Sales $', 'Sales', '%')) == ('ProductName', 'Sales_2', 'Sales', 'col_4')
+
+
+def test_sanitize_columns_accepts_non_string_labels():
+    df = sanitize_columns(pd.DataFrame([[1, 2, 3]], columns=[0, 1.5, 'a b']))
+    assert list(df.columns) == ['0', '15', 'ab']
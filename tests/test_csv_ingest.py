@@ -0,0 +1,21 @@
+from csv_ingest import CsvIngest
+
+
+def test_inferred_integers_accept_later_decimals(tmp_path):
+    first, later = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    first.write_text('store,units\ns1,1\ns2,2\n')
+    later.write_text('store,units\ns3,1.5\n')
+    for _ in range(2):
+        # the second read uses the cached schema
+        ingest = CsvIngest(schema_cache_dir=str(tmp_path / 'schemas'))
+        df = ingest.read([str(first), str(later)], name='drop')
+        assert df['units'].tolist() == [1.0, 2.0, 1.5]
+
+
+def test_discover_skips_subfolders_unless_recursive(tmp_path):
+    (tmp_path / 'archive').mkdir()
+    for path in (tmp_path / 'a.csv', tmp_path / 'archive' / 'b.csv', tmp_path / 'c.txt'):
+        path.write_text('x\n1\n')
+    assert CsvIngest.discover(str(tmp_path)) == [str(tmp_path / 'a.csv')]
+    assert CsvIngest.discover(str(tmp_path), recursive=True) == [str(tmp_path / 'a.csv'),
+                                                                str(tmp_path / 'archive' / 'b.csv')]
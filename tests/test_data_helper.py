@@ -0,0 +1,103 @@
+import contextlib
+import datetime
+
+import pandas as pd
+import pytest
+
+from data_helper import COPY_NULL, copy_null, to_copy_buffer
+
+
+def test_copy_null_avoids_string_values():
+    assert copy_null(pd.DataFrame({'s': ['a', None]})) == COPY_NULL
+    df = pd.DataFrame({'s': [COPY_NULL, None, COPY_NULL + '0'], 'x': [1.5, None, 2.5]})
+    null = copy_null(df)
+    assert null not in (COPY_NULL, COPY_NULL + '0')
+    assert to_copy_buffer(df, null).getvalue().splitlines() == [f'{COPY_NULL},1.5', f'{null},{null}',
+                                                                f'{COPY_NULL}0,2.5']
+
+
+def test_write_pg_round_trips_null_marker(dh, schema):
+    dh.sql_execute(f"create table {schema}.labels (id int primary key, label text)")
+    df = pd.DataFrame({'id': [1, 2, 3, 4], 'label': [COPY_NULL, None, '', 'x']})
+    assert dh.write_pg('labels', df, schema=schema)['inserted'] == 4
+    out = dh.query(f"select id, label from {schema}.labels order by id")
+    assert out['label'].isna().tolist() == [False, True, False, False]
+    assert out['label'].fillna('').tolist() == [COPY_NULL, '', '', 'x']
+
+
+def _count(dh, schema):
+    return dh.query(f"select count(*) as n from {schema}.labels")['n'][0]
+
+
+def _labels(dh, schema):
+    dh.sql_execute(f"create table {schema}.labels (id int primary key, label text)")
+    dh.write_pg('labels', pd.DataFrame({'id': [1, 2], 'label': ['a', 'b']}), schema=schema)
+
+
+def test_transaction_in_session_rolls_back(dh, schema):
+    _labels(dh, schema)
+    with dh.session():
+        with pytest.raises(RuntimeError):
+            with dh.transaction():
+                dh.truncate_table('labels', schema=schema)
+                raise RuntimeError
+        assert _count(dh, schema) == 2
+        dh.truncate_table('labels', schema=schema)
+    assert _count(dh, schema) == 0
+
+
+def test_nested_transaction_is_a_savepoint(dh, schema):
+    _labels(dh, schema)
+    with pytest.raises(RuntimeError):
+        with dh.transaction():
+            dh.sql_execute(f"delete from {schema}.labels where id = 1")
+            with dh.transaction():
+                dh.sql_execute(f"delete from {schema}.labels where id = 2")
+            raise RuntimeError
+    assert _count(dh, schema) == 2
+
+    with dh.transaction():
+        dh.sql_execute(f"delete from {schema}.labels where id = 1")
+        with pytest.raises(RuntimeError):
+            with dh.transaction():
+                dh.sql_execute(f"delete from {schema}.labels where id = 2")
+                raise RuntimeError
+    assert dh.query(f"select id from {schema}.labels")['id'].tolist() == [2]
+
+
+def test_copy_decoder_matches_read_sql(dh):
+    # `period` is a fact_sales column name, but this isn't a fact_sales query
+    sql = "select 7 as period, date '2020-01-04' as week, null::date as missing, 'x'::text as label"
+    copied = dh.query(sql, decoder='copy')
+    assert copied['period'].tolist() == [7]
+    assert copied['week'].tolist() == dh.query(sql)['week'].tolist() == [datetime.date(2020, 1, 4)]
+    assert copied['missing'].tolist() == [None]
+
+
+def test_write_pg_is_traced(dh, schema):
+    _labels(dh, schema)
+    trace = dh.metrics.traces[-1]
+    assert trace['name'] == 'write_pg' and trace['sql'].strip().startswith('INSERT INTO')
+    assert trace['rows'] == 2 and trace['bytes'] > 0 and trace['execute_seconds'] > 0
+
+
+def test_write_pg_accepts_integral_floats_in_integer_columns(dh, schema):
+    dh.sql_execute(f"create table {schema}.margin (product_id int primary key, geography_id int, margin numeric)")
+    df = pd.DataFrame({'product_id': [1.0, 2.0], 'geography_id': [7.0, None], 'margin': [0.5, 2.0]})
+    assert dh.write_pg('margin', df, schema=schema)['inserted'] == 2
+    out = dh.query(f"select * from {schema}.margin order by product_id")
+    assert out['geography_id'].tolist()[0] == 7 and pd.isna(out['geography_id'].tolist()[1])
+    assert out['margin'].astype(float).tolist() == [0.5, 2.0]
+
+
+def test_calls_between_stream_chunks_leave_the_stream_open(dh, schema):
+    dh.sql_execute(f"create table {schema}.labels (id int primary key, label text)")
+    dh.write_pg('labels', pd.DataFrame({'id': range(10), 'label': 'a'}), schema=schema)
+    dh.sql_execute(f"create table {schema}.copied (like {schema}.labels)")
+    for block in (dh.session, contextlib.nullcontext):
+        dh.truncate_table('copied', schema=schema)
+        with block():
+            for chunk in dh.load_pg(f"{schema}.labels", chunksize=3):
+                dh.write_pg('copied', chunk, schema=schema)
+                dh.query("select 1")
+        assert dh.query(f"select count(*) as n from {schema}.copied")['n'][0] == 10
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from excel_cache import ExcelCache
+
+
+def test_read_excel_caches_each_sheet(tmp_path):
+    path = str(tmp_path / 'margin.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({'upc': [1, 2]}).to_excel(writer, sheet_name='MarginCost', index=False)
+        pd.DataFrame({'store': ['a']}).to_excel(writer, sheet_name='Stores', index=False)
+    excel = ExcelCache(str(tmp_path / 'cache'))
+
+    for _ in range(2):
+        # parsed, then served from the cache
+        sheets = excel.read_excel(path, sheet_name=None)
+        assert list(sheets) == ['MarginCost', 'Stores']
+        assert sheets['MarginCost']['upc'].tolist() == [1, 2]
+        assert list(excel.read_excel(path, sheet_name=['Stores', 0])) == ['Stores', 0]
+        assert excel.read_excel(path, sheet_name='Stores')['store'].tolist() == ['a']
+    assert excel.read_many([path], sheet_name=None)[path]['Stores']['store'].tolist() == ['a']
+
+
+def test_cached_read_keeps_index_col(tmp_path):
+    path = str(tmp_path / 'margin.xlsx')
+    pd.DataFrame({'upc': [7, 8], 'cost': [1.5, 2.5]}).to_excel(path, sheet_name='MarginCost', index=False)
+    excel = ExcelCache(str(tmp_path / 'cache'))
+
+    cold = excel.read_excel(path, sheet_name='MarginCost', index_col=0)
+    warm = excel.read_excel(path, sheet_name='MarginCost', index_col=0)
+    pd.testing.assert_frame_equal(warm, cold)
+    assert warm.index.name == 'upc' and warm.index.tolist() == [7, 8]
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from excel_report import INF_REP, write_workbook
+
+
+def test_writes_infinities_and_extension_nulls(tmp_path):
+    path = str(tmp_path / 'report.xlsx')
+    df = pd.DataFrame({'ratio': [1.5, np.inf, -np.inf, np.nan],
+                       'flag': pd.array([True, pd.NA, False, None], dtype='boolean'),
+                       'units': pd.array([1, None, 3, 4], dtype='Int64'),
+                       'mixed': pd.Series(['a', np.inf, None, 2], dtype=object)})
+    write_workbook(path, {'sheet': df})
+    out = pd.read_excel(path, dtype=object)
+    assert out['ratio'].tolist()[:3] == [1.5, INF_REP, f"-{INF_REP}"]
+    assert out['flag'].tolist()[0] is True and out['flag'].tolist()[2] is False
+    assert out[['ratio', 'flag', 'units', 'mixed']].isna().to_numpy().tolist() == [
+        [False, False, False, False], [False, True, True, False],
+        [False, False, False, True], [True, True, False, False]]
+    assert out['mixed'].tolist()[1] == INF_REP
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from file_operation import FileOpt, _Inotify
+
+
+@pytest.mark.skipif(not _Inotify.available(), reason="needs inotify")
+def test_watch_rescans_after_queue_overflow(tmp_path, monkeypatch):
+    (tmp_path / 'sub').mkdir()
+    reads = []
+
+    def overflowing(self, timeout):
+        # a file lands while the kernel queue overflows, so its event is lost
+        if not reads:
+            (tmp_path / 'sub' / 'sales_1.csv').write_text('a\n')
+            reads.append(1)
+            return [], True
+        return [], False
+    monkeypatch.setattr(_Inotify, 'read', overflowing)
+    watched = FileOpt(str(tmp_path)).watch(suffix='.csv', timeout=0.2)
+    assert list(watched) == [os.path.join(str(tmp_path), 'sub', 'sales_1.csv')]
+
+
+@pytest.mark.skipif(not _Inotify.available(), reason="needs inotify")
+def test_inotify_adds_each_path_once(tmp_path):
+    with _Inotify() as notify:
+        for _ in range(2):
+            notify.add(str(tmp_path))
+        assert notify.descriptors == {str(tmp_path): next(iter(notify.watches))}
+        assert len(notify.watches) == 1
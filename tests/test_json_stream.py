@@ -0,0 +1,19 @@
+import io
+import json
+
+from json_stream import read_json, read_ndjson
+
+
+def test_read_ndjson_unifies_types_across_ranges(tmp_path):
+    path = tmp_path / 'mixed.ndjson'
+    lines = [{'v': i, 'x': i} for i in range(50)] + [{'v': f"s{i}", 'x': i + 0.5} for i in range(50)]
+    path.write_text(''.join(json.dumps(r) + '\n' for r in lines))
+    df = read_ndjson(str(path), block_size=256, processes=1)
+    assert df['v'].tolist() == [str(i) for i in range(50)] + [f"s{i}" for i in range(50)]
+    assert df['x'].tolist() == [float(i) for i in range(50)] + [i + 0.5 for i in range(50)]
+
+
+def test_read_json_unifies_types_across_batches():
+    source = io.StringIO(json.dumps({'rows': [{'v': 1}, {'v': 2}, {'v': 'a'}]}))
+    df = read_json(source, 'rows[*]', batch_size=2, backend='python')
+    assert df['v'].tolist() == ['1', '2', 'a']
@@ -0,0 +1,48 @@
+import math
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+from plot_summary import StreamingSummary, parquet_ranges, plot_hist, plot_violin
+
+matplotlib.use('Agg')
+
+
+def _summary():
+    summary = StreamingSummary({'units': (0, 10), 'price': (0, 1)}, bins=64)
+    summary.update(pd.DataFrame({'units': np.linspace(0, 10, 101), 'price': np.nan}))
+    return summary
+
+
+def test_all_null_column_has_nan_moments():
+    summary = _summary()
+    assert summary.mean('units') == 5.0
+    assert math.isnan(summary.mean('price')) and math.isnan(summary.std('price'))
+
+
+def test_plots_draw():
+    import matplotlib.pyplot as plt
+
+    fig, (a, b, c) = plt.subplots(1, 3)
+    summary = _summary()
+    plot_hist(summary, 'units', bins=16, ax=a)
+    plot_hist(summary, 'units', bins=16, kde=True, ax=b)
+    plot_violin(summary, ['units'], ax=c)
+    assert [t.get_text() for t in c.get_xticklabels()] == ['units']
+    plt.close(fig)
+
+
+def test_parquet_ranges_skips_all_null_row_groups(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    import pyarrow as pa
+
+    path = str(tmp_path / 'sales.parquet')
+    table = pa.table({'units': [1.0, 4.0, 2.0, 3.0], 'price': [None, None, 0.5, 0.25]})
+    pq.write_table(table, path, row_group_size=2)
+    assert parquet_ranges(path, ['units', 'price']) == {'units': (1.0, 4.0), 'price': (0.25, 0.5)}
+
+    pq.write_table(table.set_column(1, 'price', pa.array([None] * 4, pa.float64())), path, row_group_size=2)
+    with pytest.raises(ValueError, match='price'):
+        parquet_ranges(path, ['units', 'price'])
@@ -0,0 +1,16 @@
+import pytest
+
+from query_builder import SalesQuery, quote_ident
+
+
+def test_projection_quotes_column_names():
+    sql, params = SalesQuery('s', markets='AU', columns=['Brand Name', 'sales_units', 'x"; drop table t; --']).render()
+    assert 'this_category."Brand Name"' in sql
+    assert 'fs."sales_units"' in sql
+    assert 'this_category."x""; drop table t; --"' in sql
+    assert params == [['AU']]
+
+
+def test_quote_ident_rejects_non_strings():
+    with pytest.raises(ValueError):
+        quote_ident(1)
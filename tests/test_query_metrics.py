@@ -0,0 +1,26 @@
+from query_metrics import QueryMetrics, QueryTrace
+
+
+def _trace(name, sql=None):
+    trace = QueryTrace(name, sql)
+    trace.finish()
+    return trace
+
+
+def test_summary_groups_calls_without_sql():
+    metrics = QueryMetrics()
+    for trace in (_trace('query', 'select 1'), _trace('query', 'select  1'), _trace('freshness'),
+                  _trace('freshness')):
+        metrics.record(trace)
+    summary = metrics.summary().set_index('name')
+    assert summary.loc['query', 'calls'] == 2 and summary.loc['freshness', 'calls'] == 2
+
+
+def test_frame_memory_is_shallow_unless_deep():
+    import pandas as pd
+
+    df = pd.DataFrame({'s': pd.Series(['x' * 1000] * 100, dtype=object)})
+    shallow, deep = QueryTrace('query'), QueryTrace('query', deep_memory=True)
+    shallow.add_frame(df)
+    deep.add_frame(df)
+    assert shallow.memory_bytes == df.memory_usage().sum() < deep.memory_bytes
@@ -0,0 +1,35 @@
+import os
+
+import pandas as pd
+import pytest
+
+from result_cache import ResultCache
+
+
+def test_get_survives_eviction_after_read(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    df = pd.DataFrame({'a': [1, 2]})
+    cache.put('k', 1, df)
+
+    def evicted(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, 'utime', evicted)
+    assert cache.get('k', 1).equals(df)
+
+
+def test_failed_put_leaves_no_tmp_file(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+
+    def failing(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, 'replace', failing)
+    with pytest.raises(OSError):
+        cache.put('k', 1, pd.DataFrame({'a': [1, 2]}))
+    assert os.listdir(tmp_path) == []
+
+
+def test_put_keeps_the_index(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    df = pd.DataFrame({'a': [1, 2, 3]}, index=pd.Index(['x', 'y', 'z'], name='upc'))
+    cache.put('k', 1, df)
+    pd.testing.assert_frame_equal(cache.get('k', 1), df)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from seasonal import OnlineDeseasonalizer, decompose_array
+
+
+def _weekly(weeks, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2018-01-06', periods=weeks, freq='7D')
+    season = 10 * np.sin(2 * np.pi * np.arange(weeks) / 4)
+    return pd.DataFrame({'series': np.repeat(['a', 'b'], weeks),
+                         'nrf_calendar_date': np.tile(dates, 2),
+                         'sales_units': np.tile(50 + season, 2) + rng.normal(size=2 * weeks)})
+
+
+def test_missing_series_keeps_its_cycle_position():
+    df = _weekly(24)
+    gap = df['nrf_calendar_date'] == df['nrf_calendar_date'].unique()[10]
+    with_nan = OnlineDeseasonalizer(period=4)
+    without_row = OnlineDeseasonalizer(period=4)
+    for _, week in df.assign(sales_units=df['sales_units'].mask(gap & (df['series'] == 'b'))).groupby(
+            'nrf_calendar_date'):
+        with_nan.update_frame(week, by='series')
+        without_row.update_frame(week.dropna(), by='series')
+    np.testing.assert_allclose(without_row.seasonal_indices(), with_nan.seasonal_indices())
+    assert (without_row.n == 24).all()
+
+
+@pytest.mark.parametrize('model', ['additive', 'multiplicative'])
+@pytest.mark.parametrize('period', [4, 7])
+def test_decompose_array_matches_statsmodels(model, period):
+    seasonal_decompose = pytest.importorskip('statsmodels.tsa.seasonal').seasonal_decompose
+    rng = np.random.default_rng(period)
+    nobs = 5 * period + 3
+    t = np.arange(nobs)
+    x = np.stack([50 + 0.3 * t + 10 * np.sin(2 * np.pi * t / period) + rng.normal(size=nobs)
+                  for _ in range(3)])
+    trend, seasonal, resid = decompose_array(x, period, model)
+    for i, row in enumerate(x):
+        expected = seasonal_decompose(row, model=model, period=period)
+        np.testing.assert_allclose(trend[i], expected.trend)
+        np.testing.assert_allclose(seasonal[i], expected.seasonal)
+        np.testing.assert_allclose(resid[i], expected.resid)
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from spark_arrow import _row_chunks, to_arrow
+
+
+@pytest.mark.parametrize('data', [
+    pd.DataFrame({'upc': [1, 2, None, 4, 5], 'store': list('abcde')}),
+    {'upc': [1, 2, None, 4, 5], 'store': list('abcde')},
+    np.arange(10).reshape(5, 2),
+    [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'), (5, 'e')],
+])
+def test_chunks_convert_like_the_whole_input(data):
+    whole = to_arrow(data)
+    chunks = [to_arrow(rows) for rows in _row_chunks(data, 2)]
+    assert [c.num_rows for c in chunks] == [2, 2, 1]
+    assert pa.concat_tables(c.cast(chunks[0].schema) for c in chunks).equals(whole)
+
+
+def test_empty_input_is_one_chunk():
+    assert [len(rows) for rows in _row_chunks(pd.DataFrame({'upc': []}), 2)] == [0]
@@ -0,0 +1,144 @@
+"""
+Top-k rows per group without a window over the whole frame.
+
+Copyright (c) 2020, Antuit Inc. - All rights reserved
+Proprietary and confidential
+Unauthorized copying of this file, via any medium, is strictly prohibited.
+"""
+import numpy as np
+import pandas as pd
+
+TIES = ('first', 'all')
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def top_k_per_group(df, by, order_by, k: int = 1, ascending: bool = False, ties: str = 'first'):
+    """
+    Keep the `k` rows with the largest `order_by` values in each `by` group.
+
+    Equivalent to filtering on ``row_number()`` (``ties='first'``) or
+    ``rank()`` (``ties='all'``) over ``Window.partitionBy(by).orderBy(order_by)``,
+    computed with one aggregation instead of a sort of every partition.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame or pyspark.sql.DataFrame
+    by : str or list of str
+        Group columns.
+    order_by : str or list of str
+        Columns compared lexicographically to rank the rows of a group.
+    k : int
+        Rows to keep per group.
+    ascending : bool
+        Keep the smallest instead of the largest values.
+    ties : str
+        ``'first'`` keeps exactly `k` rows per group. pandas breaks ties by
+        row order, Spark by the remaining columns in schema order, since a
+        Spark frame has no row order. ``'all'`` also keeps every row tied
+        with the k-th one.
+
+    Returns
+    -------
+    Frame of the same kind and columns as `df`. pandas rows keep their
+    original order and index. Rows with a null `order_by` value are never
+    kept by the pandas implementation.
+
+    Notes
+    -----
+    In Spark, ``k=1`` with ``ties='first'`` is a ``max(struct(...))``
+    aggregation, which is combined map-side and never holds a group in
+    memory. Other cases collect each group into an array, sort it and slice
+    it, so a single group must fit in an executor's memory.
+
+    In pandas, a single `order_by` column uses ``idxmax``/``idxmin`` or a
+    grouped ``max``/``min`` for ``k=1`` and a grouped ``rank`` otherwise. Several
+    `order_by` columns fall back to a stable sort.
+
+    Examples
+    --------
+    >>> counts = result1  # Product_Name, TCIN, count
+    >>> top_k_per_group(counts, 'Product_Name', 'count')            # most frequent TCIN
+    >>> top_k_per_group(counts, 'Product_Name', 'count', ties='all')  # same as rank() == 1
+    """
+    if ties not in TIES:
+        raise ValueError(f"Unknown ties {ties!r}, expected one of {TIES}.")
+    if k < 1:
+        raise ValueError("k must be at least 1.")
+    by, order_by = _as_list(by), _as_list(order_by)
+    if isinstance(df, pd.DataFrame):
+        return _top_k_pandas(df, by, order_by, k, ascending, ties)
+    return _top_k_spark(df, by, order_by, k, ascending, ties)
+
+
+def _top_k_pandas(df, by, order_by, k, ascending, ties):
+    # work on positions so a non-unique index of `df` doesn't matter
+    keys = df[by + order_by].set_axis(pd.RangeIndex(len(df)))
+    keys = keys[keys[order_by].notna().all(axis=1)]
+    keep = np.zeros(len(df), dtype=bool)
+
+    if len(order_by) == 1:
+        grouped = keys.groupby(by, sort=False, dropna=False)[order_by[0]]
+        if k == 1 and ties == 'first':
+            keep[grouped.idxmin() if ascending else grouped.idxmax()] = True
+        elif k == 1:
+            best = grouped.transform('min' if ascending else 'max')
+            keep[keys.index[keys[order_by[0]] == best]] = True
+        else:
+            rank = grouped.rank(method='first' if ties == 'first' else 'min', ascending=ascending)
+            keep[rank.index[rank <= k]] = True
+        return df[keep]
+
+    ranked = keys.sort_values(order_by, ascending=ascending, kind='stable')
+    grouped = ranked.groupby(by, sort=False, dropna=False)
+    position = grouped.cumcount()
+    if ties == 'first':
+        keep[ranked.index[position < k]] = True
+        return df[keep]
+
+    # key of the k-th row of each group, or of its last row if it has fewer
+    last = np.minimum(grouped[order_by[0]].transform('size') - 1, k - 1)
+    bound = keys[by].join(ranked[position == last].set_index(by), on=by)
+    # lexicographic comparison of each row's key against its group's k-th key
+    better = pd.Series(False, index=keys.index)
+    equal = pd.Series(True, index=keys.index)
+    for c in order_by:
+        strictly = keys[c] < bound[c] if ascending else keys[c] > bound[c]
+        better |= equal & strictly
+        equal &= keys[c] == bound[c]
+    keep[keys.index[better | equal]] = True
+    return df[keep]
+
+
+def _top_k_spark(sdf, by, order_by, k, ascending, ties):
+    from pyspark.sql import functions as F
+
+    fields = order_by + [c for c in sdf.columns if c not in by and c not in order_by]
+    row = F.struct(*[F.col(c) for c in fields])
+    top = F.col('_top')
+
+    if k == 1 and ties == 'first':
+        agg = F.min(row) if ascending else F.max(row)
+        out = sdf.groupBy(*by).agg(agg.alias('_top'))
+    else:
+        rows = F.array_sort(F.collect_list(row))
+        if not ascending:
+            rows = F.reverse(rows)
+        out = sdf.groupBy(*by).agg(rows.alias('_rows'))
+        rows = F.col('_rows')
+        if ties == 'first':
+            kept = F.slice(rows, 1, k)
+        else:
+            kth = F.element_at(rows, F.least(F.lit(k), F.size(rows)))
+            bound = F.struct(*[kth.getField(c) for c in order_by])
+
+            def tied_or_better(x):
+                key = F.struct(*[x.getField(c) for c in order_by])
+                return key <= bound if ascending else key >= bound
+            kept = F.filter(rows, tied_or_better)
+        out = out.select(*by, F.explode(kept).alias('_top'))
+
+    out = out.select(*by, *[top.getField(c).alias(c) for c in fields])
+    return out.select(*sdf.columns)